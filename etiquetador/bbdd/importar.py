@@ -0,0 +1,48 @@
+'''Importa a la base de datos los metadatos existentes en dataset/data
+
+Uso: python -m bbdd.importar [--dataset dataset] [--forzar]
+'''
+import argparse
+import asyncio
+import json
+
+from bbdd import database
+from services.almacen import DATASET_DIR, Almacen
+from services import champi as champi_service
+from utils.logger import logger
+
+
+async def importar_directorio(almacen: Almacen, forzar: bool = False) -> int:
+    """
+    Carga los JSON de dataset/data que aún no estén en la base de datos (todos si
+    forzar es True). Devuelve cuántas muestras se han importado.
+    """
+    await database.crear_tablas()
+    async with database.async_session() as db:
+        existentes = set() if forzar else set(await champi_service.get_ids(db))
+        muestras = {}
+        for filename, ruta in almacen.listar("data", ".json"):
+            image_id = filename.split('.')[0]
+            if image_id in existentes:
+                continue
+            try:
+                with open(ruta, 'r') as f:
+                    muestras[image_id] = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Skipping unreadable metadata file {filename}: {e}")
+        return await champi_service.importar(db, muestras)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Importa dataset/data/*.json a la base de datos")
+    parser.add_argument("--dataset", default=DATASET_DIR, help="raíz del dataset")
+    parser.add_argument("--forzar", action="store_true", help="reimporta también las muestras ya existentes")
+    args = parser.parse_args()
+    try:
+        await importar_directorio(Almacen(args.dataset), args.forzar)
+    finally:
+        await database.cerrar()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+'''Tiempo de arranque y memoria de la API en frío, en un proceso nuevo por medida
+
+Cada repetición importa main y ejecuta el arranque del lifespan en un
+intérprete limpio, en un directorio de trabajo temporal, y anota la memoria
+residual máxima y qué dependencias pesadas se han cargado.
+
+Uso: python -m benchmarks.arranque [--repeticiones 5] [--modos completo minimo]
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PESADAS = ("PIL", "numpy", "openpyxl")
+
+# Se ejecuta en el proceso hijo: imprime una línea JSON con las medidas
+MEDIR = f'''
+import asyncio, json, resource, sys, time
+sys.path.insert(0, {RAIZ!r})
+inicio = time.perf_counter()
+import main
+importado = time.perf_counter()
+
+async def arrancar():
+    async with main.lifespan(main.app):
+        pass
+
+asyncio.run(arrancar())
+fin = time.perf_counter()
+print(json.dumps({{
+    "import_s": importado - inicio,
+    "arranque_s": fin - inicio,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "cargadas": [modulo for modulo in {PESADAS!r} if modulo in sys.modules],
+}}))
+'''
+
+
+def medir(modo: str, repeticiones: int) -> Dict[str, Any]:
+    medidas: List[Dict[str, Any]] = []
+    for _ in range(repeticiones):
+        with tempfile.TemporaryDirectory(prefix="etiquetador_arranque_") as directorio:
+            env = dict(os.environ, API_MODO=modo, LOG_CONSOLE_LEVEL="WARNING")
+            salida = subprocess.run(
+                [sys.executable, "-c", MEDIR], cwd=directorio, env=env, capture_output=True, text=True, check=True
+            ).stdout
+            medidas.append(json.loads(salida.strip().splitlines()[-1]))
+    return {
+        "import_ms": round(float(np.median([m["import_s"] for m in medidas])) * 1000, 1),
+        "arranque_ms": round(float(np.median([m["arranque_s"] for m in medidas])) * 1000, 1),
+        "rss_mb": round(float(np.median([m["rss_mb"] for m in medidas])), 1),
+        "cargadas": medidas[-1]["cargadas"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el tiempo de arranque en frío y la memoria de la API")
+    parser.add_argument("--repeticiones", type=int, default=5, help="procesos por modo (se da la mediana)")
+    parser.add_argument("--modos", nargs="*", default=["completo", "minimo"], help="valores de API_MODO a medir")
+    args = parser.parse_args()
+    resultados = {modo: medir(modo, args.repeticiones) for modo in args.modos}
+    print(f"{'modo':<10} {'import (ms)':>12} {'arranque (ms)':>14} {'RSS (MB)':>9}  cargadas")
+    for modo, r in resultados.items():
+        print(f"{modo:<10} {r['import_ms']:>12} {r['arranque_ms']:>14} {r['rss_mb']:>9}  {', '.join(r['cargadas']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
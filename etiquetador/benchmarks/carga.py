@@ -0,0 +1,107 @@
+'''Prueba de carga con varios workers de uvicorn sobre el mismo dataset
+
+Arranca uvicorn en un puerto local con 1, 2, 4... workers (WEB_CONCURRENCY)
+en un directorio de trabajo con un dataset sintético, lanza los mismos
+escenarios con cada número de workers y compara el throughput.
+
+Uso: python -m benchmarks.carga [--workers 1 2 4] [--muestras 500] [--peticiones 200]
+     [--concurrencia 16] [--solo upload_image download_yolo]
+'''
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.rendimiento import RAIZ, _subidas, medir
+
+PUERTO = 8765
+
+
+def _escenarios(args: argparse.Namespace, subidas: List[Dict[str, Any]]):
+    return {
+        "upload_image": (lambda i: ("POST", "/upload-image/", {"json": subidas[i % len(subidas)]}), args.peticiones),
+        "images_pagina": (lambda i: ("GET", "/images/", {"params": {"limit": 24, "vista": "resumen"}}), args.peticiones),
+        "download_yolo": (lambda i: ("GET", "/download/dataset/yolo", {}), args.descargas),
+        "download_coco": (lambda i: ("GET", "/download/dataset/coco", {}), args.descargas),
+    }
+
+
+def _esperar(url: str, proceso: subprocess.Popen, timeout: float = 60):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"uvicorn ha terminado con código {proceso.returncode}")
+        try:
+            if httpx.get(url).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"uvicorn no responde en {url}")
+
+
+async def _lanzar(base_url: str, escenarios, concurrencia: int) -> Dict[str, Any]:
+    resultados = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        for nombre, (escenario, peticiones) in escenarios.items():
+            resultados[nombre] = await medir(client, escenario, peticiones, concurrencia)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide cómo escala el throughput con el número de workers de uvicorn")
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4], help="números de workers a probar")
+    parser.add_argument("--muestras", type=int, default=500, help="tamaño del dataset sintético")
+    parser.add_argument("--peticiones", type=int, default=200, help="peticiones por escenario")
+    parser.add_argument("--descargas", type=int, default=8, help="peticiones por escenario de /download/*")
+    parser.add_argument("--concurrencia", type=int, default=16, help="clientes simultáneos")
+    parser.add_argument("--seed", type=int, default=0, help="semilla del dataset y de las subidas")
+    parser.add_argument("--solo", nargs="*", default=["upload_image", "images_pagina", "download_yolo"], help="escenarios a lanzar")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="etiquetador_carga_")
+    sys.path.insert(0, RAIZ)
+    os.chdir(directorio)
+    os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+    # Las subidas sintéticas son distintas entre sí, pero se repiten si hay más peticiones que subidas
+    os.environ.setdefault("DUPLICADOS", "ignorar")
+    from benchmarks.generar_dataset import generar
+
+    generar("dataset", args.muestras, args.seed)
+    subidas = _subidas(min(args.peticiones, 100), args.seed + 1)
+    escenarios = {nombre: escenario for nombre, escenario in _escenarios(args, subidas).items() if nombre in args.solo}
+
+    throughput: Dict[int, Dict[str, float]] = {}
+    for workers in args.workers:
+        env = dict(os.environ, WEB_CONCURRENCY=str(workers), PYTHONPATH=RAIZ)
+        proceso = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(PUERTO), "--log-level", "warning"],
+            cwd=directorio, env=env,
+        )
+        try:
+            base_url = f"http://127.0.0.1:{PUERTO}"
+            _esperar(f"{base_url}/", proceso)
+            resultados = asyncio.run(_lanzar(base_url, escenarios, args.concurrencia))
+        finally:
+            proceso.terminate()
+            proceso.wait()
+        throughput[workers] = {nombre: r["throughput_rps"] for nombre, r in resultados.items()}
+        for nombre, r in resultados.items():
+            print(f"workers={workers:<3} {nombre:16} p50={r['latencia_ms']['p50']:9.2f}ms "
+                  f"{r['throughput_rps']:9.2f} req/s errores={r['errores']}")
+
+    base = throughput[args.workers[0]]
+    print(f"\nThroughput relativo a {args.workers[0]} worker(s) ({os.cpu_count()} CPUs, directorio {directorio}):")
+    for workers, valores in throughput.items():
+        relativos = ", ".join(f"{nombre} x{valor / base[nombre]:.2f}" for nombre, valor in valores.items() if base[nombre])
+        print(f"  {workers} workers: {relativos}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+'''Genera un dataset sintético con imágenes WebP, cajas y metadatos aleatorios
+
+Uso: python -m benchmarks.generar_dataset [--muestras 1000] [--directorio dataset] [--seed 0]
+'''
+import argparse
+import json
+from datetime import date, timedelta
+from typing import Any, Dict, List
+from uuid import UUID
+
+import numpy as np
+from PIL import Image
+
+from services.almacen import Almacen
+from utils.logger import logger
+
+SALAS = ["1", "2", "3", "4", "5", "6"]
+MUESTRAS = ["A", "B", "C", "D"]
+INICIO = date(2025, 1, 1)
+# Las imágenes se generan con bloques de ruido de este lado para que WebP no las
+# comprima de forma irreal y el hash perceptual de cada una sea distinto
+LADO_BLOQUE = 16
+
+
+def imagen_aleatoria(rng: np.random.Generator, ancho: int, alto: int) -> Image.Image:
+    bloques = rng.integers(0, 256, (max(alto // LADO_BLOQUE, 1), max(ancho // LADO_BLOQUE, 1), 3), dtype=np.uint8)
+    return Image.fromarray(bloques, "RGB").resize((ancho, alto), Image.Resampling.BILINEAR)
+
+
+def anotaciones_aleatorias(rng: np.random.Generator, ancho: int, alto: int, cajas_max: int) -> List[Dict[str, Any]]:
+    anotaciones = []
+    for _ in range(int(rng.integers(0, cajas_max + 1))):
+        x1, x2 = sorted(rng.uniform(0, ancho, 2).round(1).tolist())
+        y1, y2 = sorted(rng.uniform(0, alto, 2).round(1).tolist())
+        anotaciones.append({"points": [{"x": x1, "y": y1}, {"x": x2, "y": y2}]})
+    return anotaciones
+
+
+def metadatos_aleatorios(rng: np.random.Generator, ancho: int, alto: int, cajas_max: int) -> Dict[str, Any]:
+    """Metadatos con el mismo formato que guarda /upload-image/ en dataset/data."""
+    fecha = INICIO + timedelta(days=int(rng.integers(0, 365)))
+    return {
+        "dia_entrada": (fecha - timedelta(days=int(rng.integers(0, 40)))).isoformat(),
+        "temperatura": round(float(rng.normal(18, 2)), 1),
+        "humedad": round(float(rng.uniform(80, 95)), 1),
+        "sala": str(rng.choice(SALAS)),
+        "muestra": str(rng.choice(MUESTRAS)),
+        "fecha": fecha.isoformat(),
+        "hora": f"{int(rng.integers(6, 20)):02d}:{int(rng.integers(0, 60)):02d}",
+        "temp_compost": round(float(rng.normal(24, 1.5)), 1),
+        "co2": round(float(rng.uniform(600, 2500))),
+        "circulacion": round(float(rng.uniform(0, 3)), 2),
+        "observaciones": None,
+        "annotations": anotaciones_aleatorias(rng, ancho, alto, cajas_max),
+    }
+
+
+def generar(
+    directorio: str = "dataset",
+    muestras: int = 1000,
+    seed: int = 0,
+    ancho: int = 640,
+    alto: int = 480,
+    cajas_max: int = 20,
+) -> List[str]:
+    """
+    Escribe `muestras` muestras sintéticas en directorio/images, labels y data,
+    con el layout del almacén configurado. Con la misma semilla se generan
+    siempre los mismos ids y contenidos. Devuelve los ids generados.
+    """
+    rng = np.random.default_rng(seed)
+    almacen = Almacen(directorio)
+
+    ids = []
+    for indice in range(muestras):
+        image_id = str(UUID(bytes=rng.bytes(16), version=4))
+        metadata = metadatos_aleatorios(rng, ancho, alto, cajas_max)
+        imagen_aleatoria(rng, ancho, alto).save(almacen.ruta_nueva("images", f"{image_id}.webp"), "webp")
+        imagen_aleatoria(rng, ancho // 4, alto // 4).save(almacen.ruta_nueva("data", f"{image_id}.webp"), "webp")
+        with open(almacen.ruta_nueva("data", f"{image_id}.json"), "w") as f:
+            json.dump(metadata, f, indent=4)
+        with open(almacen.ruta_nueva("labels", f"{image_id}.txt"), "w") as f:
+            for ann in metadata["annotations"]:
+                p1, p2 = ann["points"]
+                w, h = (p2["x"] - p1["x"]) / ancho, (p2["y"] - p1["y"]) / alto
+                if w and h:
+                    f.write(f"0 {(p1['x'] + p2['x']) / (2 * ancho):.6f} {(p1['y'] + p2['y']) / (2 * alto):.6f} {w:.6f} {h:.6f}\n")
+        ids.append(image_id)
+        if (indice + 1) % 500 == 0:
+            logger.info(f"Generated {indice + 1}/{muestras} synthetic samples")
+    almacen.tocar()
+    logger.info(f"Generated {muestras} synthetic samples in {directorio}")
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un dataset sintético para pruebas de rendimiento")
+    parser.add_argument("--directorio", default="dataset", help="directorio raíz del dataset")
+    parser.add_argument("--muestras", type=int, default=1000, help="número de muestras a generar")
+    parser.add_argument("--seed", type=int, default=0, help="semilla del generador")
+    parser.add_argument("--ancho", type=int, default=640, help="ancho de las imágenes anotadas")
+    parser.add_argument("--alto", type=int, default=480, help="alto de las imágenes anotadas")
+    parser.add_argument("--cajas-max", type=int, default=20, help="cajas máximas por imagen")
+    args = parser.parse_args()
+    generar(args.directorio, args.muestras, args.seed, args.ancho, args.alto, args.cajas_max)
+
+
+if __name__ == "__main__":
+    main()
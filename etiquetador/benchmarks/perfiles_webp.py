@@ -0,0 +1,84 @@
+'''Tiempo de guardado frente a tamaño del fichero para cada perfil WebP
+
+Guarda las mismas imágenes de prueba con cada perfil, como lo hace la subida
+(decodificar, reducir, codificar, escribir y calcular el hash), y muestra la
+mediana del tiempo por fase y el tamaño del WebP resultante.
+
+Uso: python -m benchmarks.perfiles_webp [--repeticiones 5] [--perfiles rapido equilibrado]
+'''
+import argparse
+import io
+import os
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (nombre, ancho, alto, formato): una foto de móvil, una imagen mediana y un WebP ya comprimido
+ENTRADAS = [
+    ("foto_movil_jpeg", 4032, 3024, "JPEG"),
+    ("mediana_jpeg", 1280, 960, "JPEG"),
+    ("mediana_webp", 1280, 960, "WEBP"),
+]
+
+
+def _entradas(seed: int) -> List[Tuple[str, bytes]]:
+    from benchmarks.generar_dataset import imagen_aleatoria
+
+    rng = np.random.default_rng(seed)
+    entradas = []
+    for nombre, ancho, alto, formato in ENTRADAS:
+        buffer = io.BytesIO()
+        imagen_aleatoria(rng, ancho, alto).save(buffer, formato, quality=85)
+        entradas.append((nombre, buffer.getvalue()))
+    return entradas
+
+
+def medir(perfil_nombre: str, datos: bytes, repeticiones: int, directorio: str) -> Dict[str, float]:
+    from services.imagenes import _convertir_y_guardar, obtener_perfil
+
+    perfil = obtener_perfil(perfil_nombre)
+    tiempos: List[Dict[str, float]] = []
+    for i in range(repeticiones):
+        destino = os.path.join(directorio, f"{perfil_nombre}_{i}.webp")
+        guardada = _convertir_y_guardar(io.BytesIO(datos), destino, os.path.join(directorio, "blobs"), perfil=perfil)
+        tiempos.append(guardada.tiempos)
+        tamano = os.path.getsize(destino)
+        os.remove(destino)
+    fases = sorted({fase for t in tiempos for fase in t})
+    resultado = {fase: float(np.median([t.get(fase, 0.0) for t in tiempos])) * 1000 for fase in fases}
+    resultado["total"] = float(np.median([sum(t.values()) for t in tiempos])) * 1000
+    resultado["kb"] = tamano / 1024
+    resultado["lado"] = max(guardada.width, guardada.height)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el tiempo de guardado y el tamaño de cada perfil WebP")
+    parser.add_argument("--repeticiones", type=int, default=5, help="guardados por perfil e imagen (se da la mediana)")
+    parser.add_argument("--perfiles", nargs="*", help="perfiles a medir (por defecto, todos)")
+    parser.add_argument("--seed", type=int, default=0, help="semilla de las imágenes de prueba")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="etiquetador_webp_")
+    sys.path.insert(0, RAIZ)
+    os.chdir(directorio)
+    os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+    from services.imagenes import PERFILES
+
+    perfiles = args.perfiles or list(PERFILES)
+    print(f"{'entrada':<16} {'perfil':<12} {'lado':>5} {'total ms':>9} {'decode':>8} {'encode':>8} {'KB':>8}")
+    for nombre, datos in _entradas(args.seed):
+        print(f"{nombre:<16} {'(original)':<12} {'':>5} {'':>9} {'':>8} {'':>8} {len(datos) / 1024:>8.1f}")
+        for perfil in perfiles:
+            r = medir(perfil, datos, args.repeticiones, directorio)
+            # Sin fase "encode": el WebP se ha guardado tal cual
+            encode = f"{r['encode']:8.1f}" if "encode" in r else f"{'tal cual':>8}"
+            print(f"{nombre:<16} {perfil:<12} {r['lado']:>5} {r['total']:>9.1f} {r['decode']:>8.1f} {encode} {r['kb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
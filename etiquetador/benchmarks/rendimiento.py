@@ -0,0 +1,229 @@
+'''Pruebas de rendimiento de la API en proceso, con httpx y transporte ASGI
+
+Genera un dataset sintético en un directorio de trabajo temporal, arranca la
+aplicación dentro del mismo proceso y mide latencia y throughput de cada
+endpoint. Los resultados se guardan en JSON para compararlos entre commits.
+
+Uso: python -m benchmarks.rendimiento [--muestras 1000] [--peticiones 200]
+     [--concurrencia 8] [--salida benchmarks/resultados] [--comparar anterior.json]
+'''
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+import numpy as np
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_URL = "http://benchmark"
+
+# Un escenario construye la petición i-ésima: (método, url, argumentos de httpx)
+Peticion = Tuple[str, str, Dict[str, Any]]
+Escenario = Callable[[int], Peticion]
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def _estadisticas(latencias: List[float], bytes_respuesta: List[int], errores: int, duracion: float) -> Dict[str, Any]:
+    ms = np.asarray(latencias) * 1000
+    return {
+        "peticiones": len(latencias),
+        "errores": errores,
+        "duracion_s": round(duracion, 3),
+        "throughput_rps": round(len(latencias) / duracion, 2) if duracion else None,
+        "latencia_ms": {
+            "media": round(float(ms.mean()), 3),
+            "min": round(float(ms.min()), 3),
+            "p50": round(float(np.percentile(ms, 50)), 3),
+            "p95": round(float(np.percentile(ms, 95)), 3),
+            "p99": round(float(np.percentile(ms, 99)), 3),
+            "max": round(float(ms.max()), 3),
+        },
+        "bytes_respuesta_medios": int(np.mean(bytes_respuesta)),
+    }
+
+
+async def medir(client: httpx.AsyncClient, escenario: Escenario, peticiones: int, concurrencia: int) -> Dict[str, Any]:
+    """Lanza `peticiones` peticiones del escenario con `concurrencia` clientes a la vez."""
+    latencias: List[float] = []
+    bytes_respuesta: List[int] = []
+    errores = 0
+    siguiente = iter(range(peticiones))
+
+    async def cliente():
+        nonlocal errores
+        for i in siguiente:
+            metodo, url, kwargs = escenario(i)
+            inicio = time.perf_counter()
+            async with client.stream(metodo, url, **kwargs) as response:
+                recibidos = 0
+                async for chunk in response.aiter_raw():
+                    recibidos += len(chunk)
+            latencias.append(time.perf_counter() - inicio)
+            bytes_respuesta.append(recibidos)
+            if response.status_code >= 400:
+                errores += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(min(concurrencia, peticiones))))
+    return _estadisticas(latencias, bytes_respuesta, errores, time.perf_counter() - inicio)
+
+
+def _subidas(peticiones: int, seed: int) -> List[Dict[str, Any]]:
+    """Payloads de /upload-image/ distintos entre sí, preparados antes de medir."""
+    from benchmarks.generar_dataset import imagen_aleatoria, metadatos_aleatorios
+
+    rng = np.random.default_rng(seed)
+    payloads = []
+    for _ in range(peticiones):
+        buffer = io.BytesIO()
+        imagen_aleatoria(rng, 640, 480).save(buffer, "JPEG", quality=90)
+        metadata = metadatos_aleatorios(rng, 640, 480, 20)
+        payloads.append({
+            "annotatedImageFile": base64.b64encode(buffer.getvalue()).decode(),
+            "dataImageFile": "",
+            "annotations": metadata["annotations"],
+            "diaEntrada": metadata["dia_entrada"],
+            "tempAmbiente": metadata["temperatura"],
+            "humedad": metadata["humedad"],
+            "sala": metadata["sala"],
+            "muestra": metadata["muestra"],
+            "fecha": metadata["fecha"],
+            "hora": metadata["hora"],
+            "tempCompost": metadata["temp_compost"],
+            "co2": metadata["co2"],
+            "circulacion": metadata["circulacion"],
+        })
+    return payloads
+
+
+def _logs(entradas: int) -> Dict[str, Any]:
+    return {"logs": [
+        {"type": "error", "message": f"Error sintético {i}", "timestamp": datetime.now().isoformat(), "url": "/historial"}
+        for i in range(entradas)
+    ]}
+
+
+async def ejecutar(args: argparse.Namespace) -> Dict[str, Any]:
+    # Los módulos de la aplicación se importan ya dentro del directorio de trabajo
+    from benchmarks.generar_dataset import generar
+
+    ids = generar("dataset", args.muestras, args.seed)
+
+    import main
+
+    rng = np.random.default_rng(args.seed)
+    subidas = _subidas(args.peticiones, args.seed + 1)
+    lote_logs = _logs(20)
+    escenarios: Dict[str, Tuple[Escenario, int]] = {
+        "upload_image": (lambda i: ("POST", "/upload-image/", {"json": subidas[i]}), args.peticiones),
+        "images_lista": (lambda i: ("GET", "/images/", {}), args.peticiones),
+        "images_pagina": (lambda i: ("GET", "/images/", {"params": {"limit": 24, "vista": "resumen"}}), args.peticiones),
+        "images_detalle": (lambda i: ("GET", f"/images/{ids[rng.integers(len(ids))]}", {}), args.peticiones),
+        "log_batch": (lambda i: ("POST", "/log/batch/", {"json": lote_logs}), args.peticiones),
+        "download_dataset": (lambda i: ("GET", "/download/dataset", {}), args.descargas),
+        "download_report": (lambda i: ("GET", "/download/dataset/report", {}), args.descargas),
+        "download_excel": (lambda i: ("GET", "/download/dataset/excel", {}), args.descargas),
+        "download_yolo": (lambda i: ("GET", "/download/dataset/yolo", {}), args.descargas),
+        "download_coco": (lambda i: ("GET", "/download/dataset/coco", {}), args.descargas),
+    }
+    if args.solo:
+        escenarios = {nombre: escenarios[nombre] for nombre in args.solo}
+
+    resultados: Dict[str, Any] = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url=BASE_URL, timeout=None) as client:
+            for nombre, (escenario, peticiones) in escenarios.items():
+                resultados[nombre] = await medir(client, escenario, peticiones, args.concurrencia)
+                latencia = resultados[nombre]["latencia_ms"]
+                print(f"{nombre:18} p50={latencia['p50']:9.2f}ms p95={latencia['p95']:9.2f}ms "
+                      f"{resultados[nombre]['throughput_rps']:9.2f} req/s errores={resultados[nombre]['errores']}")
+    return resultados
+
+
+def comparar(anterior: Dict[str, Any], actual: Dict[str, Any]):
+    """Imprime la variación de la latencia p50 respecto a una ejecución anterior."""
+    print(f"\nComparación con {anterior['commit']} ({anterior['fecha']}):")
+    for nombre, resultado in actual["resultados"].items():
+        previo = anterior["resultados"].get(nombre)
+        if previo is None:
+            continue
+        antes, ahora = previo["latencia_ms"]["p50"], resultado["latencia_ms"]["p50"]
+        variacion = (ahora - antes) / antes * 100 if antes else 0.0
+        print(f"{nombre:18} p50 {antes:9.2f}ms -> {ahora:9.2f}ms ({variacion:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide la latencia y el throughput de la API con un dataset sintético")
+    parser.add_argument("--muestras", type=int, default=1000, help="tamaño del dataset sintético")
+    parser.add_argument("--peticiones", type=int, default=200, help="peticiones por escenario")
+    parser.add_argument("--descargas", type=int, default=3, help="peticiones por escenario de /download/*")
+    parser.add_argument("--concurrencia", type=int, default=8, help="clientes simultáneos")
+    parser.add_argument("--seed", type=int, default=0, help="semilla del dataset y de las peticiones")
+    parser.add_argument("--solo", nargs="*", help="ejecuta solo estos escenarios")
+    parser.add_argument("--directorio", help="directorio de trabajo (por defecto, uno temporal)")
+    parser.add_argument("--salida", default=os.path.join(RAIZ, "benchmarks", "resultados"), help="carpeta de los JSON de resultados")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior con el que comparar")
+    args = parser.parse_args()
+    if args.comparar:
+        args.comparar = os.path.abspath(args.comparar)
+
+    # La aplicación usa rutas relativas (dataset/, cache/, logs/): se ejecuta en
+    # un directorio de trabajo aparte para no tocar el dataset real
+    directorio = os.path.abspath(args.directorio or tempfile.mkdtemp(prefix="etiquetador_benchmark_"))
+    args.salida = os.path.abspath(args.salida)
+    os.makedirs(directorio, exist_ok=True)
+    sys.path.insert(0, RAIZ)
+    os.chdir(directorio)
+    # Solo los avisos por consola, para no mezclar el log con los resultados
+    os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+
+    inicio = datetime.now()
+    resultados = asyncio.run(ejecutar(args))
+    informe = {
+        "commit": _commit(),
+        "fecha": inicio.isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parametros": {
+            "muestras": args.muestras,
+            "peticiones": args.peticiones,
+            "descargas": args.descargas,
+            "concurrencia": args.concurrencia,
+            "seed": args.seed,
+        },
+        "resultados": resultados,
+    }
+
+    os.makedirs(args.salida, exist_ok=True)
+    ruta = os.path.join(args.salida, f"{inicio:%Y%m%d_%H%M%S}_{informe['commit']}.json")
+    with open(ruta, "w") as f:
+        json.dump(informe, f, indent=4)
+    print(f"\nResultados guardados en {ruta} (directorio de trabajo {directorio})")
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            comparar(json.load(f), informe)
+
+
+if __name__ == "__main__":
+    main()
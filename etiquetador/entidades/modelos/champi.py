@@ -1,10 +1,53 @@
 '''Modelo de bbdd para champi'''
-from sqlalchemy import Column, Integer
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.orm import relationship
 from bbdd.database import Base
 
 class Champi(Base):
     """
-    Modelo de bbdd para champi
+    Modelo de bbdd para champi: los metadatos de una muestra del dataset.
+    El id es el UUID con el que se guardan sus ficheros.
     """
     __tablename__ = 'champi'
-    id = Column(Integer, primary_key = True, index = True)
+    id = Column(String(36), primary_key = True)
+    dia_entrada = Column(String(32))
+    temperatura = Column(Float)
+    humedad = Column(Float)
+    sala = Column(String(64), index = True)
+    muestra = Column(String(64), index = True)
+    fecha = Column(String(32), index = True)
+    hora = Column(String(32))
+    temp_compost = Column(Float)
+    co2 = Column(Float)
+    circulacion = Column(Float)
+    observaciones = Column(Text)
+    nombre = Column(String(255))
+    estado = Column(String(64))
+    comentarios = Column(Text)
+    # sha256 del WebP de la imagen anotada en dataset/blobs (None en muestras antiguas)
+    imagen_sha256 = Column(String(64))
+    anotaciones = relationship(
+        "Anotacion",
+        order_by = "Anotacion.orden",
+        cascade = "all, delete-orphan",
+        lazy = "selectin",
+    )
+
+    __table_args__ = (
+        Index("ix_champi_sala_fecha", "sala", "fecha"),
+    )
+
+
+class Anotacion(Base):
+    """
+    Modelo de bbdd para las cajas anotadas de un champi, con los dos puntos en
+    píxeles tal y como los envió el cliente.
+    """
+    __tablename__ = 'anotacion'
+    id = Column(Integer, primary_key = True, autoincrement = True)
+    champi_id = Column(String(36), ForeignKey('champi.id', ondelete = "CASCADE"), nullable = False, index = True)
+    orden = Column(Integer, nullable = False)
+    x1 = Column(Float, nullable = False)
+    y1 = Column(Float, nullable = False)
+    x2 = Column(Float, nullable = False)
+    y2 = Column(Float, nullable = False)
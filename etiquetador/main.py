@@ -1,18 +1,50 @@
+import os
 from fastapi import FastAPI
-from middlewares import cors
-from asyncio import create_task
+from middlewares import cors, metricas
+from asyncio import create_task, to_thread
 from contextlib import asynccontextmanager
-from routes.champi import router as champi_router
+from routes.champi import router as champi_router, almacen, catalogo, registro_cliente
 from routes.hola import router as hola_router
-from routes.download import router as download_router
+from routes.metricas import router as metricas_router
+from bbdd import database
+from services import champi as champi_service, imagenes
+from services.logs_cliente import vaciar_periodicamente
+from utils.ficheros import bloqueo
 
 import utils.logger as logger
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
-from fastapi.staticfiles import StaticFiles
+from services.almacen import StaticFilesAlmacen
 import traceback
-app = FastAPI(root_path="/champitech/api")
+
+# "minimo" arranca la API sin las rutas de descarga, informes y estadísticas,
+# que son las que cargan openpyxl y NumPy; "completo" (por defecto) las incluye todas
+API_MODO = os.environ.get("API_MODO", "completo")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Construir el catálogo de metadatos una única vez al arrancar, a partir de la bbdd.
+    # Con varios workers arrancan de uno en uno para no crear tablas ni importar
+    # las mismas muestras a la vez
+    with bloqueo("cache/arranque"):
+        await database.crear_tablas()
+        async with database.async_session() as db:
+            solo_en_disco, eliminadas = catalogo.cargar(await champi_service.cargar_metadatos(db))
+            await champi_service.sincronizar(db, solo_en_disco, eliminadas)
+    tarea_logs = create_task(vaciar_periodicamente(registro_cliente))
+    yield
+    tarea_logs.cancel()
+    await to_thread(registro_cliente.flush)
+    imagenes.cerrar()
+    if API_MODO != "minimo":
+        from routes.download import trabajos
+        await to_thread(trabajos.cerrar)
+    await database.cerrar()
+    # Vaciar la cola de logs antes de salir
+    logger.cerrar()
+
+app = FastAPI(root_path="/champitech/api", lifespan=lifespan)
 
 app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request, exc):
@@ -44,12 +76,19 @@ async def general_exception_handler(request, exc):
 
 # Añadimos la configuración de CORS
 cors.add(app)
+# Métricas por ruta, expuestas en /metrics
+metricas.add(app)
 
 # Incluir las routes
 app.include_router(champi_router)
 app.include_router(hola_router)
-app.include_router(download_router)
-app.mount("/dataset", StaticFiles(directory="dataset"), name="dataset")
+if API_MODO != "minimo":
+    from routes.download import router as download_router
+    from routes.estadisticas import router as estadisticas_router
+    app.include_router(download_router)
+    app.include_router(estadisticas_router)
+app.include_router(metricas_router)
+app.mount("/dataset", StaticFilesAlmacen(almacen), name="dataset")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,57 @@
+import time
+
+from fastapi import FastAPI
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.metricas import EN_CURSO, LATENCIA, PETICIONES, TAMANO_PETICION, TAMANO_RESPUESTA
+
+
+class MetricasMiddleware:
+    """
+    Middleware ASGI puro (sin BaseHTTPMiddleware, para no romper el streaming de
+    las descargas) que mide cada petición HTTP: número, en curso, latencia y
+    tamaño de petición y respuesta. Las rutas se agrupan por su plantilla
+    (/images/{image_id}), no por la URL concreta.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        estado = 500
+        enviados = 0
+
+        async def send_medido(message: Message):
+            nonlocal estado, enviados
+            if message["type"] == "http.response.start":
+                estado = message["status"]
+            elif message["type"] == "http.response.body":
+                enviados += len(message.get("body", b""))
+            await send(message)
+
+        EN_CURSO.inc()
+        try:
+            await self.app(scope, receive, send_medido)
+        finally:
+            EN_CURSO.dec()
+            metodo = scope["method"]
+            # El router deja en el scope la ruta que ha atendido la petición
+            ruta = getattr(scope.get("route"), "path", None) or "desconocida"
+            PETICIONES.inc(metodo, ruta, str(estado))
+            LATENCIA.observar(time.perf_counter() - inicio, metodo, ruta)
+            TAMANO_RESPUESTA.observar(enviados, metodo, ruta)
+            longitud = dict(scope["headers"]).get(b"content-length")
+            if longitud is not None and longitud.isdigit():
+                TAMANO_PETICION.observar(int(longitud), metodo, ruta)
+
+
+def add(app: FastAPI):
+    """
+    Función para habilitar las métricas por ruta
+    """
+    app.add_middleware(MetricasMiddleware)
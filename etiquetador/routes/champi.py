@@ -1,24 +1,30 @@
-from fastapi import APIRouter, FastAPI, HTTPException, Form
-from pydantic import BaseModel
-import base64
-import io
-from PIL import Image
-from os import makedirs
-from os.path import join
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, File, Form, Path, Query, Request, Response, UploadFile
+from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
 from uuid import uuid4
 from json import dump
-from typing import List, Dict, Any, Optional
+from typing import Awaitable, List, Dict, Any, Literal, Optional, Tuple
 import traceback
 import os
-from os.path import join
-import json
-from datetime import datetime
 
 # Import the logger
 from utils.logger import logger
+from utils.http_cache import cabeceras_cache, calcular_etag, no_modificado
+from utils.metricas import observar_span, span
+from bbdd.database import get_db
+from services import champi as champi_service
+from services.almacen import Almacen
+from services.cambios import RegistroCambios
+from services.catalogo import Catalogo, formatear_registro, resumir_registro
+from services.duplicados import DUPLICADOS, ImagenDuplicada, IndiceHashes
+from services.imagenes import IMAGE_WORKERS, ImagenGuardada, PerfilWebP, guardar_imagen, guardar_imagen_subida, obtener_perfil
+from services.logs_cliente import RegistroCliente
+from services.miniaturas import TAMANOS, CacheMiniaturas
 
-CLIENT_LOGS_DIR = "logs/client"
-os.makedirs(CLIENT_LOGS_DIR, exist_ok=True)
+registro_cliente = RegistroCliente()
 
 router = APIRouter()
 
@@ -33,9 +39,7 @@ class Annotation(BaseModel):
         Point
     ] 
 
-class AnnotatedImage(BaseModel):
-    annotatedImageFile: str
-    dataImageFile: str
+class MetadatosMuestra(BaseModel):
     annotations: list[Annotation]
     diaEntrada: Optional[str] = None
     tempAmbiente: Optional[float] = None
@@ -49,6 +53,10 @@ class AnnotatedImage(BaseModel):
     circulacion: Optional[float] = None
     observaciones: Optional[str] = None
 
+class AnnotatedImage(MetadatosMuestra):
+    annotatedImageFile: str
+    dataImageFile: str
+
 class LogEntry(BaseModel):
     type: str
     message: str
@@ -66,286 +74,485 @@ class LogEntry(BaseModel):
 class BatchLogRequest(BaseModel):
     logs: List[LogEntry]
 
-IMAGES_DIR = "dataset/images"
-LABELS_DIR = "dataset/labels"
-DATOS_DIR = "dataset/data"
-makedirs(IMAGES_DIR, exist_ok=True)
-makedirs(LABELS_DIR, exist_ok=True)
-makedirs(DATOS_DIR, exist_ok=True)
+class BatchUploadRequest(BaseModel):
+    images: List[AnnotatedImage] = Field(..., max_length=100)
+
+
+# Imágenes de un lote que se procesan a la vez
+BATCH_CONCURRENCIA = int(os.environ.get("BATCH_CONCURRENCIA", IMAGE_WORKERS))
+
+# Rutas de dataset/images, labels y data según el layout configurado
+almacen = Almacen()
+# Altas y bajas numeradas, para las exportaciones incrementales
+cambios = RegistroCambios()
+catalogo = Catalogo(almacen, cambios)
+miniaturas = CacheMiniaturas(almacen)
+indice_hashes = IndiceHashes()
+
+
+def _metadatos(payload: MetadatosMuestra, imagen_sha256: Optional[str] = None) -> Dict[str, Any]:
+    """Metadatos de una muestra tal y como se guardan en dataset/data."""
+    annotations_data = [ann.model_dump() for ann in payload.annotations]
+    return {
+        "dia_entrada": payload.diaEntrada,
+        "temperatura": payload.tempAmbiente, 
+        "humedad": payload.humedad,
+        "sala": payload.sala,
+        "muestra": payload.muestra,
+        "fecha": payload.fecha,
+        "hora": payload.hora,
+        "temp_compost": payload.tempCompost,
+        "co2": payload.co2,
+        "circulacion": payload.circulacion,
+        "observaciones": payload.observaciones,
+        "imagen_sha256": imagen_sha256,
+        "annotations": annotations_data
+    }
+
+
+def _perfil(nombre: Optional[str]) -> PerfilWebP:
+    """Perfil WebP pedido en la subida (?perfil=), o el del despliegue."""
+    try:
+        return obtener_perfil(nombre)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _ajustar_a_imagen(payload: MetadatosMuestra, imagenes: List[ImagenGuardada]) -> MetadatosMuestra:
+    """
+    Los puntos de las anotaciones vienen en píxeles de la imagen enviada: si el
+    perfil la ha reducido al guardarla se escalan igual que ella.
+    """
+    escala_x, escala_y = imagenes[0].escala_x, imagenes[0].escala_y
+    if escala_x == escala_y == 1:
+        return payload
+    annotations = [
+        Annotation(points=[Point(x=p.x * escala_x, y=p.y * escala_y) for p in ann.points])
+        for ann in payload.annotations
+    ]
+    return payload.model_copy(update={"annotations": annotations})
+
+
+async def sincronizar_bbdd(db: AsyncSession):
+    """
+    Incorpora al catálogo los cambios hechos en disco fuera de la API y los pasa
+    a la base de datos, de la que leen el listado, el detalle y el informe.
+    """
+    await run_in_threadpool(catalogo.sincronizar)
+    altas, bajas = catalogo.pendientes_bbdd()
+    if altas or bajas:
+        await champi_service.sincronizar(db, altas, bajas)
+
+
+async def _guardar_en_bbdd(db: AsyncSession, muestras: Dict[str, Dict[str, Any]]) -> List[str]:
+    """
+    Escribe las muestras en la base de datos, reintentando una a una si falla
+    el lote. Devuelve los ids que no se han podido guardar: su subida se deshace
+    (_retirar_muestra), porque sin fila en la base de datos no se listarían.
+    """
+    return await champi_service.guardar_por_lotes(db, muestras)
+
+
+def _registro(image_id: str, data: Dict[str, Any], resumen: bool = False) -> Dict[str, Any]:
+    """Metadatos de la base de datos en el formato que devuelve la API."""
+    record = formatear_registro(image_id, data, almacen.url_imagen(image_id, data.get("imagen_sha256")))
+    return resumir_registro(record) if resumen else record
+
+
+def _descartar_muestra(uuid: str, imagenes: List[ImagenGuardada]):
+    """
+    Borra lo que ya se haya escrito de una muestra que no se ha podido completar
+    (imágenes, metadatos y etiquetas) y los blobs que ya nadie enlaza.
+    """
+    almacen.borrar("images", f"{uuid}.webp")
+    almacen.borrar("data", f"{uuid}.webp")
+    almacen.borrar("data", f"{uuid}.json")
+    almacen.borrar("labels", f"{uuid}.txt")
+    for guardada in imagenes:
+        if guardada.contenido:
+            almacen.liberar_blob(guardada.contenido)
+
+
+def _retirar_muestra(uuid: str, imagenes: List[ImagenGuardada]):
+    """Deshace una muestra ya registrada en el catálogo y escrita en disco."""
+    catalogo.quitar(uuid)
+    _descartar_muestra(uuid, imagenes)
+    almacen.tocar()
+
+
+async def _esperar_imagenes(uuid: str, tareas: List[Awaitable[ImagenGuardada]]) -> List[ImagenGuardada]:
+    """
+    Espera a que se guarden las imágenes de una muestra y devuelve sus
+    dimensiones y hashes, en el orden de las tareas. Si alguna falla se
+    descartan las que sí se han guardado.
+    """
+    resultados = await asyncio.gather(*tareas, return_exceptions=True)
+    for resultado in resultados:
+        if isinstance(resultado, Exception):
+            logger.error(f"Failed to process image: {str(resultado.__cause__ or resultado)}")
+            guardadas = [r for r in resultados if isinstance(r, ImagenGuardada)]
+            await run_in_threadpool(_descartar_muestra, uuid, guardadas)
+            raise resultado
+    for imagen in resultados:
+        logger.debug(f"Image saved, dimensions: {imagen.width}x{imagen.height}")
+        for fase, segundos in imagen.tiempos.items():
+            observar_span(f"upload.{fase}", segundos)
+    return resultados
+
+
+def _buscar_duplicados(uuid: str, imagenes: List[ImagenGuardada]) -> List[Tuple[str, int]]:
+    """
+    Muestras del catálogo casi iguales a la imagen anotada recién guardada. Si
+    DUPLICADOS es "rechazar" y hay alguna, se borran sus imágenes y se lanza
+    ImagenDuplicada.
+    """
+    imagen = imagenes[0]
+    if DUPLICADOS == "ignorar" or imagen.dhash is None:
+        return []
+    duplicados = [
+        (image_id, d) for image_id, d in indice_hashes.buscar(imagen.dhash)
+        if catalogo.obtener(image_id) is not None
+    ]
+    if duplicados and DUPLICADOS == "rechazar":
+        _descartar_muestra(uuid, imagenes)
+        raise ImagenDuplicada(duplicados)
+    if duplicados:
+        logger.warning(f"Image {uuid} looks like a duplicate of {', '.join(i for i, _ in duplicados)}")
+    return duplicados
+
+
+def _escribir_muestra(uuid: str, payload: MetadatosMuestra, imagenes: List[ImagenGuardada]) -> Dict[str, Any]:
+    """
+    Escribe los metadatos y las etiquetas YOLO de una muestra cuyas imágenes ya
+    están guardadas y la añade al catálogo y al índice de hashes. Devuelve la
+    respuesta de la subida.
+    """
+    duplicados = _buscar_duplicados(uuid, imagenes)
+    # Las etiquetas se normalizan con las dimensiones de la última imagen procesada
+    img_width, img_height = imagenes[-1].width, imagenes[-1].height
+    image_filename = f"{uuid}.webp"
+
+    # Crear archivo de anotaciones YOLO
+    label_filename = f"{uuid}.txt"
+    json_filename = f"{uuid}.json"
+    label_path = almacen.ruta_nueva("labels", label_filename)
+    datos_path = almacen.ruta_nueva("data", json_filename)
+    
+    # Save metadata
+    try:
+        metadata = _metadatos(payload, imagenes[0].contenido)
+        with span("upload.metadata_write"), open(datos_path, "w") as f:
+            dump(metadata, f, indent=4)
+        logger.debug(f"Metadata saved to {datos_path}")
+    except Exception as e:
+        logger.error(f"Failed to save metadata: {str(e)}")
+        _descartar_muestra(uuid, imagenes)
+        raise ValueError(f"Could not save metadata: {str(e)}")
+
+    # Save annotations
+    valid_annotations = 0
+    skipped_annotations = 0
+    
+    try:
+        with span("upload.label_write"), open(label_path, "w") as f:
+            for i, ann in enumerate(payload.annotations):
+                if len(ann.points) != 2:
+                    logger.warning(f"Skipping annotation {i+1}: expected 2 points, got {len(ann.points)}")
+                    skipped_annotations += 1
+                    continue 
+ 
+                p1, p2 = ann.points
+                xmin = min(p1.x, p2.x)
+                xmax = max(p1.x, p2.x)
+                ymin = min(p1.y, p2.y)
+                ymax = max(p1.y, p2.y)
+ 
+                # Calcular en formato YOLO (normalizado)
+                x_center = (xmin + xmax) / (2 * img_width)
+                y_center = (ymin + ymax) / (2 * img_height)
+                width = (xmax - xmin) / img_width
+                height = (ymax - ymin) / img_height
+ 
+                if width == 0 or height == 0:
+                    logger.warning(f"Skipping annotation {i+1}: zero width or height")
+                    skipped_annotations += 1
+                    continue  # evitar cajas inválidas
+ 
+                f.write(f"0 {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
+                valid_annotations += 1
+        
+        logger.info(f"Saved {valid_annotations} valid annotations to {label_path} (skipped {skipped_annotations})")
+    except Exception as e:
+        logger.error(f"Failed to save annotations: {str(e)}")
+        _descartar_muestra(uuid, imagenes)
+        raise ValueError(f"Could not save annotations: {str(e)}")
+
+    catalogo.registrar(uuid, metadata)
+    if imagenes[0].dhash is not None:
+        indice_hashes.agregar(uuid, imagenes[0].dhash)
+    almacen.tocar()
+    logger.info(f"Successfully processed image upload with ID: {uuid}")
+    return {
+        "message": "Imagen y anotaciones guardadas correctamente.",
+        "id": uuid,
+        "imageUrl": almacen.url_imagen(uuid, imagenes[0].contenido),
+        "image_filename": image_filename,
+        "label_filename": label_filename,
+        "valid_annotations": valid_annotations,
+        "skipped_annotations": skipped_annotations,
+        "possible_duplicates": [{"id": image_id, "distance": d} for image_id, d in duplicados],
+    }
+
+
+async def _guardar_muestra(uuid: str, payload: MetadatosMuestra, tareas: List[Awaitable[ImagenGuardada]], db: AsyncSession) -> Dict[str, Any]:
+    """Guarda una muestra completa: imágenes, metadatos, etiquetas y registro en la bbdd."""
+    imagenes = await _esperar_imagenes(uuid, tareas)
+    payload = _ajustar_a_imagen(payload, imagenes)
+    # Escribe ficheros y toma bloqueos compartidos con otros workers: fuera del event loop
+    respuesta = await run_in_threadpool(_escribir_muestra, uuid, payload, imagenes)
+    if await _guardar_en_bbdd(db, {uuid: _metadatos(payload, imagenes[0].contenido)}):
+        await run_in_threadpool(_retirar_muestra, uuid, imagenes)
+        raise HTTPException(status_code=503, detail="No se ha podido guardar la muestra en la base de datos")
+    return respuesta
 
 
 @router.post("/upload-image/")
-async def upload_image(payload: AnnotatedImage):
+async def upload_image(
+    payload: AnnotatedImage,
+    background_tasks: BackgroundTasks,
+    perfil: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
     logger.info("Received image upload request")
-    
+    perfil_webp = _perfil(perfil)
+
     try:
         # Generar UUID único para la imagen/anotación
         uuid = str(uuid4())
         logger.debug(f"Generated UUID: {uuid}")
 
-        # Decodificar y guardar imagen
-        try:
-            image_data = base64.b64decode(payload.annotatedImageFile)
-            image = Image.open(io.BytesIO(image_data))
-            image = image.convert("RGB") 
-            img_width, img_height = image.size
-            logger.debug(f"Successfully decoded image, dimensions: {img_width}x{img_height}")
-        except Exception as e:
-            logger.error(f"Failed to decode image: {str(e)}")
-            raise ValueError("Invalid image data provided")
-
+        # Decodificar y guardar las imágenes en paralelo en el pool de workers
         image_filename = f"{uuid}.webp"
-        image_path = join(IMAGES_DIR, image_filename)
-        
-        try:
-            image.save(image_path, 'webp')
-            logger.debug(f"Image saved to {image_path}")
-        except Exception as e:
-            logger.error(f"Failed to save image: {str(e)}")
-            raise ValueError(f"Could not save image: {str(e)}")
-        # Decodificar y guardar imagen
+        image_path = almacen.ruta_nueva("images", image_filename)
+        tareas = [guardar_imagen(payload.annotatedImageFile, image_path, almacen.blobs_dir, perfil_webp)]
         if payload.dataImageFile:
-            try:
-                image_data = base64.b64decode(payload.dataImageFile)
-                image = Image.open(io.BytesIO(image_data))
-                image = image.convert("RGB") 
-                img_width, img_height = image.size
-                logger.debug(f"Successfully decoded image, dimensions: {img_width}x{img_height}")
-            except Exception as e:
-                logger.error(f"Failed to decode image: {str(e)}")
-                raise ValueError("Invalid image data provided")
+            tareas.append(guardar_imagen(payload.dataImageFile, almacen.ruta_nueva("data", image_filename), almacen.blobs_dir, perfil_webp))
 
-            image_filename = f"{uuid}.webp"
-            image_path = join(DATOS_DIR, image_filename)
-            
-            try:
-                image.save(image_path, 'webp')
-                logger.debug(f"Image saved to {image_path}")
-            except Exception as e:
-                logger.error(f"Failed to save image: {str(e)}")
-                raise ValueError(f"Could not save image: {str(e)}")
-            
-        
-
-        # Crear archivo de anotaciones YOLO
-        label_filename = f"{uuid}.txt"
-        json_filename = f"{uuid}.json"
-        label_path = join(LABELS_DIR, label_filename)
-        datos_path = join(DATOS_DIR, json_filename)
-        
-        # Save metadata
-        try:
-            with open(datos_path, "w") as f:
-                annotations_data = [ann.model_dump() for ann in payload.annotations]
-                dump(
-                    {
-                    "dia_entrada": payload.diaEntrada,
-                    "temperatura": payload.tempAmbiente, 
-                    "humedad": payload.humedad,
-                    "sala": payload.sala,
-                    "muestra": payload.muestra,
-                    "fecha": payload.fecha,
-                    "hora": payload.hora,
-                    "temp_compost": payload.tempCompost,
-                    "co2": payload.co2,
-                    "circulacion": payload.circulacion,
-                    "observaciones": payload.observaciones,
-                    "annotations": annotations_data
-                    },
-                    f,
-                    indent=4,
-                )
-            logger.debug(f"Metadata saved to {datos_path}")
-        except Exception as e:
-            logger.error(f"Failed to save metadata: {str(e)}")
-            raise ValueError(f"Could not save metadata: {str(e)}")
-
-        # Save annotations
-        valid_annotations = 0
-        skipped_annotations = 0
-        
-        try:
-            with open(label_path, "w") as f:
-                for i, ann in enumerate(payload.annotations):
-                    if len(ann.points) != 2:
-                        logger.warning(f"Skipping annotation {i+1}: expected 2 points, got {len(ann.points)}")
-                        skipped_annotations += 1
-                        continue 
-     
-                    p1, p2 = ann.points
-                    xmin = min(p1.x, p2.x)
-                    xmax = max(p1.x, p2.x)
-                    ymin = min(p1.y, p2.y)
-                    ymax = max(p1.y, p2.y)
-     
-                    # Calcular en formato YOLO (normalizado)
-                    x_center = (xmin + xmax) / (2 * img_width)
-                    y_center = (ymin + ymax) / (2 * img_height)
-                    width = (xmax - xmin) / img_width
-                    height = (ymax - ymin) / img_height
-     
-                    if width == 0 or height == 0:
-                        logger.warning(f"Skipping annotation {i+1}: zero width or height")
-                        skipped_annotations += 1
-                        continue  # evitar cajas inválidas
-     
-                    f.write(f"0 {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
-                    valid_annotations += 1
-            
-            logger.info(f"Saved {valid_annotations} valid annotations to {label_path} (skipped {skipped_annotations})")
-        except Exception as e:
-            logger.error(f"Failed to save annotations: {str(e)}")
-            raise ValueError(f"Could not save annotations: {str(e)}")
-
-        logger.info(f"Successfully processed image upload with ID: {uuid}")
-        return {
-            "message": "Imagen y anotaciones guardadas correctamente.",
-            "id": uuid,
-            "image_filename": image_filename,
-            "label_filename": label_filename,
-            "valid_annotations": valid_annotations,
-            "skipped_annotations": skipped_annotations
-        }
+        respuesta = await _guardar_muestra(uuid, payload, tareas, db)
+        # Las miniaturas se generan tras enviar la respuesta
+        background_tasks.add_task(miniaturas.generar_todas, uuid)
+        return respuesta
 
+    except HTTPException:
+        raise
+    except ImagenDuplicada as e:
+        logger.info(f"Rejected duplicated image upload: {str(e)}")
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         error_details = traceback.format_exc()
         logger.error(f"Error processing image upload: {str(e)}\n{error_details}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/upload-image/multipart/")
+async def upload_image_multipart(
+    background_tasks: BackgroundTasks,
+    annotatedImage: UploadFile = File(...),
+    dataImage: Optional[UploadFile] = File(None),
+    metadata: str = Form(...),
+    perfil: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Variante de /upload-image/ que recibe las imágenes como partes binarias en
+    lugar de base64, y los metadatos y anotaciones como una parte JSON.
+    """
+    logger.info("Received multipart image upload request")
+    perfil_webp = _perfil(perfil)
+
+    try:
+        payload = MetadatosMuestra.model_validate_json(metadata)
+    except ValidationError as e:
+        logger.error(f"Invalid metadata in multipart upload: {str(e)}")
+        raise HTTPException(status_code=422, detail="Datos de entrada inválidos")
+
+    try:
+        # Generar UUID único para la imagen/anotación
+        uuid = str(uuid4())
+        logger.debug(f"Generated UUID: {uuid}")
+
+        image_filename = f"{uuid}.webp"
+        tareas = [guardar_imagen_subida(annotatedImage, almacen.ruta_nueva("images", image_filename), almacen.blobs_dir, perfil_webp)]
+        if dataImage is not None and dataImage.filename:
+            tareas.append(guardar_imagen_subida(dataImage, almacen.ruta_nueva("data", image_filename), almacen.blobs_dir, perfil_webp))
+        respuesta = await _guardar_muestra(uuid, payload, tareas, db)
+        # Las miniaturas se generan tras enviar la respuesta
+        background_tasks.add_task(miniaturas.generar_todas, uuid)
+        return respuesta
+
+    except HTTPException:
+        raise
+    except ImagenDuplicada as e:
+        logger.info(f"Rejected duplicated image upload: {str(e)}")
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        error_details = traceback.format_exc()
+        logger.error(f"Error processing multipart image upload: {str(e)}\n{error_details}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/upload-images/batch/")
+async def upload_images_batch(
+    batch_request: BatchUploadRequest,
+    background_tasks: BackgroundTasks,
+    perfil: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Sube varias imágenes anotadas en una sola petición. Las imágenes se procesan
+    en paralelo (como mucho BATCH_CONCURRENCIA a la vez) y después se escriben
+    juntos los metadatos y etiquetas de todas. Cada elemento tiene su propio
+    resultado, así que una imagen errónea no hace fallar al resto.
+    """
+    logger.info(f"Received batch upload request with {len(batch_request.images)} images")
+    perfil_webp = _perfil(perfil)
+    semaforo = asyncio.Semaphore(BATCH_CONCURRENCIA)
+
+    async def procesar(payload: AnnotatedImage) -> Tuple[str, List[ImagenGuardada]]:
+        async with semaforo:
+            uuid = str(uuid4())
+            image_filename = f"{uuid}.webp"
+            tareas = [guardar_imagen(payload.annotatedImageFile, almacen.ruta_nueva("images", image_filename), almacen.blobs_dir, perfil_webp)]
+            if payload.dataImageFile:
+                tareas.append(guardar_imagen(payload.dataImageFile, almacen.ruta_nueva("data", image_filename), almacen.blobs_dir, perfil_webp))
+            return uuid, await _esperar_imagenes(uuid, tareas)
+
+    procesadas = await asyncio.gather(
+        *(procesar(payload) for payload in batch_request.images), return_exceptions=True
+    )
+
+    # Metadatos e imágenes de cada elemento guardado, con las anotaciones ya escaladas
+    guardadas: Dict[int, Tuple[Dict[str, Any], List[ImagenGuardada]]] = {}
+
+    def escribir_lote() -> List[Dict[str, Any]]:
+        resultados: List[Dict[str, Any]] = []
+        for index, (payload, procesada) in enumerate(zip(batch_request.images, procesadas)):
+            try:
+                if isinstance(procesada, BaseException):
+                    raise procesada
+                uuid, imagenes = procesada
+                payload = _ajustar_a_imagen(payload, imagenes)
+                resultado = _escribir_muestra(uuid, payload, imagenes)
+                guardadas[index] = (_metadatos(payload, imagenes[0].contenido), imagenes)
+                resultados.append({"index": index, "success": True, **resultado})
+            except Exception as e:
+                logger.error(f"Error processing batch item {index}: {str(e)}")
+                resultados.append({"index": index, "success": False, "error": str(e)})
+        return resultados
+
+    resultados = await run_in_threadpool(escribir_lote)
+    sin_bbdd = set(await _guardar_en_bbdd(db, {
+        resultado["id"]: guardadas[resultado["index"]][0]
+        for resultado in resultados if resultado["success"]
+    }))
+    for posicion, resultado in enumerate(resultados):
+        if resultado["success"] and resultado["id"] in sin_bbdd:
+            await run_in_threadpool(_retirar_muestra, resultado["id"], guardadas[resultado["index"]][1])
+            resultados[posicion] = {"index": resultado["index"], "success": False, "error": "Could not save sample to the database"}
+    for resultado in resultados:
+        if resultado["success"]:
+            background_tasks.add_task(miniaturas.generar_todas, resultado["id"])
+
+    fallidas = sum(1 for resultado in resultados if not resultado["success"])
+    logger.info(f"Batch upload finished: {len(resultados) - fallidas} saved, {fallidas} failed")
+    return {"processed": len(resultados), "failed": fallidas, "results": resultados}
+
 @router.get("/images/")
-async def get_images():
-    """Obtener la lista de todas las imágenes con sus datos"""
-    import os
-    import json
-    
+async def get_images(
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    orden: Literal["asc", "desc"] = "desc",
+    sala: Optional[str] = None,
+    muestra: Optional[str] = None,
+    fechaDesde: Optional[str] = None,
+    fechaHasta: Optional[str] = None,
+    diaEntrada: Optional[str] = None,
+    vista: Literal["completa", "resumen"] = "completa",
+    *,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Obtener la lista de imágenes con sus datos, ordenada por fecha y hora.
+    Sin `limit` se devuelve la lista completa; con `limit` se devuelve una página
+    con el cursor de la siguiente. La vista "resumen" omite las anotaciones.
+    El ETag sale del catálogo, así que un 304 no consulta la base de datos.
+    """
     try:
-        result = []
-        error_files = []
-        
-        # Leer todos los archivos JSON en el directorio de datos
-        for filename in os.listdir(DATOS_DIR):
-            if filename.endswith('.json'):
-                file_id = filename.split('.')[0]  # UUID sin extensión
-                
-                # Ruta del archivo JSON y la imagen correspondiente
-                json_path = join(DATOS_DIR, filename)
-                image_path = join(IMAGES_DIR, f"{file_id}.webp")
-                
-                # Verificar si la imagen existe
-                if not os.path.exists(image_path):
-                    continue
-                
-                # Cargar datos del JSON con manejo de errores
-                try:
-                    with open(json_path, 'r') as f:
-                        data = json.load(f)
-                except json.JSONDecodeError as je:
-                    # Registrar el archivo con error y continuar con el siguiente
-                    error_files.append({"file": filename, "error": str(je)})
-                    print(f"Error en archivo JSON {filename}: {je}")
-                    continue
-                
-                # Crear estructura de respuesta
-                record = {
-                    "id": file_id,
-                    "imageUrl": f"/dataset/images/{file_id}.webp",
-                    "sala": data.get("sala", ""),
-                    "muestra": data.get("muestra", ""),
-                    "fecha": data.get("fecha", ""),
-                    "hora": data.get("hora", ""),
-                    "diaEntrada": data.get("dia_entrada", ""),
-                    "tempCompost": data.get("temp_compost"),
-                    "tempAmbiente": data.get("temperatura"),
-                    "humedad": data.get("humedad"),
-                    "co2": data.get("co2"),
-                    "circulacion": data.get("circulacion"),
-                    "observaciones": data.get("observaciones"),
-                    "annotations": []
-                }
-                
-                # Procesar anotaciones
-                if "annotations" in data:
-                    for ann in data["annotations"]:
-                        if "points" in ann and len(ann["points"]) == 2:
-                            p1 = ann["points"][0]
-                            p2 = ann["points"][1]
-                            
-                            # Calcular coordenadas relativas (x, y, ancho, alto)
-                            x = min(p1["x"], p2["x"])
-                            y = min(p1["y"], p2["y"])
-                            width = abs(p2["x"] - p1["x"])
-                            height = abs(p2["y"] - p1["y"])
-                            
-                            record["annotations"].append([x, y, width, height])
-                
-                result.append(record)
-        
-        # Si hay archivos con error, incluirlo en los registros de la aplicación
-        if error_files:
-            print(f"Encontrados {len(error_files)} archivos JSON con errores: {error_files}")
-        
-        return result
+        await sincronizar_bbdd(db)
+        huella, mtime = catalogo.huella()
+        etag = calcular_etag(huella, sorted(request.query_params.multi_items()))
+        if (no_modificada := no_modificado(request, etag, mtime)) is not None:
+            return no_modificada
+
+        filas, next_cursor = await champi_service.paginar(
+            db,
+            limit=limit,
+            cursor=cursor,
+            orden=orden,
+            sala=sala,
+            muestra=muestra,
+            fecha_desde=fechaDesde,
+            fecha_hasta=fechaHasta,
+            dia_entrada=diaEntrada,
+        )
+        items = [_registro(image_id, data, vista == "resumen") for image_id, data in filas]
+        response.headers.update(cabeceras_cache(etag, mtime))
+        if limit is None:
+            return items
+        return {"items": items, "nextCursor": next_cursor}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener imágenes: {str(e)}")
 
+@router.get("/images/salas/")
+async def get_salas(db: AsyncSession = Depends(get_db)):
+    """Obtener las salas distintas presentes en el dataset"""
+    await sincronizar_bbdd(db)
+    return await champi_service.salas(db)
+
 @router.get("/images/{image_id}")
-async def get_image(image_id: str):
+async def get_image(image_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
     """Obtener los datos de una imagen específica por ID"""
-    import os
-    import json
-    
     try:
-        # Ruta del archivo JSON y la imagen
-        json_path = join(DATOS_DIR, f"{image_id}.json")
-        image_path = join(IMAGES_DIR, f"{image_id}.webp")
-        
-        # Verificar si los archivos existen
-        if not os.path.exists(json_path) or not os.path.exists(image_path):
+        await sincronizar_bbdd(db)
+        huella = await run_in_threadpool(catalogo.huella_registro, image_id)
+        if huella is None:
             raise HTTPException(status_code=404, detail=f"Imagen con ID {image_id} no encontrada")
-        
-        # Cargar datos del JSON
-        with open(json_path, 'r') as f:
-            data = json.load(f)
-        
-        # Crear estructura de respuesta
-        record = {
-            "id": image_id,
-            "imageUrl": f"/dataset/images/{image_id}.webp",
-            "sala": data.get("sala", ""),
-            "muestra": data.get("muestra", ""),
-            "fecha": data.get("fecha", ""),
-            "hora": data.get("hora", ""),
-            "tempCompost": data.get("temp_compost"),
-            "tempAmbiente": data.get("temperatura"),
-            "diaEntrada": data.get("dia_entrada", ""),
-            "humedad": data.get("humedad"),
-            "co2": data.get("co2"),
-            "circulacion": data.get("circulacion"),
-            "observaciones": data.get("observaciones"),
-            "annotations": []
-        }
-        
-        # Procesar anotaciones
-        if "annotations" in data:
-            for ann in data["annotations"]:
-                if "points" in ann and len(ann["points"]) == 2:
-                    p1 = ann["points"][0]
-                    p2 = ann["points"][1]
-                    
-                    # Calcular coordenadas relativas (x, y, ancho, alto)
-                    x = min(p1["x"], p2["x"])
-                    y = min(p1["y"], p2["y"])
-                    width = abs(p2["x"] - p1["x"])
-                    height = abs(p2["y"] - p1["y"])
-                    
-                    record["annotations"].append([x, y, width, height])
-        
-        return record
+
+        etag = calcular_etag(*huella[0])
+        if (no_modificada := no_modificado(request, etag, huella[1])) is not None:
+            return no_modificada
+        data = await champi_service.obtener(db, image_id)
+        if data is None:
+            raise HTTPException(status_code=404, detail=f"Imagen con ID {image_id} no encontrada")
+        response.headers.update(cabeceras_cache(etag, huella[1]))
+        return _registro(image_id, data)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener imagen: {str(e)}")
 
+@router.get("/miniaturas/{tamano}/{image_id}.webp")
+def get_miniatura(tamano: str, image_id: str):
+    """Obtener una miniatura o previsualización de una imagen, generándola si no existe"""
+    if tamano not in TAMANOS or catalogo.obtener(image_id) is None:
+        raise HTTPException(status_code=404, detail=f"Miniatura {tamano} de {image_id} no encontrada")
+    ruta = miniaturas.obtener(image_id, tamano)
+    if ruta is None:
+        raise HTTPException(status_code=404, detail=f"Miniatura {tamano} de {image_id} no encontrada")
+    return FileResponse(ruta, media_type="image/webp", headers={"Cache-Control": "public, max-age=86400"})
+
 @router.post("/log/")
 async def log_error(log_entry: LogEntry):
     try:
@@ -354,26 +561,7 @@ async def log_error(log_entry: LogEntry):
         logger.error(log_message)
         
         # Store in client logs file
-        log_file = join(CLIENT_LOGS_DIR, f"client_errors_{datetime.now().strftime('%Y%m%d')}.json")
-        
-        # Read existing logs or create empty list
-        try:
-            if os.path.exists(log_file):
-                with open(log_file, "r") as f:
-                    logs = json.load(f)
-            else:
-                logs = []
-        except json.JSONDecodeError:
-            # Handle corrupted log file
-            logs = []
-            logger.warning(f"Found corrupted log file: {log_file}, creating new one")
-        
-        # Add new log entry
-        logs.append(log_entry.model_dump())
-        
-        # Write back to file
-        with open(log_file, "w") as f:
-            json.dump(logs, f, indent=2)
+        await registro_cliente.escribir_async([log_entry.model_dump()])
         
         return {"success": True}
     
@@ -390,34 +578,21 @@ async def log_errors_batch(batch_request: BatchLogRequest):
         # Log to server logs
         logger.info(f"Received batch of {len(batch_request.logs)} client error logs")
         
-        # Store in client logs file
-        log_file = join(CLIENT_LOGS_DIR, f"client_errors_{datetime.now().strftime('%Y%m%d')}.json")
-        
-        # Read existing logs or create empty list
-        try:
-            if os.path.exists(log_file):
-                with open(log_file, "r") as f:
-                    logs = json.load(f)
-            else:
-                logs = []
-        except json.JSONDecodeError:
-            logs = []
-            logger.warning(f"Found corrupted log file: {log_file}, creating new one")
-        
-        # Add new log entries
         for log_entry in batch_request.logs:
-            logs.append(log_entry.model_dump())
-            
             # Also log critical errors to server logs
             if log_entry.type in ["uncaught-error", "unhandled-rejection"]:
                 logger.error(f"Critical client error: {log_entry.message}")
         
-        # Write back to file
-        with open(log_file, "w") as f:
-            json.dump(logs, f, indent=2)
+        # Store in client logs file
+        await registro_cliente.escribir_async(log_entry.model_dump() for log_entry in batch_request.logs)
         
         return {"success": True, "processed": len(batch_request.logs)}
     
     except Exception as e:
         logger.error(f"Failed to log batch of client errors: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to log errors batch")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to log errors batch")
+
+@router.get("/log/{dia}")
+def get_logs(dia: str = Path(..., pattern=r"^\d{8}$")):
+    """Obtener los logs de cliente de un día (YYYYMMDD)"""
+    return registro_cliente.leer(dia)
@@ -1,133 +1,184 @@
-from fastapi import APIRouter
-from starlette.responses import StreamingResponse
-import os
-import io
-import zipfile
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, StreamingResponse
+import asyncio
+import hashlib
 import json
-import pandas as pd
-from typing import List, Dict, Any
+import os
+from datetime import datetime, timezone
+from typing import Awaitable, Iterator, List, Dict, Any, Literal, Optional, Tuple, TypeVar
 
+from bbdd import database
+from routes.champi import almacen, cambios, catalogo, sincronizar_bbdd
+from services import champi as champi_service
+from services.almacen import CARPETAS
+from services.catalogo import CACHE_DIR
+from services.coco import coco_streaming
+from services.trabajos import Generador, GestorTrabajos, Trabajo
+from services.yolo import entradas_yolo
+from utils.ficheros import bloqueo
 from utils.logger import logger
+from utils.metricas import span
+from utils.zip_streaming import CHUNK_SIZE, Entrada, entradas_directorio, zip_streaming
 
 router = APIRouter()
 
-DATASET_DIR = "dataset"
+INFORMES_DIR = os.path.join(CACHE_DIR, "informes")
+MEDIA_TYPE_EXCEL = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Exportaciones en segundo plano: (nombre del fichero, tipo de contenido)
+EXPORTACIONES = {
+    "dataset": ("dataset_raw.zip", "application/zip"),
+    "report": ("informe_dataset.zip", "application/zip"),
+    "excel": ("dataset_anotaciones.xlsx", MEDIA_TYPE_EXCEL),
+    "yolo": ("dataset_yolo.zip", "application/zip"),
+    "coco": ("dataset_coco.json", "application/json"),
+}
+trabajos = GestorTrabajos()
+
+T = TypeVar("T")
+
+COLUMNAS_EXCEL = [
+    "nombre_archivo", "dia_entrada", "fecha", "hora", "sala", "muestra", "temperatura",
+    "humedad", "temp_compost", "co2", "circulacion", "observaciones", "estado", "comentarios",
+]
+
+
+def _fila_excel(image_id: str, data: Dict[str, Any]) -> List[Any]:
+    """Una única fila por muestra, ignorando las anotaciones."""
+    fila = {columna: data.get(columna) for columna in COLUMNAS_EXCEL}
+    fila["nombre_archivo"] = data.get("nombre") or f"{image_id}.json"
+    return [fila[columna] for columna in COLUMNAS_EXCEL]
+
 
-# (La función _generate_excel_in_memory sigue siendo la misma que en mi respuesta anterior)
-def _generate_excel_in_memory() -> io.BytesIO:
+def _en_bucle(loop: asyncio.AbstractEventLoop, corrutina: Awaitable[T]) -> T:
     """
-    Genera el fichero Excel con los metadatos de cada fichero del dataset en memoria.
-    Se ignora la información detallada de las anotaciones.
+    Ejecuta una corrutina en el event loop de la API y espera su resultado. Es
+    para los generadores de informes, que corren en hilos pero leen de la base
+    de datos, cuyo pool de conexiones pertenece a ese loop.
     """
-    logger.info("Generando datos de Excel en memoria (sin detalles de anotación).")
-    
-    processed_data: List[Dict[str, Any]] = []
-    malformed_files: List[str] = []
-    DATA_DIR = os.path.join(DATASET_DIR, "data")
+    return asyncio.run_coroutine_threadsafe(corrutina, loop).result()
 
-    if not os.path.exists(DATA_DIR):
-        logger.warning(f"El directorio de datos no se ha encontrado en: {DATA_DIR}")
-        df = pd.DataFrame([{"info": "El directorio 'data' no fue encontrado."}])
-    else:
-        for filename in os.listdir(DATA_DIR):
-            if filename.endswith(".json"):
-                file_path = os.path.join(DATA_DIR, filename)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    
-                    # Se crea una única fila por fichero, ignorando las anotaciones.
-                    row = {
-                        "nombre_archivo": data.get("nombre", filename),
-                        "dia_entrada": data.get("dia_entrada"),
-                        "fecha": data.get("fecha"),
-                        "hora": data.get("hora"),
-                        "sala": data.get("sala"),
-                        "muestra": data.get("muestra"),
-                        "temperatura": data.get("temperatura"),
-                        "humedad": data.get("humedad"),
-                        "temp_compost": data.get("temp_compost"),
-                        "co2": data.get("co2"),
-                        "circulacion": data.get("circulacion"),
-                        "observaciones": data.get("observaciones"),
-                        "estado": data.get("estado"),
-                        "comentarios": data.get("comentarios"),
-                    }
-                    processed_data.append(row)
-                            
-                except json.JSONDecodeError:
-                    logger.warning(f"Omitiendo fichero JSON mal formado: {filename}")
-                    malformed_files.append(filename)
-                except Exception as e:
-                    logger.error(f"Error procesando el fichero {filename}: {e}")
-                    malformed_files.append(filename)
-
-    df = pd.DataFrame.from_records(processed_data) if processed_data else pd.DataFrame()
-
-    excel_buffer = io.BytesIO()
-    with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name="Resumen_Muestras")
-        if malformed_files:
-            pd.DataFrame({"archivos_omitidos": malformed_files}).to_excel(writer, index=False, sheet_name="Archivos Omitidos")
-
-    excel_buffer.seek(0)
-    return excel_buffer
+
+async def _sincronizar() -> None:
+    async with database.async_session() as db:
+        await sincronizar_bbdd(db)
+
+
+async def _muestras_bbdd() -> List[Tuple[str, Dict[str, Any]]]:
+    async with database.async_session() as db:
+        return list((await champi_service.cargar_metadatos(db)).items())
+
+
+def _escribir_excel(ruta: str, muestras: List[Tuple[str, Dict[str, Any]]]):
+    """
+    Escribe el Excel con los metadatos de cada muestra. Se usa el modo
+    write-only de openpyxl, que vuelca las filas a disco según se añaden.
+    openpyxl (y NumPy, que importa si está instalado) solo se carga aquí: es
+    la mayor parte del tiempo de arranque y casi nunca se pide el Excel.
+    """
+    from openpyxl import Workbook
+
+    omitidos = catalogo.omitidos()
+    workbook = Workbook(write_only=True)
+    hoja = workbook.create_sheet("Resumen_Muestras")
+    hoja.append(COLUMNAS_EXCEL)
+    for image_id, data in muestras:
+        hoja.append(_fila_excel(image_id, data))
+    if omitidos:
+        logger.warning(f"Omitiendo {len(omitidos)} ficheros JSON mal formados del Excel")
+        hoja_omitidos = workbook.create_sheet("Archivos Omitidos")
+        hoja_omitidos.append(["archivos_omitidos"])
+        for image_id in omitidos:
+            hoja_omitidos.append([f"{image_id}.json"])
+    workbook.save(ruta)
+
+
+def _generate_excel(loop: asyncio.AbstractEventLoop) -> str:
+    """
+    Devuelve la ruta del fichero Excel con los metadatos del dataset. El fichero
+    se guarda en disco y solo se regenera cuando cambia el estado del catálogo;
+    las filas salen de la base de datos, puesta antes al día con el disco.
+    El bloqueo es de fichero para que dos workers no generen el mismo Excel a la vez.
+    Se llama desde un hilo, nunca desde el event loop `loop`.
+    """
+    _en_bucle(loop, _sincronizar())
+    huella, _ = catalogo.huella()
+    clave = hashlib.sha1(repr(huella).encode()).hexdigest()[:16]
+    ruta = os.path.join(INFORMES_DIR, f"dataset_anotaciones_{clave}.xlsx")
+
+    with bloqueo(os.path.join(INFORMES_DIR, "excel")):
+        if os.path.exists(ruta):
+            logger.info("Reutilizando el Excel de datos en caché.")
+            return ruta
+
+        logger.info("Generando el Excel de datos (sin detalles de anotación).")
+        os.makedirs(INFORMES_DIR, exist_ok=True)
+        tmp_path = f"{ruta}.{os.getpid()}.tmp"
+        with span("excel.generate"):
+            _escribir_excel(tmp_path, _en_bucle(loop, _muestras_bbdd()))
+        os.replace(tmp_path, ruta)
+
+        # Se conserva el anterior por si aún se está enviando a otro cliente
+        anteriores = sorted(
+            (os.path.join(INFORMES_DIR, f) for f in os.listdir(INFORMES_DIR) if f.endswith(".xlsx") and f != os.path.basename(ruta)),
+            key=os.path.getmtime,
+        )
+        for anterior in anteriores[:-1]:
+            try:
+                os.remove(anterior)
+            except FileNotFoundError:
+                pass
+    return ruta
 
 
 @router.get("/download/dataset", response_description="Descarga un ZIP con todo el dataset en crudo.")
 async def download_dataset():
     """
-    Crea un archivo ZIP en memoria con todo el contenido de la carpeta 'dataset'.
+    Envía en streaming un archivo ZIP con todo el contenido de la carpeta 'dataset'.
     Esta descarga está pensada para usuarios avanzados (raw data).
     """
     logger.info("Recibida petición para descargar el dataset completo (raw).")
-    zip_buffer = io.BytesIO()
+    headers = {'Content-Disposition': 'attachment; filename="dataset_raw.zip"'}
+    return StreamingResponse(
+        _registrar_fallo(zip_streaming(_entradas_raw()), "el ZIP del dataset (raw)"),
+        media_type="application/zip",
+        headers=headers,
+    )
+
+def _entradas_raw() -> Iterator[Entrada]:
+    """Las carpetas del dataset sin dataset/blobs, cuyos ficheros ya están enlazados desde ellas."""
+    for carpeta in CARPETAS:
+        yield from entradas_directorio(os.path.join(almacen.raiz, carpeta), carpeta)
+
+def _entradas_informe(loop: asyncio.AbstractEventLoop) -> Iterator[Entrada]:
+    """Entradas del ZIP de informe: el Excel de resumen y las imágenes."""
+    yield "dataset_anotaciones.xlsx", _generate_excel(loop)
+    # En el informe las imágenes van siempre en una carpeta plana
+    for filename, file_path in almacen.listar("images", ".webp"):
+        yield os.path.join("images", filename), file_path
+
+def _registrar_fallo(chunks: Iterator[bytes], descripcion: str) -> Iterator[bytes]:
+    """Registra en el log los errores ocurridos una vez iniciado el streaming."""
     try:
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(DATASET_DIR):
-                if not files and not dirs:
-                     arc_root = os.path.relpath(root, DATASET_DIR)
-                     if arc_root != ".":
-                        zipf.write(root, arc_root)
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    if "__pycache__" in file_path or file.endswith(".pyc"):
-                        continue
-                    arcname = os.path.relpath(file_path, DATASET_DIR)
-                    zipf.write(file_path, arcname)
-        zip_buffer.seek(0)
-        headers = {'Content-Disposition': 'attachment; filename="dataset_raw.zip"'}
-        return StreamingResponse(zip_buffer, media_type="application/zip", headers=headers)
+        yield from chunks
     except Exception as e:
-        logger.error(f"Fallo al crear el ZIP del dataset (raw): {e}", exc_info=True)
+        logger.error(f"Fallo al generar {descripcion}: {e}", exc_info=True)
         raise
 
 @router.get("/download/dataset/report", response_description="Descarga un ZIP con el Excel de resumen y todas las imágenes.")
 async def download_dataset_report():
     """
-    Crea un ZIP con el fichero Excel de resumen y la carpeta de imágenes.
+    Envía en streaming un ZIP con el fichero Excel de resumen y la carpeta de imágenes.
     Esta descarga está pensada para usuarios básicos.
     """
     logger.info("Recibida petición para descargar el informe (Excel + Imágenes).")
-    excel_buffer = _generate_excel_in_memory()
-    zip_buffer = io.BytesIO()
-    IMAGENES_DIR = os.path.join(DATASET_DIR, "images")
-    try:
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            zipf.writestr("dataset_anotaciones.xlsx", excel_buffer.getvalue())
-            if os.path.exists(IMAGENES_DIR):
-                for filename in os.listdir(IMAGENES_DIR):
-                    file_path = os.path.join(IMAGENES_DIR, filename)
-                    if os.path.isfile(file_path):
-                        zipf.write(file_path, os.path.join("images", filename))
-            else:
-                logger.warning(f"Directorio de imágenes no encontrado: {IMAGENES_DIR}")
-        zip_buffer.seek(0)
-        headers = {'Content-Disposition': 'attachment; filename="informe_dataset.zip"'}
-        return StreamingResponse(zip_buffer, media_type="application/zip", headers=headers)
-    except Exception as e:
-        logger.error(f"Fallo al crear el ZIP del informe: {e}", exc_info=True)
-        raise
+    headers = {'Content-Disposition': 'attachment; filename="informe_dataset.zip"'}
+    return StreamingResponse(
+        _registrar_fallo(zip_streaming(_entradas_informe(asyncio.get_running_loop())), "el ZIP del informe"),
+        media_type="application/zip",
+        headers=headers,
+    )
 
 @router.get("/download/dataset/excel", response_description="Descarga únicamente el fichero Excel con los datos procesados.")
 async def download_dataset_excel():
@@ -136,6 +187,225 @@ async def download_dataset_excel():
     (Este endpoint se mantiene por si se usa, pero no se muestra en la UI principal).
     """
     logger.info("Recibida petición para descargar únicamente el Excel de datos procesados.")
-    excel_buffer = _generate_excel_in_memory()
-    headers = {'Content-Disposition': 'attachment; filename="dataset_anotaciones.xlsx"'}
-    return StreamingResponse(excel_buffer, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers=headers)
\ No newline at end of file
+    ruta = await run_in_threadpool(_generate_excel, asyncio.get_running_loop())
+    return FileResponse(
+        ruta,
+        media_type=MEDIA_TYPE_EXCEL,
+        filename="dataset_anotaciones.xlsx",
+    )
+
+def _entradas_yolo(val: float, test: float, seed: int, estratificar: bool) -> Iterator[Entrada]:
+    catalogo.sincronizar()
+    muestras, _ = catalogo.datos()
+    yield from entradas_yolo(muestras, almacen, val, test, seed, estratificar)
+
+@router.get("/download/dataset/yolo", response_description="Descarga un ZIP con el dataset listo para entrenar con YOLO.")
+async def download_dataset_yolo(
+    val: float = Query(0.2, ge=0, le=1),
+    test: float = Query(0.0, ge=0, le=1),
+    seed: int = 42,
+    estratificar: bool = False,
+):
+    """
+    Envía en streaming un ZIP con data.yaml e images/ y labels/ repartidos en
+    train/val/test según la semilla, opcionalmente estratificado por sala.
+    Las etiquetas se recalculan a partir de los puntos guardados en los metadatos.
+    """
+    logger.info("Recibida petición para descargar el dataset en formato YOLO.")
+    if val + test >= 1:
+        raise HTTPException(status_code=400, detail="val + test debe ser menor que 1")
+    headers = {'Content-Disposition': 'attachment; filename="dataset_yolo.zip"'}
+    return StreamingResponse(
+        _registrar_fallo(zip_streaming(_entradas_yolo(val, test, seed, estratificar)), "el ZIP del dataset YOLO"),
+        media_type="application/zip",
+        headers=headers,
+    )
+
+def _coco() -> Iterator[bytes]:
+    catalogo.sincronizar()
+    muestras, _ = catalogo.datos()
+    yield from coco_streaming(muestras, almacen)
+
+@router.get("/download/dataset/coco", response_description="Descarga las anotaciones del dataset en formato COCO.")
+async def download_dataset_coco():
+    """
+    Envía en streaming el JSON COCO (images, annotations y categories) con las
+    cajas en píxeles. Las rutas de las imágenes son relativas a la carpeta 'dataset'.
+    """
+    logger.info("Recibida petición para descargar las anotaciones en formato COCO.")
+    headers = {'Content-Disposition': 'attachment; filename="dataset_coco.json"'}
+    return StreamingResponse(
+        _registrar_fallo(_coco(), "el JSON COCO"),
+        media_type="application/json",
+        headers=headers,
+    )
+
+def _cursor(since: Optional[str]) -> int:
+    """
+    Secuencia del diario de cambios a partir de la que exportar. El cursor es el
+    next_cursor de una exportación anterior o una fecha ISO 8601 (UTC si no
+    lleva zona horaria); sin cursor, o con 0, se exporta todo.
+    """
+    if not since:
+        return 0
+    if since.isdigit():
+        seq = int(since)
+    else:
+        try:
+            fecha = datetime.fromisoformat(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="since debe ser un cursor numérico o una fecha ISO 8601")
+        if fecha.tzinfo is None:
+            fecha = fecha.replace(tzinfo=timezone.utc)
+        seq = cambios.secuencia_en(fecha.timestamp())
+    if seq > cambios.ultima:
+        raise HTTPException(status_code=410, detail="El cursor es posterior al último cambio; descarga de nuevo con since=0")
+    return seq
+
+def _manifiesto(seq: int) -> Dict[str, Any]:
+    """
+    Muestras añadidas y borradas desde el cursor y el cursor de la siguiente
+    exportación. La primera exportación (seq 0) incluye todo el catálogo,
+    también lo que ya existía antes de que hubiera diario de cambios.
+    """
+    catalogo.sincronizar()
+    if seq == 0:
+        # El cursor se lee antes que el catálogo: si entra algo entre medias se
+        # vuelve a enviar en la siguiente exportación en lugar de perderse
+        siguiente = cambios.ultima
+        muestras, _ = catalogo.datos()
+        altas, bajas = [image_id for image_id, _ in muestras], []
+    else:
+        altas, bajas, siguiente = cambios.desde(seq)
+        altas = [image_id for image_id, _ in catalogo.datos_de(altas)]
+    return {
+        "since": seq,
+        "next_cursor": siguiente,
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "added": altas,
+        "deleted": bajas,
+    }
+
+def _entradas_delta(manifiesto: Dict[str, Any]) -> Iterator[Entrada]:
+    """manifest.json y los ficheros de las muestras añadidas, con las rutas del layout configurado."""
+    yield "manifest.json", json.dumps(manifiesto, indent=2).encode()
+    for image_id in manifiesto["added"]:
+        for carpeta, nombre in (
+            ("images", f"{image_id}.webp"),
+            ("labels", f"{image_id}.txt"),
+            ("data", f"{image_id}.json"),
+            ("data", f"{image_id}.webp"),
+        ):
+            ruta = almacen.localizar(carpeta, nombre)
+            if os.path.exists(ruta):
+                yield almacen.relativa(carpeta, nombre), ruta
+
+@router.get("/download/dataset/delta", response_description="Descarga un ZIP con los cambios del dataset desde un cursor.")
+async def download_dataset_delta(since: Optional[str] = None):
+    """
+    Envía en streaming un ZIP con las imágenes, etiquetas y datos de las
+    muestras añadidas desde `since` y un manifest.json con las muestras
+    borradas y el cursor (next_cursor) para pedir la siguiente exportación.
+    """
+    seq = _cursor(since)
+    manifiesto = await run_in_threadpool(_manifiesto, seq)
+    logger.info(f"Recibida petición de exportación incremental desde {seq}: {len(manifiesto['added'])} altas y {len(manifiesto['deleted'])} bajas.")
+    headers = {
+        'Content-Disposition': f'attachment; filename="dataset_delta_{seq}_{manifiesto["next_cursor"]}.zip"',
+        'X-Next-Cursor': str(manifiesto["next_cursor"]),
+    }
+    return StreamingResponse(
+        _registrar_fallo(zip_streaming(_entradas_delta(manifiesto)), "el ZIP incremental"),
+        media_type="application/zip",
+        headers=headers,
+    )
+
+@router.get("/download/dataset/delta/manifest", response_description="Devuelve solo el manifiesto de cambios desde un cursor.")
+async def download_dataset_delta_manifest(since: Optional[str] = None):
+    """
+    El manifest.json de /download/dataset/delta sin los ficheros, para saber
+    si hay cambios antes de descargarlos.
+    """
+    return await run_in_threadpool(_manifiesto, _cursor(since))
+
+def _excel_trabajo(loop: asyncio.AbstractEventLoop) -> Generador:
+    def generar(trabajo: Trabajo) -> Iterator[bytes]:
+        trabajo.total = 1
+        ruta = _generate_excel(loop)
+        trabajo.procesados = 1
+        with open(ruta, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
+    return generar
+
+def _coco_trabajo(trabajo: Trabajo) -> Iterator[bytes]:
+    catalogo.sincronizar()
+    muestras, _ = catalogo.datos()
+    yield from coco_streaming(trabajo.contar(muestras), almacen)
+
+def _generador(tipo: str, val: float, test: float, seed: int, estratificar: bool, loop: asyncio.AbstractEventLoop) -> Generador:
+    """Contenido de cada tipo de exportación, el mismo que el de su /download/*."""
+    if tipo == "dataset":
+        return lambda trabajo: zip_streaming(trabajo.contar(_entradas_raw()))
+    if tipo == "report":
+        return lambda trabajo: zip_streaming(trabajo.contar(_entradas_informe(loop)))
+    if tipo == "yolo":
+        return lambda trabajo: zip_streaming(trabajo.contar(_entradas_yolo(val, test, seed, estratificar)))
+    if tipo == "coco":
+        return _coco_trabajo
+    return _excel_trabajo(loop)
+
+def _version_dataset() -> object:
+    catalogo.sincronizar()
+    huella, _ = catalogo.huella()
+    return huella
+
+def _con_url(estado: Dict[str, Any]) -> Dict[str, Any]:
+    return {**estado, "url": f"/exports/{estado['id']}/file" if estado["status"] == "done" else None}
+
+@router.post("/exports/{tipo}", status_code=202, response_description="Encarga una exportación en segundo plano.")
+async def crear_exportacion(
+    tipo: Literal["dataset", "report", "excel", "yolo", "coco"],
+    response: Response,
+    val: float = Query(0.2, ge=0, le=1),
+    test: float = Query(0.0, ge=0, le=1),
+    seed: int = 42,
+    estratificar: bool = False,
+):
+    """
+    Encarga la misma exportación que /download/dataset/{tipo} (o /download/dataset
+    con "dataset") sin esperar a que termine. Devuelve el trabajo, cuyo progreso
+    se consulta en /exports/{id}; las peticiones iguales sobre la misma versión
+    del dataset devuelven el mismo trabajo y reutilizan su resultado.
+    """
+    if tipo == "yolo" and val + test >= 1:
+        raise HTTPException(status_code=400, detail="val + test debe ser menor que 1")
+    parametros = {"val": val, "test": test, "seed": seed, "estratificar": estratificar} if tipo == "yolo" else {}
+    fichero, media_type = EXPORTACIONES[tipo]
+    version = await run_in_threadpool(_version_dataset)
+    estado = await run_in_threadpool(
+        trabajos.enviar, tipo, parametros, version, fichero, media_type, _generador(tipo, val, test, seed, estratificar, asyncio.get_running_loop())
+    )
+    response.headers["Location"] = f"/exports/{estado['id']}"
+    return _con_url(estado)
+
+@router.get("/exports/{trabajo_id}", response_description="Estado y progreso de una exportación.")
+async def get_exportacion(trabajo_id: str):
+    """Estado (queued, running, done o failed) y progreso de una exportación encargada."""
+    estado = trabajos.estado(trabajo_id)
+    if estado is None:
+        raise HTTPException(status_code=404, detail=f"Exportación {trabajo_id} no encontrada")
+    return _con_url(estado)
+
+@router.get("/exports/{trabajo_id}/file", response_description="Descarga el resultado de una exportación terminada.")
+async def download_exportacion(trabajo_id: str):
+    """Descarga el resultado de una exportación. Devuelve 409 si aún no ha terminado."""
+    estado = trabajos.estado(trabajo_id)
+    if estado is None:
+        raise HTTPException(status_code=404, detail=f"Exportación {trabajo_id} no encontrada")
+    resultado = trabajos.resultado(trabajo_id)
+    if resultado is None:
+        if estado["status"] == "done":
+            raise HTTPException(status_code=404, detail=f"El resultado de la exportación {trabajo_id} ya se ha borrado")
+        raise HTTPException(status_code=409, detail=f"La exportación {trabajo_id} no ha terminado ({estado['status']})")
+    return FileResponse(resultado["path"], media_type=resultado["media_type"], filename=resultado["filename"])
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+from typing import Literal, Optional
+
+from routes.champi import catalogo
+from services.estadisticas import Estadisticas
+from utils.http_cache import cabeceras_cache, calcular_etag, no_modificado
+
+router = APIRouter()
+
+estadisticas = Estadisticas(catalogo)
+
+
+@router.get("/stats")
+def get_stats(
+    agrupar: Optional[Literal["sala", "muestra", "fecha", "dia"]] = None,
+    *,
+    request: Request,
+    response: Response,
+):
+    """
+    Número de muestras y de cajas, distribución del tamaño de las cajas (en
+    píxeles) y medias de temperatura, humedad, co2, temp_compost y circulacion,
+    de todo el dataset o agrupadas por sala, muestra, fecha o días desde la
+    entrada ("dia").
+    """
+    try:
+        catalogo.sincronizar()
+        huella, mtime = catalogo.huella()
+        etag = calcular_etag(huella, agrupar)
+        if (no_modificada := no_modificado(request, etag, mtime)) is not None:
+            return no_modificada
+        resultado = estadisticas.calcular(agrupar)
+        response.headers.update(cabeceras_cache(etag, mtime))
+        return resultado
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al calcular las estadísticas: {str(e)}")
@@ -0,0 +1,355 @@
+'''Ubicación en disco de los ficheros del dataset (images, labels y data)
+
+Uso: python -m services.almacen --layout fragmentado [--dataset dataset] [--workers 8]
+     python -m services.almacen --recoger [--dataset dataset]
+'''
+import argparse
+import hashlib
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from utils.ficheros import bloqueo
+from utils.http_cache import StaticFilesCacheables
+from utils.logger import logger
+
+DATASET_DIR = "dataset"
+CARPETAS = ("images", "labels", "data")
+# Contenido de las imágenes por su sha256; images/ y data/ tienen enlaces duros a estos ficheros
+BLOBS = "blobs"
+# "plano" (por defecto): dataset/images/{uuid}.webp
+# "fragmentado": dataset/images/ab/cd/{uuid}.webp, con los cuatro primeros caracteres del nombre
+ALMACEN_LAYOUT = os.environ.get("ALMACEN_LAYOUT", "plano")
+LAYOUTS = ("plano", "fragmentado")
+# Contador que se incrementa en cada escritura, compartido por todos los workers:
+# con el layout fragmentado las altas no cambian el mtime de la carpeta raíz y
+# dos escrituras seguidas pueden caer en el mismo tick de mtime
+VERSION_PATH = join("cache", "dataset.version")
+# Con el layout fragmentado los cambios hechos fuera de la API (p.ej. un JSON
+# borrado a mano) solo cambian el mtime de su subcarpeta: la marca las recorre
+# todas, como mucho una vez cada tantos segundos por proceso
+ALMACEN_INTERVALO_FRAGMENTOS = float(os.environ.get("ALMACEN_INTERVALO_FRAGMENTOS", 2))
+
+
+def _es_fragmento(nombre: str) -> bool:
+    return len(nombre) == 2 and "." not in nombre
+
+
+def ruta_blob(blobs_dir: str, sha256: str) -> str:
+    return join(blobs_dir, sha256[:2], sha256[2:4], f"{sha256}.webp")
+
+
+def _crear_si_no_existe(ruta: str, datos: bytes):
+    """Escribe el fichero solo si no existe, sin sustituir nunca uno ya creado."""
+    tmp_path = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(datos)
+    try:
+        os.link(tmp_path, ruta)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+
+
+def guardar_blob(datos: bytes, destino: str, blobs_dir: str) -> Optional[str]:
+    """
+    Guarda los bytes en el almacén por contenido y enlaza `destino` al blob, así
+    que los ficheros idénticos ocupan disco una sola vez. Devuelve su sha256, o
+    None si el sistema de ficheros no admite enlaces duros y se ha guardado una
+    copia normal. Puede ejecutarse en el pool de procesos.
+    """
+    sha256 = hashlib.sha256(datos).hexdigest()
+    blob = ruta_blob(blobs_dir, sha256)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    if not os.path.exists(blob):
+        _crear_si_no_existe(blob, datos)
+    try:
+        os.link(blob, destino)
+    except FileNotFoundError:
+        # Se ha liberado el blob entre medias: se crea de nuevo
+        _crear_si_no_existe(blob, datos)
+        os.link(blob, destino)
+    except OSError as e:
+        logger.warning(f"Hard links not supported for {destino}, storing a plain copy: {e}")
+        with open(destino, "wb") as f:
+            f.write(datos)
+        return None
+    # Si otro proceso lo ha liberado justo antes de enlazarlo, se recupera el nombre
+    if not os.path.exists(blob):
+        try:
+            os.link(destino, blob)
+        except FileExistsError:
+            pass
+    return sha256
+
+
+class Almacen:
+    """
+    Traduce (carpeta, nombre de fichero) a rutas, URLs y listados según el layout
+    configurado. Las lecturas buscan también en el otro layout, así que la API
+    sigue funcionando mientras se migra el dataset de uno a otro.
+    """
+
+    def __init__(self, raiz: str = DATASET_DIR, layout: str = ALMACEN_LAYOUT, version_path: str = VERSION_PATH):
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown storage layout {layout!r}, expected one of {LAYOUTS}")
+        self.raiz = raiz
+        self.blobs_dir = join(raiz, BLOBS)
+        self.layout = layout
+        self.version_path = version_path
+        self.intervalo_fragmentos = ALMACEN_INTERVALO_FRAGMENTOS
+        # (momento en que se recorrieron, marca de las subcarpetas)
+        self._fragmentos: Optional[Tuple[float, List[int]]] = None
+        self._lock = threading.Lock()
+        for carpeta in CARPETAS:
+            os.makedirs(join(raiz, carpeta), exist_ok=True)
+
+    def relativa(self, carpeta: str, nombre: str, layout: Optional[str] = None) -> str:
+        """Ruta relativa a la raíz del dataset, con "/" como separador."""
+        if (layout or self.layout) == "fragmentado":
+            return f"{carpeta}/{nombre[:2]}/{nombre[2:4]}/{nombre}"
+        return f"{carpeta}/{nombre}"
+
+    def ruta(self, carpeta: str, nombre: str, layout: Optional[str] = None) -> str:
+        return join(self.raiz, self.relativa(carpeta, nombre, layout))
+
+    def ruta_nueva(self, carpeta: str, nombre: str) -> str:
+        """Ruta donde escribir un fichero nuevo, creando su carpeta si hace falta."""
+        ruta = self.ruta(carpeta, nombre)
+        if self.layout == "fragmentado":
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        return ruta
+
+    def localizar(self, carpeta: str, nombre: str) -> str:
+        """
+        Ruta de un fichero existente en cualquiera de los dos layouts. Si no
+        existe en ninguno se devuelve la del layout configurado.
+        """
+        otro = LAYOUTS[1 - LAYOUTS.index(self.layout)]
+        # El layout configurado se mira dos veces por si una migración mueve el
+        # fichero justo entre las dos primeras comprobaciones
+        for layout in (self.layout, otro, self.layout):
+            ruta = self.ruta(carpeta, nombre, layout)
+            if os.path.exists(ruta):
+                return ruta
+        return self.ruta(carpeta, nombre)
+
+    def url(self, carpeta: str, nombre: str) -> str:
+        return f"/dataset/{self.relativa(carpeta, nombre)}"
+
+    def url_imagen(self, image_id: str, sha256: Optional[str] = None) -> str:
+        """
+        URL de la imagen anotada: la de su blob si se conoce el contenido, que
+        no cambia nunca, o la del fichero de la muestra en las muestras antiguas.
+        """
+        if sha256:
+            return f"/dataset/{BLOBS}/{sha256[:2]}/{sha256[2:4]}/{sha256}.webp"
+        return self.url("images", f"{image_id}.webp")
+
+    def liberar_blob(self, sha256: str):
+        """Borra el blob si ya no lo enlaza ninguna muestra."""
+        blob = ruta_blob(self.blobs_dir, sha256)
+        try:
+            if os.stat(blob).st_nlink == 1:
+                os.remove(blob)
+        except FileNotFoundError:
+            pass
+
+    def recoger_blobs(self) -> int:
+        """
+        Borra los blobs sin referencias. El número de enlaces duros de cada blob
+        es su contador de referencias: 1 significa que solo queda el propio blob.
+        """
+        borrados = 0
+        if not os.path.isdir(self.blobs_dir):
+            return 0
+        for raiz, _, ficheros in os.walk(self.blobs_dir):
+            for fichero in ficheros:
+                ruta = join(raiz, fichero)
+                if fichero.endswith(".webp") and os.stat(ruta).st_nlink == 1:
+                    os.remove(ruta)
+                    borrados += 1
+        logger.info(f"Removed {borrados} unreferenced blobs")
+        return borrados
+
+    def alternativa(self, relativa: str) -> Optional[str]:
+        """La ruta relativa equivalente en el otro layout, o None si no es un fichero del dataset."""
+        partes = relativa.strip("/").split("/")
+        if partes[0] not in CARPETAS:
+            return None
+        if len(partes) == 2:
+            return self.relativa(partes[0], partes[1], "fragmentado")
+        if len(partes) == 4 and _es_fragmento(partes[1]) and _es_fragmento(partes[2]):
+            return self.relativa(partes[0], partes[3], "plano")
+        return None
+
+    def listar(self, carpeta: str, extension: str) -> Iterator[Tuple[str, str]]:
+        """(nombre, ruta) de los ficheros de una carpeta con la extensión dada, en ambos layouts."""
+        for entrada in os.scandir(join(self.raiz, carpeta)):
+            if entrada.name.endswith(extension) and entrada.is_file():
+                yield entrada.name, entrada.path
+            elif _es_fragmento(entrada.name) and entrada.is_dir():
+                for subcarpeta in os.scandir(entrada.path):
+                    if _es_fragmento(subcarpeta.name) and subcarpeta.is_dir():
+                        for fichero in os.scandir(subcarpeta.path):
+                            if fichero.name.endswith(extension):
+                                yield fichero.name, fichero.path
+
+    def ids(self, carpeta: str, extension: str) -> Set[str]:
+        return {nombre[:-len(extension)] for nombre, _ in self.listar(carpeta, extension)}
+
+    def borrar(self, carpeta: str, nombre: str):
+        try:
+            os.remove(self.localizar(carpeta, nombre))
+        except FileNotFoundError:
+            pass
+
+    def version(self) -> int:
+        """Versión del dataset compartida por todos los procesos (0 si no se ha escrito nunca)."""
+        try:
+            with open(self.version_path, "r") as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def tocar(self) -> int:
+        """Marca que el dataset ha cambiado incrementando su versión, y la devuelve."""
+        with bloqueo(self.version_path):
+            version = self.version() + 1
+            # Se sustituye de forma atómica: quien lee sin el bloqueo nunca ve el fichero a medias
+            tmp_path = f"{self.version_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(version))
+            os.replace(tmp_path, self.version_path)
+        return version
+
+    def subcarpetas(self, carpeta: str) -> Iterator[str]:
+        """Rutas de las subcarpetas del layout fragmentado de una carpeta, las hojas antes que su padre."""
+        for entrada in os.scandir(join(self.raiz, carpeta)):
+            if _es_fragmento(entrada.name) and entrada.is_dir():
+                try:
+                    for subcarpeta in os.scandir(entrada.path):
+                        if _es_fragmento(subcarpeta.name) and subcarpeta.is_dir():
+                            yield subcarpeta.path
+                except FileNotFoundError:
+                    continue
+                yield entrada.path
+
+    def _marca_fragmentos(self) -> List[int]:
+        """
+        El mtime más reciente de las subcarpetas de datos e imágenes, cuántas hay
+        y un crc32 de todos sus mtime, que cambia aunque dos escrituras en
+        carpetas distintas caigan en el mismo tick de mtime. Se recalcula como
+        mucho cada intervalo_fragmentos segundos.
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            if self._fragmentos is not None and ahora - self._fragmentos[0] < self.intervalo_fragmentos:
+                return self._fragmentos[1]
+            reciente = total = crc = 0
+            for carpeta in ("data", "images"):
+                for ruta in self.subcarpetas(carpeta):
+                    try:
+                        mtime = os.stat(ruta).st_mtime_ns
+                    except FileNotFoundError:
+                        continue
+                    reciente = max(reciente, mtime)
+                    total += 1
+                    crc = zlib.crc32(f"{ruta} {mtime}\n".encode(), crc)
+            self._fragmentos = (ahora, [reciente, total, crc])
+            return self._fragmentos[1]
+
+    def marca(self) -> List[int]:
+        """
+        mtime de las carpetas de datos e imágenes y del fichero de versión, y la
+        versión. Con el layout fragmentado incluye también las subcarpetas.
+        """
+        marca = [os.stat(join(self.raiz, "data")).st_mtime_ns, os.stat(join(self.raiz, "images")).st_mtime_ns]
+        try:
+            marca.append(os.stat(self.version_path).st_mtime_ns)
+        except FileNotFoundError:
+            marca.append(0)
+        marca.append(self.version())
+        if self.layout == "fragmentado":
+            marca.extend(self._marca_fragmentos())
+        return marca
+
+
+class StaticFilesAlmacen(StaticFilesCacheables):
+    """
+    StaticFiles del dataset que, si un fichero no está donde indica la URL,
+    lo busca en el otro layout. Así las URLs antiguas siguen funcionando
+    durante y después de una migración.
+    """
+
+    def __init__(self, almacen: Almacen, **kwargs):
+        super().__init__(directory=almacen.raiz, **kwargs)
+        self.almacen = almacen
+
+    def lookup_path(self, path: str):
+        full_path, stat_result = super().lookup_path(path)
+        if stat_result is None:
+            alternativa = self.almacen.alternativa(path)
+            if alternativa is not None:
+                return super().lookup_path(alternativa)
+        return full_path, stat_result
+
+
+def _borrar_vacias(carpetas: Iterable[str]):
+    """Borra las carpetas que estén vacías; las que no lo están se dejan."""
+    for carpeta in list(carpetas):
+        try:
+            os.rmdir(carpeta)
+        except OSError:
+            pass
+
+
+def migrar(almacen: Almacen, workers: int) -> Dict[str, int]:
+    """
+    Mueve al layout de `almacen` los ficheros que siguen en el otro, en paralelo.
+    Cada fichero se mueve con un rename atómico, así que la API puede seguir
+    sirviendo el dataset mientras tanto. Al pasar al layout plano se borran las
+    subcarpetas que quedan vacías. Devuelve cuántos se han movido por carpeta.
+    """
+    def mover(carpeta: str, nombre: str, origen: str) -> bool:
+        destino = almacen.ruta_nueva(carpeta, nombre)
+        if os.path.abspath(origen) == os.path.abspath(destino):
+            return False
+        os.replace(origen, destino)
+        return True
+
+    movidos: Dict[str, int] = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for carpeta in CARPETAS:
+            inicio = time.perf_counter()
+            ficheros = [(nombre, ruta) for nombre, ruta in almacen.listar(carpeta, "")]
+            resultados = executor.map(lambda fichero: mover(carpeta, *fichero), ficheros)
+            movidos[carpeta] = sum(resultados)
+            if almacen.layout == "plano":
+                _borrar_vacias(almacen.subcarpetas(carpeta))
+            almacen.tocar()
+            logger.info(f"Moved {movidos[carpeta]} files of {carpeta} to the {almacen.layout} layout in {time.perf_counter() - inicio:.1f}s")
+    return movidos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra el dataset entre el layout plano y el fragmentado")
+    parser.add_argument("--layout", choices=LAYOUTS, default=ALMACEN_LAYOUT, help="layout de destino")
+    parser.add_argument("--dataset", default=DATASET_DIR, help="raíz del dataset")
+    parser.add_argument("--workers", type=int, default=8, help="hilos que mueven ficheros a la vez")
+    parser.add_argument("--recoger", action="store_true", help="solo borra los blobs sin referencias")
+    args = parser.parse_args()
+    almacen = Almacen(args.dataset, args.layout)
+    if args.recoger:
+        almacen.recoger_blobs()
+    else:
+        migrar(almacen, args.workers)
+
+
+if __name__ == "__main__":
+    main()
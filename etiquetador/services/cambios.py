@@ -0,0 +1,120 @@
+'''Diario append-only de altas y bajas del dataset, para las exportaciones incrementales'''
+import json
+import os
+import threading
+import time
+from bisect import bisect_right
+from os.path import join
+from typing import Dict, Iterable, List, Tuple
+
+from utils.ficheros import bloqueo, lineas_nuevas
+from utils.logger import logger
+
+CAMBIOS_PATH = join("cache", "cambios.jsonl")
+ALTA = "alta"
+BAJA = "baja"
+
+
+class RegistroCambios:
+    """
+    Cada alta o baja de una muestra recibe un número de secuencia creciente y se
+    añade como una línea JSON a CAMBIOS_PATH. El diario se mantiene también en
+    memoria, así que saber qué ha cambiado desde un cursor es una búsqueda
+    binaria más un recorrido de los cambios posteriores.
+
+    Con varios workers todos escriben en el mismo fichero: antes de numerar un
+    cambio se toma el bloqueo del diario y se leen las líneas añadidas por los
+    demás. Un cambio que ya es el último de su muestra no se repite, así que
+    varios workers pueden detectar la misma alta al sincronizar su catálogo.
+    """
+
+    def __init__(self, ruta: str = CAMBIOS_PATH):
+        self.ruta = ruta
+        self._secuencias: List[int] = []
+        self._fechas: List[float] = []
+        self._operaciones: List[Tuple[str, str]] = []
+        # Último cambio de cada muestra
+        self._estado: Dict[str, str] = {}
+        self._posicion = 0
+        self._inodo = 0
+        self._lock = threading.Lock()
+        with self._lock:
+            self._ponerse_al_dia()
+
+    def _ponerse_al_dia(self):
+        """Incorpora las líneas escritas por otros procesos. Requiere self._lock."""
+        lineas, self._posicion, inodo = lineas_nuevas(self.ruta, self._posicion, self._inodo)
+        if inodo != self._inodo and self._secuencias:
+            # El fichero se ha sustituido: se vuelve a leer entero
+            self._secuencias, self._fechas, self._operaciones, self._estado = [], [], [], {}
+        self._inodo = inodo
+        for linea in lineas:
+            try:
+                cambio = json.loads(linea)
+                if self._secuencias and cambio["seq"] <= self._secuencias[-1]:
+                    continue
+                self._anadir(cambio["seq"], cambio["ts"], cambio["op"], cambio["id"])
+            except (json.JSONDecodeError, KeyError) as e:
+                logger.warning(f"Skipping corrupted line in {self.ruta}: {e}")
+
+    def _anadir(self, seq: int, ts: float, op: str, image_id: str):
+        self._secuencias.append(seq)
+        self._fechas.append(ts)
+        self._operaciones.append((op, image_id))
+        self._estado[image_id] = op
+
+    @property
+    def ultima(self) -> int:
+        """Secuencia del último cambio (0 si no hay ninguno)."""
+        with self._lock:
+            self._ponerse_al_dia()
+            return self._secuencias[-1] if self._secuencias else 0
+
+    def registrar(self, op: str, ids: Iterable[str]):
+        """Añade al diario un cambio por id, con un único write."""
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock, bloqueo(self.ruta):
+            self._ponerse_al_dia()
+            seq = self._secuencias[-1] if self._secuencias else 0
+            ts = time.time()
+            lineas = []
+            for image_id in ids:
+                if self._estado.get(image_id) == op:
+                    continue
+                seq += 1
+                self._anadir(seq, ts, op, image_id)
+                lineas.append(json.dumps({"seq": seq, "ts": ts, "op": op, "id": image_id}, separators=(",", ":")) + "\n")
+            if lineas:
+                os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+                datos = "".join(lineas).encode("utf-8")
+                with open(self.ruta, "ab") as f:
+                    f.write(datos)
+                    # Con el bloqueo tomado nadie más ha escrito desde la última lectura
+                    self._posicion += len(datos)
+                    self._inodo = os.fstat(f.fileno()).st_ino
+
+    def secuencia_en(self, ts: float) -> int:
+        """Último número de secuencia registrado hasta la fecha dada (epoch)."""
+        with self._lock:
+            self._ponerse_al_dia()
+            posicion = bisect_right(self._fechas, ts)
+            return self._secuencias[posicion - 1] if posicion else 0
+
+    def desde(self, seq: int) -> Tuple[List[str], List[str], int]:
+        """
+        Ids dados de alta y de baja después de la secuencia `seq`, según su último
+        cambio (una muestra añadida y borrada después solo aparece como baja),
+        junto con la secuencia hasta la que llegan.
+        """
+        with self._lock:
+            self._ponerse_al_dia()
+            inicio = bisect_right(self._secuencias, seq)
+            ultimo: Dict[str, str] = {}
+            for op, image_id in self._operaciones[inicio:]:
+                ultimo[image_id] = op
+            hasta = self._secuencias[-1] if self._secuencias else 0
+        altas = [image_id for image_id, op in ultimo.items() if op == ALTA]
+        bajas = [image_id for image_id, op in ultimo.items() if op == BAJA]
+        return altas, bajas, max(hasta, seq)
@@ -0,0 +1,266 @@
+'''Catálogo en memoria de los metadatos del dataset'''
+import base64
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from services.almacen import Almacen
+from services.cambios import ALTA, BAJA, RegistroCambios
+from services.miniaturas import TAMANOS, url_miniatura
+from utils.logger import logger
+
+CACHE_DIR = "cache"
+
+Clave = Tuple[str, str, str]
+
+
+def formatear_registro(image_id: str, data: Dict[str, Any], image_url: str) -> Dict[str, Any]:
+    """
+    Convierte los metadatos guardados en disco al formato que devuelve la API.
+    Las anotaciones se transforman de dos puntos a [x, y, ancho, alto].
+    """
+    record = {
+        "id": image_id,
+        "imageUrl": image_url,
+        "thumbnails": {tamano: url_miniatura(image_id, tamano) for tamano in TAMANOS},
+        "sala": data.get("sala", ""),
+        "muestra": data.get("muestra", ""),
+        "fecha": data.get("fecha", ""),
+        "hora": data.get("hora", ""),
+        "diaEntrada": data.get("dia_entrada", ""),
+        "tempCompost": data.get("temp_compost"),
+        "tempAmbiente": data.get("temperatura"),
+        "humedad": data.get("humedad"),
+        "co2": data.get("co2"),
+        "circulacion": data.get("circulacion"),
+        "observaciones": data.get("observaciones"),
+        "annotations": []
+    }
+
+    # Procesar anotaciones
+    for ann in data.get("annotations") or []:
+        if "points" in ann and len(ann["points"]) == 2:
+            p1 = ann["points"][0]
+            p2 = ann["points"][1]
+
+            # Calcular coordenadas relativas (x, y, ancho, alto)
+            x = min(p1["x"], p2["x"])
+            y = min(p1["y"], p2["y"])
+            width = abs(p2["x"] - p1["x"])
+            height = abs(p2["y"] - p1["y"])
+
+            record["annotations"].append([x, y, width, height])
+
+    return record
+
+
+def resumir_registro(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Proyección reducida de un registro: sin las cajas, solo cuántas hay."""
+    resumen = {k: v for k, v in record.items() if k != "annotations"}
+    resumen["numAnnotations"] = len(record["annotations"])
+    return resumen
+
+
+def codificar_cursor(clave: Clave) -> str:
+    return base64.urlsafe_b64encode(json.dumps(clave).encode()).decode()
+
+
+def decodificar_cursor(cursor: str) -> Clave:
+    """Devuelve la clave de ordenación codificada en el cursor o lanza ValueError."""
+    try:
+        fecha, hora, image_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (str(fecha), str(hora), str(image_id))
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+class Catalogo:
+    """
+    Índice en memoria de los metadatos de cada muestra del dataset.
+
+    Se construye una vez al arrancar a partir de la base de datos y se mantiene
+    al día con las subidas de la API. Los ficheros añadidos o borrados fuera de
+    la API se detectan con la marca del almacén (mtime de los directorios de
+    datos e imágenes, y de sus subcarpetas con el layout fragmentado, y del
+    fichero de versión), de modo que solo se leen los JSON nuevos. Las altas y
+    bajas se anotan en el diario de cambios, si lo hay, y quedan pendientes de
+    pasar a la base de datos (pendientes_bbdd).
+
+    El listado, el detalle y el informe leen de la base de datos; el catálogo
+    detecta los cambios en disco, da la huella para los ETag y sirve las
+    exportaciones y las estadísticas sin consultas.
+    """
+
+    def __init__(self, almacen: Almacen, cambios: Optional[RegistroCambios] = None):
+        self.almacen = almacen
+        self.cambios = cambios
+        self.version = 0
+        self._datos: Dict[str, Dict[str, Any]] = {}
+        self._registros: Dict[str, Dict[str, Any]] = {}
+        self._estado: Optional[List[int]] = None
+        # Muestras cuyo JSON no se ha podido leer
+        self._omitidos: Set[str] = set()
+        self._lock = threading.RLock()
+        # Altas y bajas detectadas en disco que aún no se han pasado a la base de datos
+        self._altas_bbdd: Set[str] = set()
+        self._bajas_bbdd: Set[str] = set()
+
+    def _estado_dirs(self) -> List[int]:
+        return self.almacen.marca()
+
+    def desactualizado(self) -> bool:
+        return self._estado != self._estado_dirs()
+
+    def cargar(self, registros: Dict[str, Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """
+        Inicializa el catálogo con las muestras de la base de datos y lo sincroniza
+        con el disco. Devuelve las muestras que solo existían en dataset/data, para
+        que se importen a la base de datos, y los ids de la base de datos que ya no
+        están en disco, para que se borren.
+        """
+        with self._lock:
+            self._datos = dict(registros)
+            self._registros = {}
+            self._estado = None
+            self._omitidos = set()
+            self.version += 1
+            nuevos, _ = self.sincronizar()
+            # Lo que devuelve esta carga ya no queda pendiente
+            self._altas_bbdd, self._bajas_bbdd = set(), set()
+            eliminados = sorted(registros.keys() - self._datos.keys())
+            logger.info(f"Catalog loaded with {len(self._datos)} records ({len(nuevos)} only on disk, {len(eliminados)} only in the database)")
+            return {image_id: self._datos[image_id] for image_id in nuevos}, eliminados
+
+    def sincronizar(self) -> Tuple[List[str], List[str]]:
+        """
+        Incorpora los cambios hechos en disco desde la última sincronización.
+        Devuelve los ids de las muestras leídas de disco y los de las borradas.
+        """
+        with self._lock:
+            # El estado se toma antes de listar: un cambio posterior provoca otra pasada
+            estado = self._estado_dirs()
+            if estado == self._estado:
+                return [], []
+
+            json_ids = self.almacen.ids("data", ".json")
+            webp_ids = self.almacen.ids("images", ".webp")
+            ids = json_ids & webp_ids
+
+            eliminados = self._datos.keys() - ids
+            self._omitidos &= ids
+            for image_id in eliminados:
+                del self._datos[image_id]
+                self._registros.pop(image_id, None)
+
+            nuevos: List[str] = []
+            for image_id in ids - self._datos.keys():
+                json_path = self.almacen.localizar("data", f"{image_id}.json")
+                try:
+                    with open(json_path, "r") as f:
+                        self._datos[image_id] = json.load(f)
+                    self._omitidos.discard(image_id)
+                    nuevos.append(image_id)
+                except (OSError, json.JSONDecodeError) as e:
+                    self._omitidos.add(image_id)
+                    logger.warning(f"Skipping unreadable metadata file {json_path}: {e}")
+
+            self._estado = estado
+            if self.cambios is not None:
+                self.cambios.registrar(BAJA, sorted(eliminados))
+                self.cambios.registrar(ALTA, sorted(nuevos))
+            self._altas_bbdd.difference_update(eliminados)
+            self._bajas_bbdd.update(eliminados)
+            self._bajas_bbdd.difference_update(nuevos)
+            self._altas_bbdd.update(nuevos)
+            if eliminados or nuevos:
+                self.version += 1
+                logger.info(f"Catalog synced: {len(nuevos)} added, {len(eliminados)} removed")
+            return sorted(nuevos), sorted(eliminados)
+
+    def pendientes_bbdd(self) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """
+        Saca las altas (con sus metadatos) y las bajas detectadas en disco que
+        aún no se han pasado a la base de datos. Quien las saca las escribe.
+        """
+        with self._lock:
+            altas = {image_id: self._datos[image_id] for image_id in sorted(self._altas_bbdd) if image_id in self._datos}
+            bajas = sorted(self._bajas_bbdd)
+            self._altas_bbdd, self._bajas_bbdd = set(), set()
+            return altas, bajas
+
+    def registrar(self, image_id: str, data: Dict[str, Any]):
+        """Añade al catálogo una muestra recién guardada por la API."""
+        with self._lock:
+            nuevo = image_id not in self._datos
+            self._datos[image_id] = data
+            self._registros.pop(image_id, None)
+            # Una sincronización pudo leer el JSON a medio escribir y darlo por ilegible
+            self._omitidos.discard(image_id)
+            self.version += 1
+            if nuevo and self.cambios is not None:
+                self.cambios.registrar(ALTA, [image_id])
+
+    def quitar(self, image_id: str):
+        """Saca del catálogo una muestra que la API ha descartado tras registrarla."""
+        with self._lock:
+            if self._datos.pop(image_id, None) is None:
+                return
+            self._registros.pop(image_id, None)
+            self._altas_bbdd.discard(image_id)
+            self.version += 1
+            if self.cambios is not None:
+                self.cambios.registrar(BAJA, [image_id])
+
+    def obtener(self, image_id: str) -> Optional[Dict[str, Any]]:
+        """Devuelve el registro de una muestra en el formato de la API, o None."""
+        with self._lock:
+            data = self._datos.get(image_id)
+            if data is None:
+                return None
+            record = self._registros.get(image_id)
+            if record is None:
+                image_url = self.almacen.url_imagen(image_id, data.get("imagen_sha256"))
+                record = self._registros[image_id] = formatear_registro(image_id, data, image_url)
+            return record
+
+    def huella(self) -> Tuple[Tuple[object, ...], float]:
+        """
+        Identifica el estado servido por el catálogo (marca del almacén y
+        número de registros) y devuelve también su fecha de modificación en segundos.
+        """
+        with self._lock:
+            estado = tuple(self._estado or ())
+            return (estado, len(self._datos)), max(estado, default=0) / 1e9
+
+    def huella_registro(self, image_id: str) -> Optional[Tuple[Tuple[object, ...], float]]:
+        """Igual que huella() pero a partir de los ficheros de una muestra."""
+        if image_id not in self._datos:
+            return None
+        try:
+            stats = [
+                os.stat(self.almacen.localizar("data", f"{image_id}.json")),
+                os.stat(self.almacen.localizar("images", f"{image_id}.webp")),
+            ]
+        except FileNotFoundError:
+            return None
+        huella = tuple((stat.st_mtime_ns, stat.st_size) for stat in stats)
+        return (image_id, huella), max(stat.st_mtime for stat in stats)
+
+    def datos_de(self, ids: List[str]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Metadatos de las muestras indicadas que siguen en el catálogo."""
+        with self._lock:
+            return [(image_id, self._datos[image_id]) for image_id in ids if image_id in self._datos]
+
+    def datos(self) -> Tuple[List[Tuple[str, Dict[str, Any]]], List[str]]:
+        """
+        Copia de los metadatos tal y como están guardados en disco, junto con
+        los ids de las muestras cuyo JSON no se ha podido leer.
+        """
+        with self._lock:
+            return list(self._datos.items()), sorted(self._omitidos)
+
+    def omitidos(self) -> List[str]:
+        """Ids de las muestras cuyo JSON no se ha podido leer."""
+        with self._lock:
+            return sorted(self._omitidos)
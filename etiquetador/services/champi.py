@@ -1,17 +1,217 @@
 '''servicios para champi'''
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, or_, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload
-from fastapi import Depends, status
+from fastapi import Depends
 from bbdd.database import get_db
-from entidades.modelos.champi import Champi
+from entidades.modelos.champi import Anotacion, Champi
+from services.catalogo import codificar_cursor, decodificar_cursor
+from utils.logger import logger
 
 """
 Aqui van las dependencias con otras tablas
 """
 dependencias = []
 
+CAMPOS_TEXTO = ["dia_entrada", "sala", "muestra", "fecha", "hora", "observaciones", "nombre", "estado", "comentarios", "imagen_sha256"]
+CAMPOS_NUMERICOS = ["temperatura", "humedad", "temp_compost", "co2", "circulacion"]
+TAMANO_LOTE = 500
+
+
 async def get_all(db : AsyncSession = Depends(get_db)):
     champis = await db.execute(select(Champi).options(*dependencias))
     return champis.scalars()
 
+
+def _a_float(image_id: str, campo: str, valor: Any) -> Optional[float]:
+    if valor is None or valor == "":
+        return None
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        logger.warning(f"Ignoring non-numeric {campo}={valor!r} in sample {image_id}")
+        return None
+
+
+def desde_metadatos(image_id: str, metadata: Dict[str, Any]) -> Champi:
+    """Construye un Champi a partir de los metadatos guardados en dataset/data."""
+    champi = Champi(id = image_id)
+    for campo in CAMPOS_TEXTO:
+        valor = metadata.get(campo)
+        setattr(champi, campo, str(valor) if valor is not None else None)
+    for campo in CAMPOS_NUMERICOS:
+        setattr(champi, campo, _a_float(image_id, campo, metadata.get(campo)))
+
+    # Solo se guardan como cajas las anotaciones con dos puntos
+    for orden, ann in enumerate(metadata.get("annotations") or []):
+        puntos = ann.get("points") or []
+        if len(puntos) != 2:
+            continue
+        p1, p2 = puntos
+        champi.anotaciones.append(Anotacion(orden = orden, x1 = p1["x"], y1 = p1["y"], x2 = p2["x"], y2 = p2["y"]))
+    return champi
+
+
+def a_metadatos(champi: Champi) -> Dict[str, Any]:
+    """Inverso de desde_metadatos: el formato de los JSON de dataset/data."""
+    metadata: Dict[str, Any] = {campo: getattr(champi, campo) for campo in CAMPOS_TEXTO + CAMPOS_NUMERICOS}
+    metadata["annotations"] = [
+        {"points": [{"x": ann.x1, "y": ann.y1}, {"x": ann.x2, "y": ann.y2}]}
+        for ann in champi.anotaciones
+    ]
+    return metadata
+
+
+async def guardar(db: AsyncSession, muestras: Dict[str, Dict[str, Any]]):
+    """Inserta o reemplaza varias muestras en una única transacción."""
+    if not muestras:
+        return
+    ids = list(muestras)
+    await db.execute(delete(Anotacion).where(Anotacion.champi_id.in_(ids)))
+    await db.execute(delete(Champi).where(Champi.id.in_(ids)))
+    db.add_all(desde_metadatos(image_id, metadata) for image_id, metadata in muestras.items())
+    await db.commit()
+
+
+async def guardar_por_lotes(db: AsyncSession, muestras: Dict[str, Dict[str, Any]]) -> List[str]:
+    """
+    Guarda muestras por lotes. Si un lote falla (p.ej. un valor más largo que
+    su columna en Postgres, o otro worker que ha insertado la misma muestra a
+    la vez) se reintenta muestra a muestra, de modo que solo se quedan fuera las
+    erróneas. Devuelve los ids que no se han podido guardar.
+    """
+    ids = list(muestras)
+    fallidas: List[str] = []
+    for inicio in range(0, len(ids), TAMANO_LOTE):
+        lote = ids[inicio:inicio + TAMANO_LOTE]
+        try:
+            await guardar(db, {image_id: muestras[image_id] for image_id in lote})
+            continue
+        except Exception as e:
+            await db.rollback()
+            logger.warning(f"Failed to save a batch of {len(lote)} samples, retrying one by one: {str(e)}")
+        for image_id in lote:
+            try:
+                await guardar(db, {image_id: muestras[image_id]})
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"Failed to save sample {image_id}: {str(e)}")
+                fallidas.append(image_id)
+    return fallidas
+
+
+async def importar(db: AsyncSession, muestras: Dict[str, Dict[str, Any]]) -> int:
+    """Carga muestras en la base de datos por lotes. Devuelve cuántas se han importado."""
+    importadas = len(muestras) - len(await guardar_por_lotes(db, muestras))
+    logger.info(f"Imported {importadas} of {len(muestras)} samples into the database")
+    return importadas
+
+
+async def sincronizar(db: AsyncSession, nuevas: Dict[str, Dict[str, Any]], eliminadas: List[str]):
+    """
+    Pone la base de datos al día con el disco: importa las muestras que solo
+    estaban en dataset/data y borra las que ya no existen. Se usa al arrancar y
+    cuando el catálogo detecta cambios hechos fuera de la API. Un error aquí se
+    registra pero no hace fallar la petición; se reintenta en el siguiente arranque.
+    """
+    if nuevas:
+        await importar(db, nuevas)
+    if eliminadas:
+        try:
+            for inicio in range(0, len(eliminadas), TAMANO_LOTE):
+                await borrar(db, eliminadas[inicio:inicio + TAMANO_LOTE])
+            logger.info(f"Removed {len(eliminadas)} samples no longer on disk from the database")
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Failed to remove {len(eliminadas)} deleted samples from the database: {str(e)}")
+
+
+def _orden():
+    """Columnas de la clave de ordenación (fecha, hora, id), como la de los cursores."""
+    return func.coalesce(Champi.fecha, ""), func.coalesce(Champi.hora, ""), Champi.id
+
+
+def _igual(columna, valor: str):
+    """Filtro de igualdad en el que una columna vacía equivale a ""."""
+    if valor == "":
+        return or_(columna.is_(None), columna == "")
+    return columna == valor
+
+
+async def cargar_metadatos(db: AsyncSession) -> Dict[str, Dict[str, Any]]:
+    """Todas las muestras de la base de datos en el formato de dataset/data, por fecha y hora."""
+    champis = await db.execute(select(Champi).options(*dependencias).order_by(*_orden()))
+    return {champi.id: a_metadatos(champi) for champi in champis.scalars()}
+
+
+async def obtener(db: AsyncSession, image_id: str) -> Optional[Dict[str, Any]]:
+    """Metadatos de una muestra en el formato de dataset/data, o None si no existe."""
+    champi = await db.get(Champi, image_id)
+    return a_metadatos(champi) if champi is not None else None
+
+
+async def paginar(
+    db: AsyncSession,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    orden: str = "desc",
+    sala: Optional[str] = None,
+    muestra: Optional[str] = None,
+    fecha_desde: Optional[str] = None,
+    fecha_hasta: Optional[str] = None,
+    dia_entrada: Optional[str] = None,
+) -> Tuple[List[Tuple[str, Dict[str, Any]]], Optional[str]]:
+    """
+    Una página de muestras ordenadas por (fecha, hora, id) y el cursor de la
+    siguiente (None si no hay más). El cursor es la clave de la última muestra
+    devuelta, así que la paginación es estable ante nuevas subidas y borrados.
+    fecha_hasta incluye las fechas que empiezan por ella (p.ej. "2025-01").
+    """
+    clave = tuple_(*_orden())
+    consulta = select(Champi).options(*dependencias)
+    for columna, valor in ((Champi.sala, sala), (Champi.muestra, muestra), (Champi.dia_entrada, dia_entrada)):
+        if valor is not None:
+            consulta = consulta.where(_igual(columna, valor))
+    if fecha_desde:
+        consulta = consulta.where(Champi.fecha >= fecha_desde)
+    if fecha_hasta is not None:
+        consulta = consulta.where(or_(
+            Champi.fecha.is_(None), Champi.fecha <= fecha_hasta, Champi.fecha.startswith(fecha_hasta, autoescape=True),
+        ))
+    if cursor is not None:
+        posicion = tuple_(*decodificar_cursor(cursor))
+        consulta = consulta.where(clave < posicion if orden == "desc" else clave > posicion)
+    consulta = consulta.order_by(*(columna.desc() if orden == "desc" else columna for columna in _orden()))
+    if limit is not None:
+        # Una de más para saber si hay página siguiente
+        consulta = consulta.limit(limit + 1)
+
+    champis = list((await db.execute(consulta)).scalars())
+    siguiente = None
+    if limit is not None and len(champis) > limit:
+        champis = champis[:limit]
+        ultimo = champis[-1]
+        siguiente = codificar_cursor((ultimo.fecha or "", ultimo.hora or "", ultimo.id))
+    return [(champi.id, a_metadatos(champi)) for champi in champis], siguiente
+
+
+async def salas(db: AsyncSession) -> List[str]:
+    """Valores distintos de sala, con las muestras sin sala como ""."""
+    resultado = await db.execute(select(func.coalesce(Champi.sala, "")).distinct())
+    return sorted(resultado.scalars())
+
+
+async def get_ids(db: AsyncSession) -> List[str]:
+    resultado = await db.execute(select(Champi.id))
+    return list(resultado.scalars())
+
+
+async def borrar(db: AsyncSession, ids: List[str]):
+    """Elimina varias muestras y sus anotaciones en una única transacción."""
+    if not ids:
+        return
+    await db.execute(delete(Anotacion).where(Anotacion.champi_id.in_(ids)))
+    await db.execute(delete(Champi).where(Champi.id.in_(ids)))
+    await db.commit()
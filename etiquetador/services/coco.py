@@ -0,0 +1,75 @@
+'''Exportación de las anotaciones en formato COCO'''
+import json
+from tempfile import SpooledTemporaryFile
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+from services.almacen import Almacen
+from services.imagenes import dimensiones
+from services.yolo import CLASES
+from utils.logger import logger
+
+# Anotaciones que se guardan en memoria antes de pasar a un temporal en disco
+MAX_BUFFER_ANOTACIONES = 8 * 1024 * 1024  # 8MB
+CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+def coco_streaming(muestras: Iterable[Tuple[str, Dict[str, Any]]], almacen: Almacen) -> Iterator[bytes]:
+    """
+    Genera el JSON COCO en una sola pasada por las muestras. Las imágenes se
+    emiten según se recorren; las anotaciones se van escribiendo en un temporal
+    y se emiten al final, así que la memoria no crece con el número de cajas.
+    Las rutas de las imágenes son relativas a la raíz del dataset.
+    """
+    categorias = [{"id": indice + 1, "name": nombre} for indice, nombre in enumerate(CLASES)]
+    yield b'{"info":{"description":"Dataset de champinones"},"categories":'
+    yield json.dumps(categorias).encode()
+    yield b',"images":['
+
+    n_imagenes = 0
+    n_anotaciones = 0
+    with SpooledTemporaryFile(max_size=MAX_BUFFER_ANOTACIONES) as anotaciones:
+        for image_id, data in muestras:
+            try:
+                width, height = dimensiones(almacen.localizar("images", f"{image_id}.webp"))
+            except OSError as e:
+                logger.warning(f"Skipping sample {image_id} in COCO export: {e}")
+                continue
+
+            n_imagenes += 1
+            imagen = {
+                "id": n_imagenes,
+                "file_name": almacen.relativa("images", f"{image_id}.webp"),
+                "width": width,
+                "height": height,
+                "uuid": image_id,
+                "date_captured": data.get("fecha"),
+            }
+            yield (b"," if n_imagenes > 1 else b"") + json.dumps(imagen).encode()
+
+            for ann in data.get("annotations") or []:
+                pts = ann.get("points") or []
+                if len(pts) != 2:
+                    continue
+                x = min(pts[0]["x"], pts[1]["x"])
+                y = min(pts[0]["y"], pts[1]["y"])
+                w = abs(pts[1]["x"] - pts[0]["x"])
+                h = abs(pts[1]["y"] - pts[0]["y"])
+                if w == 0 or h == 0:
+                    continue
+                n_anotaciones += 1
+                anotacion = {
+                    "id": n_anotaciones,
+                    "image_id": n_imagenes,
+                    "category_id": 1,
+                    "bbox": [x, y, w, h],
+                    "area": w * h,
+                    "iscrowd": 0,
+                }
+                anotaciones.write((b"," if n_anotaciones > 1 else b"") + json.dumps(anotacion).encode())
+
+        yield b'],"annotations":['
+        anotaciones.seek(0)
+        while chunk := anotaciones.read(CHUNK_SIZE):
+            yield chunk
+    yield b"]}"
+    logger.info(f"Exported COCO dataset with {n_imagenes} images and {n_anotaciones} annotations")
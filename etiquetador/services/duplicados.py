@@ -0,0 +1,286 @@
+'''Detección de imágenes casi duplicadas mediante un hash perceptual (dHash)
+
+Uso: python -m services.duplicados [--dataset dataset] [--distancia 5] [--borrar]
+'''
+import argparse
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+from services.almacen import DATASET_DIR, Almacen
+from utils.ficheros import lineas_nuevas
+from utils.logger import logger
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+HASHES_PATH = join("cache", "hashes.txt")
+# "avisar" (por defecto) añade los posibles duplicados a la respuesta, "rechazar"
+# descarta la subida con un 409 e "ignorar" desactiva la comprobación
+DUPLICADOS = os.environ.get("DUPLICADOS", "avisar")
+# Distancia de Hamming máxima (sobre 64 bits) para considerar dos imágenes iguales
+DUPLICADOS_DISTANCIA = int(os.environ.get("DUPLICADOS_DISTANCIA", 5))
+LADO_HASH = 8
+# Las imágenes casi lisas dan un hash con casi todos los bits a 0 (o a 1) y se
+# parecerían entre sí sin ser la misma foto: por debajo de este mínimo de bits
+# de cada valor la imagen no tiene hash y no se compara
+DUPLICADOS_MIN_BITS = int(os.environ.get("DUPLICADOS_MIN_BITS", 8))
+
+
+class ImagenDuplicada(ValueError):
+    """La imagen subida es casi idéntica a otra ya guardada."""
+
+    def __init__(self, duplicados: List[Tuple[str, int]]):
+        self.duplicados = duplicados
+        ids = ", ".join(image_id for image_id, _ in duplicados)
+        super().__init__(f"Image is a likely duplicate of {ids}")
+
+
+def dhash(image: "Image.Image") -> Optional[int]:
+    """
+    Hash de diferencias de 64 bits: se reduce la imagen a 9x8 en escala de
+    grises y cada bit indica si un píxel es más claro que su vecino derecho.
+    Es estable ante recompresión, reescalado y pequeños cambios de brillo.
+    Devuelve None si la imagen es demasiado lisa (ver DUPLICADOS_MIN_BITS).
+    """
+    from PIL import Image
+
+    pequena = image.convert("L").resize((LADO_HASH + 1, LADO_HASH), Image.Resampling.BILINEAR)
+    # En modo "L" cada píxel es un byte, fila a fila
+    pixeles = pequena.tobytes()
+    valor = 0
+    for fila in range(LADO_HASH):
+        inicio = fila * (LADO_HASH + 1)
+        for columna in range(LADO_HASH):
+            valor = (valor << 1) | (pixeles[inicio + columna] > pixeles[inicio + columna + 1])
+    unos = valor.bit_count()
+    if min(unos, LADO_HASH * LADO_HASH - unos) < DUPLICADOS_MIN_BITS:
+        return None
+    return valor
+
+
+def dhash_fichero(image_path: str) -> Optional[int]:
+    from PIL import Image
+
+    try:
+        with Image.open(image_path) as image:
+            image.draft("L", (LADO_HASH * 4, LADO_HASH * 4))
+            return dhash(image)
+    except Exception as e:
+        logger.warning(f"Could not hash {image_path}: {e}")
+        return None
+
+
+def distancia(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Árbol BK sobre la distancia de Hamming. Cada hijo cuelga de su padre según
+    la distancia entre ambos, así que una búsqueda con radio r solo recorre las
+    ramas con distancia en [d - r, d + r] en lugar de comparar con todo el índice.
+    """
+
+    def __init__(self):
+        # Nodo: (hash, ids con ese hash, hijos por distancia)
+        self._raiz: Optional[Tuple[int, List[str], Dict[int, tuple]]] = None
+        self._total = 0
+
+    def __len__(self) -> int:
+        return self._total
+
+    def agregar(self, valor: int, image_id: str):
+        self._total += 1
+        if self._raiz is None:
+            self._raiz = (valor, [image_id], {})
+            return
+        nodo = self._raiz
+        while True:
+            d = distancia(valor, nodo[0])
+            if d == 0:
+                nodo[1].append(image_id)
+                return
+            hijo = nodo[2].get(d)
+            if hijo is None:
+                nodo[2][d] = (valor, [image_id], {})
+                return
+            nodo = hijo
+
+    def buscar(self, valor: int, radio: int) -> List[Tuple[str, int]]:
+        """Ids a distancia <= radio, de más a menos parecido."""
+        encontrados: List[Tuple[str, int]] = []
+        pendientes = [self._raiz] if self._raiz is not None else []
+        while pendientes:
+            nodo = pendientes.pop()
+            d = distancia(valor, nodo[0])
+            if d <= radio:
+                encontrados.extend((image_id, d) for image_id in nodo[1])
+            for d_hijo, hijo in nodo[2].items():
+                if d - radio <= d_hijo <= d + radio:
+                    pendientes.append(hijo)
+        encontrados.sort(key=lambda encontrado: encontrado[1])
+        return encontrados
+
+
+class IndiceHashes:
+    """
+    Índice persistente de hashes perceptuales. Se guarda en un fichero de texto
+    append-only con una línea "<id> <hash hex>" por imagen y el árbol BK se
+    reconstruye al cargarlo por primera vez. Antes de cada consulta se leen las
+    líneas que hayan añadido otros workers; si el fichero se ha reescrito
+    (python -m services.duplicados) se vuelve a cargar entero.
+    """
+
+    def __init__(self, ruta: str = HASHES_PATH):
+        self.ruta = ruta
+        self._arbol: Optional[BKTree] = None
+        self._hashes: Dict[str, int] = {}
+        self._posicion = 0
+        self._inodo = 0
+        self._lock = threading.Lock()
+
+    def _cargar(self) -> BKTree:
+        lineas, self._posicion, inodo = lineas_nuevas(self.ruta, self._posicion, self._inodo)
+        if self._arbol is None or inodo != self._inodo:
+            primera_carga = self._arbol is None
+            self._arbol = BKTree()
+            self._hashes = {}
+        else:
+            primera_carga = False
+        self._inodo = inodo
+        for numero, linea in enumerate(lineas, start=1):
+            try:
+                image_id, valor = linea.split()
+                valor = int(valor, 16)
+            except ValueError:
+                logger.warning(f"Skipping corrupted line {numero} in {self.ruta}")
+                continue
+            # Las líneas escritas por este mismo proceso ya están en el árbol
+            if self._hashes.get(image_id) != valor:
+                self._hashes[image_id] = valor
+                self._arbol.agregar(valor, image_id)
+        if primera_carga:
+            logger.info(f"Loaded {len(self._hashes)} perceptual hashes from {self.ruta}")
+        return self._arbol
+
+    def buscar(self, valor: int, radio: int = DUPLICADOS_DISTANCIA) -> List[Tuple[str, int]]:
+        with self._lock:
+            return self._cargar().buscar(valor, radio)
+
+    def agregar(self, image_id: str, valor: int):
+        with self._lock:
+            self._cargar().agregar(valor, image_id)
+            self._hashes[image_id] = valor
+            os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+            with open(self.ruta, "a") as f:
+                f.write(f"{image_id} {valor:016x}\n")
+
+    def reemplazar(self, hashes: Dict[str, int]):
+        """Sustituye todo el índice (y su fichero) por los hashes dados."""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+            tmp_path = f"{self.ruta}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.writelines(f"{image_id} {valor:016x}\n" for image_id, valor in hashes.items())
+            os.replace(tmp_path, self.ruta)
+            self._hashes = {}
+            self._arbol = None
+            self._posicion = self._inodo = 0
+
+
+def _grupos(hashes: Dict[str, int], radio: int, orden: List[str]) -> Iterator[List[Tuple[str, int]]]:
+    """
+    Agrupa las imágenes casi iguales. Cada grupo empieza por la imagen que se
+    conserva (la primera según orden) seguida de sus duplicados y su distancia.
+    """
+    arbol = BKTree()
+    for image_id in orden:
+        arbol.agregar(hashes[image_id], image_id)
+    asignadas = set()
+    for image_id in orden:
+        if image_id in asignadas:
+            continue
+        duplicados = [
+            (otro, d) for otro, d in arbol.buscar(hashes[image_id], radio)
+            if otro != image_id and otro not in asignadas
+        ]
+        asignadas.add(image_id)
+        if duplicados:
+            asignadas.update(otro for otro, _ in duplicados)
+            yield [(image_id, 0)] + duplicados
+
+
+def _borrar_muestras(ids: List[str], almacen: Almacen):
+    from bbdd import database
+    from services import champi as champi_service
+
+    for image_id in ids:
+        almacen.borrar("images", f"{image_id}.webp")
+        almacen.borrar("labels", f"{image_id}.txt")
+        almacen.borrar("data", f"{image_id}.json")
+        almacen.borrar("data", f"{image_id}.webp")
+    almacen.recoger_blobs()
+    almacen.tocar()
+
+    async def borrar_de_bbdd():
+        await database.crear_tablas()
+        try:
+            async with database.async_session() as db:
+                await champi_service.borrar(db, ids)
+        finally:
+            await database.cerrar()
+
+    asyncio.run(borrar_de_bbdd())
+
+
+def _fecha_muestra(almacen: Almacen, image_id: str, ruta_imagen: str) -> float:
+    """mtime del JSON de metadatos de una muestra, o el de su imagen si no lo tiene."""
+    try:
+        return os.stat(almacen.localizar("data", f"{image_id}.json")).st_mtime
+    except FileNotFoundError:
+        return os.stat(ruta_imagen).st_mtime
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Busca (y opcionalmente borra) imágenes casi duplicadas del dataset")
+    parser.add_argument("--dataset", default=DATASET_DIR, help="raíz del dataset")
+    parser.add_argument("--distancia", type=int, default=DUPLICADOS_DISTANCIA, help="distancia de Hamming máxima")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="procesos para calcular los hashes")
+    parser.add_argument("--borrar", action="store_true", help="borra los duplicados conservando la imagen más antigua")
+    args = parser.parse_args()
+    almacen = Almacen(args.dataset)
+
+    rutas = {nombre[:-len(".webp")]: ruta for nombre, ruta in almacen.listar("images", ".webp")}
+    # Se conserva siempre la muestra más antigua de cada grupo. La fecha es la de
+    # su JSON de metadatos: las imágenes iguales son enlaces duros al mismo blob
+    # y comparten mtime
+    mtimes = {image_id: _fecha_muestra(almacen, image_id, ruta) for image_id, ruta in rutas.items()}
+    orden = sorted(rutas, key=lambda image_id: (mtimes[image_id], image_id))
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        valores = executor.map(dhash_fichero, (rutas[image_id] for image_id in orden), chunksize=64)
+        hashes = {image_id: valor for image_id, valor in zip(orden, valores) if valor is not None}
+    orden = [image_id for image_id in orden if image_id in hashes]
+    logger.info(f"Hashed {len(hashes)} images with {args.workers} workers")
+
+    repetidas: List[str] = []
+    for grupo in _grupos(hashes, args.distancia, orden):
+        original = grupo[0][0]
+        for image_id, d in grupo[1:]:
+            print(f"{image_id} duplica a {original} (distancia {d})")
+            repetidas.append(image_id)
+    logger.info(f"Found {len(repetidas)} likely duplicates")
+
+    if args.borrar and repetidas:
+        _borrar_muestras(repetidas, almacen)
+        for image_id in repetidas:
+            hashes.pop(image_id, None)
+        logger.info(f"Deleted {len(repetidas)} duplicated samples")
+    IndiceHashes().reemplazar(hashes)
+
+
+if __name__ == "__main__":
+    main()
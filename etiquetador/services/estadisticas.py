@@ -0,0 +1,175 @@
+'''Estadísticas agregadas del dataset para los paneles de las salas de cultivo'''
+import threading
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.catalogo import Catalogo
+
+VARIABLES = ("temperatura", "humedad", "co2", "temp_compost", "circulacion")
+AGRUPACIONES = ("sala", "muestra", "fecha", "dia")
+# Límites del histograma del tamaño de las cajas: raíz del área en píxeles
+BINS_TAMANO = (0, 16, 32, 64, 128, 256, 512, 1024)
+PERCENTILES = (10, 50, 90)
+
+
+def _numero(valor: Any) -> float:
+    try:
+        return float(valor) if valor is not None else float("nan")
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _dias_desde_entrada(data: Dict[str, Any]) -> Optional[int]:
+    try:
+        return (date.fromisoformat(str(data["fecha"])) - date.fromisoformat(str(data["dia_entrada"]))).days
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class Estadisticas:
+    """
+    Copia columnar (arrays de NumPy) de los metadatos del catálogo, con una fila
+    por muestra y otra tabla con una fila por caja. Se reconstruye solo cuando
+    cambia la versión del catálogo; cada consulta agrupa con np.unique y
+    np.bincount sobre las columnas, y su resultado se guarda hasta el siguiente
+    cambio.
+    """
+
+    def __init__(self, catalogo: Catalogo):
+        self.catalogo = catalogo
+        self._version = -1
+        self._columnas: Dict[str, Any] = {}
+        self._resultados: Dict[Optional[str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _construir(self, muestras: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        import numpy as np
+
+        claves: Dict[str, List[Any]] = {"sala": [], "muestra": [], "fecha": [], "dia": []}
+        variables: Dict[str, List[float]] = {variable: [] for variable in VARIABLES}
+        cajas: List[Tuple[float, float, float, float]] = []
+        duenos: List[int] = []
+        for indice, (_, data) in enumerate(muestras):
+            claves["sala"].append(data.get("sala"))
+            claves["muestra"].append(data.get("muestra"))
+            claves["fecha"].append(data.get("fecha"))
+            claves["dia"].append(_dias_desde_entrada(data))
+            for variable in VARIABLES:
+                variables[variable].append(_numero(data.get(variable)))
+            for ann in data.get("annotations") or []:
+                pts = ann.get("points") or []
+                if len(pts) == 2:
+                    cajas.append((pts[0]["x"], pts[0]["y"], pts[1]["x"], pts[1]["y"]))
+                    duenos.append(indice)
+
+        puntos = np.asarray(cajas, dtype=np.float64).reshape(-1, 4)
+        anchos = np.abs(puntos[:, 2] - puntos[:, 0])
+        altos = np.abs(puntos[:, 3] - puntos[:, 1])
+        validas = (anchos > 0) & (altos > 0)
+        return {
+            "muestras": len(muestras),
+            # Las claves se guardan como texto (None para los valores que faltan)
+            "claves": {
+                nombre: np.asarray([None if v is None else str(v) for v in valores], dtype=object)
+                for nombre, valores in claves.items()
+            },
+            "dias": np.asarray([np.nan if d is None else d for d in claves["dia"]], dtype=np.float64),
+            "variables": {variable: np.asarray(valores, dtype=np.float64) for variable, valores in variables.items()},
+            "duenos": np.asarray(duenos, dtype=np.int64)[validas],
+            "anchos": anchos[validas],
+            "altos": altos[validas],
+        }
+
+    def _al_dia(self) -> Dict[str, Any]:
+        """Columnas de la versión actual del catálogo. Requiere self._lock."""
+        version = self.catalogo.version
+        if version != self._version:
+            muestras, _ = self.catalogo.datos()
+            self._columnas = self._construir(muestras)
+            self._resultados = {}
+            self._version = version
+        return self._columnas
+
+    def calcular(self, agrupar: Optional[str] = None) -> Dict[str, Any]:
+        """Estadísticas de todo el dataset, o de cada grupo si se indica `agrupar`."""
+        if agrupar is not None and agrupar not in AGRUPACIONES:
+            raise ValueError(f"Unknown grouping {agrupar!r}, expected one of {', '.join(AGRUPACIONES)}")
+        with self._lock:
+            columnas = self._al_dia()
+            if agrupar not in self._resultados:
+                self._resultados[agrupar] = self._agregar(columnas, agrupar)
+            return self._resultados[agrupar]
+
+    def _agregar(self, columnas: Dict[str, Any], agrupar: Optional[str]) -> Dict[str, Any]:
+        import numpy as np
+
+        n = columnas["muestras"]
+        if agrupar is None:
+            claves: List[Any] = [None]
+            grupo = np.zeros(n, dtype=np.int64)
+        elif agrupar == "dia":
+            # Orden numérico de los días, con las muestras sin fechas al final
+            dias = columnas["dias"]
+            validos = np.unique(dias[~np.isnan(dias)])
+            claves = [int(d) for d in validos]
+            grupo = np.searchsorted(validos, dias)
+            if np.isnan(dias).any():
+                claves.append(None)
+        else:
+            valores = columnas["claves"][agrupar]
+            # np.unique no ordena None junto a texto: los que faltan se agrupan aparte
+            presentes = np.asarray([v is not None for v in valores], dtype=bool)
+            unicos, inversa = np.unique(valores[presentes].astype(str), return_inverse=True)
+            claves = unicos.tolist()
+            grupo = np.full(n, len(claves), dtype=np.int64)
+            grupo[presentes] = inversa
+            if not presentes.all():
+                claves.append(None)
+        total_grupos = len(claves)
+
+        muestras = np.bincount(grupo, minlength=total_grupos)
+        medias: Dict[str, Any] = {}
+        for variable, valores in columnas["variables"].items():
+            con_valor = ~np.isnan(valores)
+            sumas = np.bincount(grupo[con_valor], weights=valores[con_valor], minlength=total_grupos)
+            cuentas = np.bincount(grupo[con_valor], minlength=total_grupos)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                medias[variable] = sumas / cuentas
+
+        grupo_caja = grupo[columnas["duenos"]]
+        cajas = np.bincount(grupo_caja, minlength=total_grupos)
+        lado = np.sqrt(columnas["anchos"] * columnas["altos"])
+        bins = np.digitize(lado, BINS_TAMANO[1:])
+        histograma = np.bincount(grupo_caja * len(BINS_TAMANO) + bins, minlength=total_grupos * len(BINS_TAMANO))
+        histograma = histograma.reshape(total_grupos, len(BINS_TAMANO))
+        # Cajas ordenadas por grupo para calcular los percentiles de cada uno en su tramo
+        orden = np.argsort(grupo_caja, kind="stable")
+        limites = np.concatenate(([0], np.cumsum(cajas)))
+
+        def percentiles(valores, g: int) -> Optional[Dict[str, float]]:
+            tramo = valores[orden[limites[g]:limites[g + 1]]]
+            if not len(tramo):
+                return None
+            resultado = {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(tramo, PERCENTILES))}
+            resultado["mean"] = round(float(tramo.mean()), 2)
+            return resultado
+
+        def redondear(valor: float) -> Optional[float]:
+            return None if np.isnan(valor) else round(float(valor), 3)
+
+        etiquetas = [f"{a}-{b}" for a, b in zip(BINS_TAMANO, BINS_TAMANO[1:])] + [f"{BINS_TAMANO[-1]}+"]
+        grupos = []
+        for g, clave in enumerate(claves):
+            grupos.append({
+                "key": clave,
+                "samples": int(muestras[g]),
+                "boxes": int(cajas[g]),
+                "boxes_per_sample": round(float(cajas[g] / muestras[g]), 3) if muestras[g] else None,
+                "averages": {variable: redondear(medias[variable][g]) for variable in VARIABLES},
+                "box_size": {
+                    "width": percentiles(columnas["anchos"], g),
+                    "height": percentiles(columnas["altos"], g),
+                    "histogram": dict(zip(etiquetas, histograma[g].tolist())),
+                },
+            })
+        return {"group_by": agrupar, "samples": n, "boxes": int(len(grupo_caja)), "groups": grupos}
@@ -0,0 +1,277 @@
+'''Procesado de imágenes en un pool de workers, fuera del event loop'''
+import asyncio
+import base64
+import io
+import os
+import shutil
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from tempfile import NamedTemporaryFile
+from typing import IO, Dict, NamedTuple, Optional, Tuple, Union
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from services.almacen import guardar_blob
+from services.duplicados import DUPLICADOS, dhash, dhash_fichero
+from utils.logger import logger
+
+# "thread" (por defecto, Pillow libera el GIL al decodificar/codificar) o "process"
+IMAGE_POOL = os.environ.get("IMAGE_POOL", "thread")
+# Por defecto los núcleos se reparten entre los workers de uvicorn (WEB_CONCURRENCY)
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", max((os.cpu_count() or 1) // WEB_CONCURRENCY, 1)))
+
+CHUNK_SIZE = 1024 * 1024  # 1MB
+
+_executor: Optional[Executor] = None
+
+
+class ImagenGuardada(NamedTuple):
+    width: int
+    height: int
+    # None si no se ha calculado (WebP guardado tal cual con DUPLICADOS=ignorar)
+    dhash: Optional[int]
+    # sha256 del WebP guardado en el almacén por contenido (None sin enlaces duros)
+    contenido: Optional[str]
+    # Segundos de cada fase (decode, convert, encode, write, hash); se miden en el pool
+    # y se registran en el proceso principal, así también valen con IMAGE_POOL=process
+    tiempos: Dict[str, float]
+    # Tamaño guardado / tamaño recibido en cada eje, menor que 1 si el perfil ha
+    # reducido la imagen. Van por separado porque el redondeo de thumbnail no
+    # conserva exactamente la proporción
+    escala_x: float = 1.0
+    escala_y: float = 1.0
+
+
+def get_executor() -> Executor:
+    """Devuelve el pool de procesado de imágenes, creándolo en el primer uso."""
+    global _executor
+    if _executor is None:
+        if IMAGE_POOL == "process":
+            _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="imagenes")
+        logger.info(f"Image pool started: {IMAGE_POOL} with {IMAGE_WORKERS} workers")
+    return _executor
+
+
+def cerrar():
+    """Cierra el pool esperando a que terminen las imágenes en curso."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def dimensiones(image_path: str) -> Tuple[int, int]:
+    """Ancho y alto de una imagen leyendo solo su cabecera, sin decodificar los píxeles."""
+    from PIL import Image
+
+    with Image.open(image_path) as image:
+        return image.size
+
+
+class PerfilWebP(NamedTuple):
+    """Parámetros de codificación WebP de las imágenes guardadas."""
+    quality: int
+    # 0 (más rápido) a 6 (más lento y ficheros más pequeños)
+    method: int
+    lossless: bool = False
+    # Lado mayor en píxeles; las imágenes más grandes se reducen al guardarlas
+    lado_max: Optional[int] = None
+
+
+PERFILES = {
+    # Para fotos grandes del móvil: reduce a 2048px y codifica con el método más rápido
+    "rapido": PerfilWebP(quality=75, method=0, lado_max=2048),
+    # Los valores por defecto de Pillow, sin reducir la resolución
+    "equilibrado": PerfilWebP(quality=80, method=4),
+    "compacto": PerfilWebP(quality=70, method=6, lado_max=2048),
+    "sin_perdida": PerfilWebP(quality=80, method=4, lossless=True),
+}
+# Perfil por defecto del despliegue; cada subida puede pedir otro con ?perfil=
+WEBP_PERFIL = os.environ.get("WEBP_PERFIL", "equilibrado")
+
+
+def obtener_perfil(nombre: Optional[str] = None) -> PerfilWebP:
+    """Perfil por su nombre, o el del despliegue si no se indica."""
+    nombre = nombre or WEBP_PERFIL
+    try:
+        return PERFILES[nombre]
+    except KeyError:
+        raise ValueError(f"Unknown WebP profile {nombre!r}, expected one of {', '.join(PERFILES)}") from None
+
+
+def codificar(image, perfil: PerfilWebP) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "webp", quality=perfil.quality, method=perfil.method, lossless=perfil.lossless)
+    return buffer.getvalue()
+
+
+def _leer(fuente: Union[str, IO[bytes]], limite: int = -1) -> bytes:
+    """Los primeros `limite` bytes (todos con -1), dejando un fichero abierto al principio."""
+    if isinstance(fuente, str):
+        with open(fuente, "rb") as f:
+            return f.read(limite)
+    fuente.seek(0)
+    datos = fuente.read(limite)
+    fuente.seek(0)
+    return datos
+
+
+def _cumple_perfil(fuente: Union[str, IO[bytes]], perfil: PerfilWebP) -> Optional[Tuple[int, int]]:
+    """
+    Dimensiones de la imagen si ya es un WebP que se puede guardar tal cual con
+    el perfil, leyendo solo la cabecera: lossy (VP8) o lossless (VP8L) según el
+    perfil, sin canal alfa (ni VP8X ni VP8L con alfa) ni animación, y dentro
+    del lado máximo. La
+    calidad de un WebP no se puede leer de la cabecera, así que se respeta la
+    que haya elegido el cliente.
+    """
+    cabecera = _leer(fuente, 16)
+    if cabecera[:4] != b"RIFF" or cabecera[8:12] != b"WEBP":
+        return None
+    if cabecera[12:16] != (b"VP8L" if perfil.lossless else b"VP8 "):
+        return None
+    from PIL import Image
+
+    try:
+        with Image.open(fuente) as image:
+            size, modo = image.size, image.mode
+    except Exception:
+        return None
+    finally:
+        if not isinstance(fuente, str):
+            fuente.seek(0)
+    # Lo que se recodifica se guarda en RGB: un WebP con alfa tampoco cumple
+    if modo != "RGB" or min(size) <= 0:
+        return None
+    if perfil.lado_max and max(size) > perfil.lado_max:
+        return None
+    return size
+
+
+def _guardar_tal_cual(
+    datos: bytes,
+    size: Tuple[int, int],
+    image_path: str,
+    blobs_dir: str,
+    tiempos: Dict[str, float],
+) -> ImagenGuardada:
+    """Guarda un WebP que ya cumple el perfil sin decodificarlo ni recodificarlo."""
+    inicio = time.perf_counter()
+    try:
+        contenido = guardar_blob(datos, image_path, blobs_dir)
+    except Exception as e:
+        raise ValueError(f"Could not save image: {str(e)}")
+    escrita = time.perf_counter()
+    tiempos["write"] = escrita - inicio
+    valor = None
+    # Solo el hash perceptual necesita los píxeles
+    if DUPLICADOS != "ignorar":
+        valor = dhash_fichero(image_path)
+        tiempos["hash"] = time.perf_counter() - escrita
+    return ImagenGuardada(*size, valor, contenido, tiempos)
+
+
+def _convertir_y_guardar(
+    fuente: Union[str, IO[bytes]],
+    image_path: str,
+    blobs_dir: str,
+    tiempos: Optional[Dict[str, float]] = None,
+    perfil: Optional[PerfilWebP] = None,
+) -> ImagenGuardada:
+    """
+    Abre una imagen (ruta o fichero), la convierte a RGB y la guarda en WebP con
+    el perfil dado en el almacén por contenido, enlazada desde image_path. Los
+    WebP que ya cumplen el perfil se guardan sin recodificar. Devuelve sus
+    dimensiones, sus hashes, la escala aplicada y lo que ha tardado cada fase.
+    """
+    # Pillow se importa en el primer uso (aquí, en el worker) y no al arrancar la API
+    from PIL import Image
+
+    perfil = perfil or obtener_perfil()
+    tiempos = {} if tiempos is None else tiempos
+    inicio = time.perf_counter()
+    size = _cumple_perfil(fuente, perfil)
+    if size is not None:
+        datos = _leer(fuente)
+        tiempos["decode"] = tiempos.get("decode", 0.0) + time.perf_counter() - inicio
+        return _guardar_tal_cual(datos, size, image_path, blobs_dir, tiempos)
+
+    try:
+        image = Image.open(fuente)
+        original = image.size
+        if perfil.lado_max and max(original) > perfil.lado_max:
+            # En JPEG el decodificador ya reduce (1/2, 1/4, 1/8) sin leer todos los píxeles
+            image.draft("RGB", (perfil.lado_max, perfil.lado_max))
+        image.load()
+        decodificada = time.perf_counter()
+        image = image.convert("RGB")
+        if perfil.lado_max and max(image.size) > perfil.lado_max:
+            image.thumbnail((perfil.lado_max, perfil.lado_max), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    except Exception as e:
+        raise ValueError("Invalid image data provided") from e
+    convertida = time.perf_counter()
+    tiempos["decode"] = tiempos.get("decode", 0.0) + decodificada - inicio
+    tiempos["convert"] = convertida - decodificada
+
+    try:
+        webp = codificar(image, perfil)
+        codificada = time.perf_counter()
+        contenido = guardar_blob(webp, image_path, blobs_dir)
+    except Exception as e:
+        raise ValueError(f"Could not save image: {str(e)}")
+    escrita = time.perf_counter()
+    tiempos["encode"] = codificada - convertida
+    tiempos["write"] = escrita - codificada
+
+    valor = dhash(image)
+    tiempos["hash"] = time.perf_counter() - escrita
+    return ImagenGuardada(*image.size, valor, contenido, tiempos, image.width / original[0], image.height / original[1])
+
+
+def guardar_imagen_base64(image_b64: str, image_path: str, blobs_dir: str, perfil: Optional[PerfilWebP] = None) -> ImagenGuardada:
+    """
+    Decodifica una imagen en base64, la convierte a RGB y la guarda en WebP.
+    Devuelve sus dimensiones y su hash perceptual. Se ejecuta dentro del pool.
+    """
+    inicio = time.perf_counter()
+    try:
+        image_data = base64.b64decode(image_b64)
+    except Exception as e:
+        raise ValueError("Invalid image data provided") from e
+    # La decodificación incluye la del base64
+    tiempos = {"decode": time.perf_counter() - inicio}
+    return _convertir_y_guardar(io.BytesIO(image_data), image_path, blobs_dir, tiempos, perfil)
+
+
+async def guardar_imagen(image_b64: str, image_path: str, blobs_dir: str, perfil: Optional[PerfilWebP] = None) -> ImagenGuardada:
+    """Ejecuta guardar_imagen_base64 en el pool sin bloquear el event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), guardar_imagen_base64, image_b64, image_path, blobs_dir, perfil)
+
+
+def _volcar(fuente: IO[bytes]) -> str:
+    """Copia una subida a un fichero temporal con nombre, para pasarlo a otro proceso."""
+    with NamedTemporaryFile(delete=False) as tmp:
+        shutil.copyfileobj(fuente, tmp, CHUNK_SIZE)
+    return tmp.name
+
+
+async def guardar_imagen_subida(upload: UploadFile, image_path: str, blobs_dir: str, perfil: Optional[PerfilWebP] = None) -> ImagenGuardada:
+    """
+    Procesa en el pool una imagen recibida como parte multipart. Starlette ya la
+    ha volcado a un fichero temporal, así que se lee de ahí sin copiarla en memoria.
+    """
+    loop = asyncio.get_running_loop()
+    upload.file.seek(0)
+    if IMAGE_POOL != "process":
+        return await loop.run_in_executor(get_executor(), _convertir_y_guardar, upload.file, image_path, blobs_dir, None, perfil)
+
+    tmp_path = await run_in_threadpool(_volcar, upload.file)
+    try:
+        return await loop.run_in_executor(get_executor(), _convertir_y_guardar, tmp_path, image_path, blobs_dir, None, perfil)
+    finally:
+        os.remove(tmp_path)
@@ -0,0 +1,120 @@
+'''Almacén append-only de los logs de error enviados por el cliente'''
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from os.path import join
+from typing import Any, Dict, Iterable, List
+
+from utils.ficheros import bloqueo
+from utils.logger import logger
+
+CLIENT_LOGS_DIR = "logs/client"
+FLUSH_BYTES = 64 * 1024  # 64KB
+FLUSH_SEGUNDOS = 2.0
+
+
+class RegistroCliente:
+    """
+    Escritor único y con buffer de los logs de cliente. Cada entrada se guarda
+    como una línea JSON en client_errors_YYYYMMDD.jsonl; el buffer se vuelca con
+    un único write en modo append cuando supera FLUSH_BYTES o cuando lleva más de
+    FLUSH_SEGUNDOS sin vaciarse, así que ingerir un log no depende del tamaño
+    del fichero del día y una caída a mitad de escritura solo afecta a la última línea.
+    Con varios workers cada uno tiene su buffer y el volcado se hace con el
+    bloqueo del fichero, así que las líneas de distintos procesos no se mezclan.
+    Como ese bloqueo puede tener que esperar a otro worker, desde el event loop
+    se usa escribir_async, que vuelca en un hilo.
+    """
+
+    def __init__(self, directorio: str = CLIENT_LOGS_DIR, max_bytes: int = FLUSH_BYTES, max_segundos: float = FLUSH_SEGUNDOS):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.max_segundos = max_segundos
+        self._pendientes: Dict[str, List[str]] = {}
+        self._bytes = 0
+        self._ultimo_flush = time.monotonic()
+        # _lock protege el buffer y solo se retiene para modificarlo; _escritura
+        # ordena los volcados y se retiene mientras se escribe en disco
+        self._lock = threading.Lock()
+        self._escritura = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, dia: str, extension: str = "jsonl") -> str:
+        return join(self.directorio, f"client_errors_{dia}.{extension}")
+
+    def _anadir(self, entradas: Iterable[Dict[str, Any]]) -> bool:
+        """Añade entradas al buffer del día actual y dice si ya hay que volcarlo."""
+        dia = datetime.now().strftime('%Y%m%d')
+        lineas = [json.dumps(entrada, ensure_ascii=False, separators=(",", ":")) + "\n" for entrada in entradas]
+        with self._lock:
+            self._pendientes.setdefault(dia, []).extend(lineas)
+            self._bytes += sum(len(linea) for linea in lineas)
+            return self._bytes >= self.max_bytes
+
+    def escribir(self, entradas: Iterable[Dict[str, Any]]):
+        """Añade entradas al buffer, volcándolo si supera max_bytes."""
+        if self._anadir(entradas):
+            self.flush()
+
+    async def escribir_async(self, entradas: Iterable[Dict[str, Any]]):
+        """Como escribir, pero el volcado se hace en un hilo sin bloquear el event loop."""
+        if self._anadir(entradas):
+            await asyncio.to_thread(self.flush)
+
+    def flush(self, solo_caducado: bool = False):
+        """
+        Vuelca a disco todo lo pendiente (o nada si solo_caducado y el buffer
+        lleva menos de max_segundos sin vaciarse).
+        """
+        with self._escritura:
+            with self._lock:
+                if solo_caducado and time.monotonic() - self._ultimo_flush < self.max_segundos:
+                    return
+                pendientes = self._pendientes
+                self._pendientes = {}
+                self._bytes = 0
+                self._ultimo_flush = time.monotonic()
+            for dia, lineas in pendientes.items():
+                ruta = self._ruta(dia)
+                with bloqueo(ruta), open(ruta, "a", encoding="utf-8") as f:
+                    f.write("".join(lineas))
+
+    def flush_si_caducado(self):
+        """Vuelca el buffer si lleva más de max_segundos sin vaciarse."""
+        self.flush(solo_caducado=True)
+
+    def leer(self, dia: str) -> List[Dict[str, Any]]:
+        """
+        Devuelve los logs de un día (YYYYMMDD), incluyendo los del antiguo
+        fichero .json con una lista completa y los aún no volcados.
+        """
+        self.flush()
+        logs: List[Dict[str, Any]] = []
+
+        ruta_json = self._ruta(dia, "json")
+        if os.path.exists(ruta_json):
+            try:
+                with open(ruta_json, "r") as f:
+                    logs.extend(json.load(f))
+            except json.JSONDecodeError:
+                logger.warning(f"Found corrupted log file: {ruta_json}, ignoring it")
+
+        ruta_jsonl = self._ruta(dia)
+        if os.path.exists(ruta_jsonl):
+            with open(ruta_jsonl, "r", encoding="utf-8") as f:
+                for numero, linea in enumerate(f, start=1):
+                    try:
+                        logs.append(json.loads(linea))
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping corrupted line {numero} in {ruta_jsonl}")
+        return logs
+
+
+async def vaciar_periodicamente(registro: RegistroCliente):
+    """Tarea de fondo que vuelca el buffer por tiempo aunque no lleguen más logs."""
+    while True:
+        await asyncio.sleep(registro.max_segundos / 2)
+        await asyncio.to_thread(registro.flush_si_caducado)
@@ -0,0 +1,128 @@
+'''Caché en disco de miniaturas y previsualizaciones de las imágenes del dataset'''
+import os
+import threading
+from os.path import join
+from typing import Dict, Optional
+
+from services.almacen import Almacen
+from utils.ficheros import bloqueo
+from utils.logger import logger
+
+
+def _leer_tamanos(valor: str) -> Dict[str, int]:
+    """Interpreta "thumb:320,medium:1024" como {"thumb": 320, "medium": 1024}."""
+    tamanos: Dict[str, int] = {}
+    for par in valor.split(","):
+        nombre, lado = par.split(":")
+        tamanos[nombre.strip()] = int(lado)
+    return tamanos
+
+
+# Lado mayor en píxeles de cada derivada
+TAMANOS = _leer_tamanos(os.environ.get("MINIATURAS_TAMANOS", "thumb:320,medium:1024"))
+MINIATURAS_DIR = join("cache", "miniaturas")
+MINIATURAS_MAX_BYTES = int(os.environ.get("MINIATURAS_MAX_BYTES", 512 * 1024 * 1024))  # 512MB
+CALIDAD = 80
+
+
+def url_miniatura(image_id: str, tamano: str) -> str:
+    return f"/miniaturas/{tamano}/{image_id}.webp"
+
+
+class CacheMiniaturas:
+    """
+    Genera las derivadas bajo demanda y las guarda en disco. El tamaño total
+    está limitado a max_bytes: al superarlo se borran las menos usadas (LRU,
+    según el mtime, que se actualiza en cada uso). El total ocupado se guarda
+    en el fichero "uso" de la caché y se actualiza con su bloqueo, así que el
+    límite es el mismo con uno o con varios workers.
+    """
+
+    def __init__(self, almacen: Almacen, directorio: str = MINIATURAS_DIR, max_bytes: int = MINIATURAS_MAX_BYTES):
+        self.almacen = almacen
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.uso_path = join(directorio, "uso")
+
+    def _expulsar(self) -> int:
+        """
+        Recorre la caché y borra las derivadas menos usadas hasta quedar por
+        debajo de max_bytes. Devuelve el tamaño total resultante. Requiere el
+        bloqueo de uso_path.
+        """
+        ficheros = []
+        for tamano in TAMANOS:
+            carpeta = join(self.directorio, tamano)
+            if not os.path.isdir(carpeta):
+                continue
+            for entrada in os.scandir(carpeta):
+                if entrada.name.endswith(".webp"):
+                    try:
+                        stat = entrada.stat()
+                    except FileNotFoundError:
+                        continue
+                    ficheros.append((stat.st_mtime, entrada.path, stat.st_size))
+        ficheros.sort()
+        total = sum(size for _, _, size in ficheros)
+        for _, antigua, size in ficheros[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(antigua)
+            except FileNotFoundError:
+                pass
+            total -= size
+            logger.debug(f"Evicted thumbnail {antigua}")
+        return total
+
+    def _registrar(self, size: int):
+        """Suma una derivada nueva al total compartido y libera espacio si se pasa."""
+        with bloqueo(self.uso_path):
+            try:
+                with open(self.uso_path, "r") as f:
+                    total: Optional[int] = int(f.read()) + size
+            except (FileNotFoundError, ValueError):
+                total = None
+            # Sin total guardado, o al pasarse, se recalcula recorriendo la caché
+            if total is None or total > self.max_bytes:
+                total = self._expulsar()
+            with open(self.uso_path, "w") as f:
+                f.write(str(total))
+
+    def obtener(self, image_id: str, tamano: str) -> Optional[str]:
+        """
+        Devuelve la ruta de la derivada, generándola si no está en caché.
+        Devuelve None si la imagen original no existe.
+        """
+        ruta = join(self.directorio, tamano, f"{image_id}.webp")
+        try:
+            # Marca el uso para el LRU; falla si no está (o la ha borrado otro worker)
+            os.utime(ruta)
+            return ruta
+        except FileNotFoundError:
+            pass
+
+        origen = self.almacen.localizar("images", f"{image_id}.webp")
+        if not os.path.exists(origen):
+            return None
+
+        from PIL import Image
+
+        lado = TAMANOS[tamano]
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        tmp_path = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with Image.open(origen) as image:
+            image.thumbnail((lado, lado))
+            image.save(tmp_path, "webp", quality=CALIDAD)
+        os.replace(tmp_path, ruta)
+
+        self._registrar(os.path.getsize(ruta))
+        return ruta
+
+    def generar_todas(self, image_id: str):
+        """Genera todas las derivadas de una imagen (tras una subida)."""
+        for tamano in TAMANOS:
+            try:
+                self.obtener(image_id, tamano)
+            except Exception as e:
+                logger.warning(f"Could not generate {tamano} thumbnail for {image_id}: {e}")
@@ -0,0 +1,341 @@
+'''Exportaciones en segundo plano: se encargan, se consulta su progreso y el resultado queda en disco'''
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils.ficheros import bloqueo, intentar_bloqueo
+from utils.logger import logger
+
+EXPORTACIONES_DIR = join("cache", "exportaciones")
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", 2))
+# Los resultados se borran pasado este tiempo sin descargarse...
+EXPORT_TTL = float(os.environ.get("EXPORT_TTL", 24 * 3600))
+# ...o, empezando por el menos usado, cuando entre todos superan este tamaño
+EXPORT_MAX_BYTES = int(os.environ.get("EXPORT_MAX_BYTES", 5 * 1024 * 1024 * 1024))  # 5GB
+# Cada cuánto se guarda el progreso de un trabajo en curso
+INTERVALO_PROGRESO = 0.5
+
+# El estado de cada trabajo va en {id}.estado.json, junto al resultado {id}.zip, .xlsx o .json
+SUFIJO_ESTADO = ".estado.json"
+
+EN_COLA = "queued"
+EN_CURSO = "running"
+TERMINADO = "done"
+FALLIDO = "failed"
+
+
+class TrabajoCancelado(Exception):
+    """El worker se está cerrando y el trabajo en curso se abandona."""
+
+
+class Trabajo:
+    """
+    Una exportación encargada. Su estado se guarda en {id}.estado.json junto al
+    resultado, así que cualquier worker de uvicorn puede responder a la consulta
+    de progreso aunque el trabajo se ejecute en otro. Mientras está en cola o en
+    curso, el worker que lo ejecuta tiene bloqueado {id}.estado.json.lock.
+    """
+
+    def __init__(self, gestor: "GestorTrabajos", trabajo_id: str, tipo: str, parametros: Dict[str, Any], fichero: str, media_type: str):
+        self.gestor = gestor
+        self.id = trabajo_id
+        self.tipo = tipo
+        self.parametros = parametros
+        self.fichero = fichero
+        self.media_type = media_type
+        self.estado = EN_COLA
+        self.procesados = 0
+        self.total: Optional[int] = None
+        self.error: Optional[str] = None
+        self.creado = time.time()
+        self.terminado: Optional[float] = None
+        self.tamano: Optional[int] = None
+        self._guardado = 0.0
+        self._propiedad: Optional[IO] = None
+
+    def a_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "type": self.tipo,
+            "params": self.parametros,
+            "status": self.estado,
+            "processed": self.procesados,
+            "total": self.total,
+            "progress": round(self.procesados / self.total, 4) if self.total else None,
+            "error": self.error,
+            "created_at": self.creado,
+            "finished_at": self.terminado,
+            "size": self.tamano,
+            "filename": self.fichero,
+            "media_type": self.media_type,
+        }
+
+    def guardar(self, forzar: bool = True):
+        """Escribe el estado en disco; sin forzar, como mucho cada INTERVALO_PROGRESO."""
+        ahora = time.monotonic()
+        if forzar or ahora - self._guardado >= INTERVALO_PROGRESO:
+            self._guardado = ahora
+            self.gestor.guardar_estado(self.id, self.a_dict())
+
+    def liberar(self):
+        """Suelta el bloqueo del trabajo; su estado en disco ya debe ser el final."""
+        if self._propiedad is not None:
+            self._propiedad.close()
+            self._propiedad = None
+
+    def contar(self, entradas: Iterable[Any]) -> Iterator[Any]:
+        """Recorre las entradas de la exportación anotando cuántas van procesadas."""
+        entradas = list(entradas)
+        self.total = len(entradas)
+        self.guardar()
+        for entrada in entradas:
+            yield entrada
+            self.procesados += 1
+            self.guardar(forzar=False)
+
+
+# Genera el contenido del resultado; puede usar Trabajo.contar para informar del progreso
+Generador = Callable[[Trabajo], Iterator[bytes]]
+
+
+class GestorTrabajos:
+    """
+    Ejecuta las exportaciones en un pool de hilos y guarda cada resultado en
+    EXPORTACIONES_DIR. El id de un trabajo es un hash de su tipo, sus parámetros
+    y la versión del dataset, así que las peticiones iguales sobre el mismo
+    estado del dataset comparten trabajo y resultado. Un bloqueo de fichero
+    por trabajo evita que dos workers lo ejecuten a la vez; un estado en cola o
+    en curso cuyo bloqueo está libre es de un worker que ha terminado sin
+    acabarlo, y se vuelve a encargar.
+    """
+
+    def __init__(
+        self,
+        directorio: str = EXPORTACIONES_DIR,
+        workers: int = EXPORT_WORKERS,
+        ttl: float = EXPORT_TTL,
+        max_bytes: int = EXPORT_MAX_BYTES,
+    ):
+        self.directorio = directorio
+        self.workers = workers
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._activos: Dict[str, Trabajo] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._cerrando = threading.Event()
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta_estado(self, trabajo_id: str) -> str:
+        return join(self.directorio, f"{trabajo_id}{SUFIJO_ESTADO}")
+
+    def ruta_resultado(self, trabajo_id: str, fichero: str) -> str:
+        return join(self.directorio, f"{trabajo_id}{os.path.splitext(fichero)[1]}")
+
+    def guardar_estado(self, trabajo_id: str, estado: Dict[str, Any]):
+        ruta = self._ruta_estado(trabajo_id)
+        tmp_path = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(estado, f)
+        os.replace(tmp_path, ruta)
+
+    def _leer_estado(self, trabajo_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._ruta_estado(trabajo_id), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _en_marcha(self, trabajo_id: str) -> bool:
+        """True si algún worker tiene el trabajo en cola o en curso."""
+        if trabajo_id in self._activos:
+            return True
+        propiedad = intentar_bloqueo(self._ruta_estado(trabajo_id))
+        if propiedad is None:
+            return True
+        propiedad.close()
+        return False
+
+    def _caducado(self, trabajo_id: str, fichero: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(self.ruta_resultado(trabajo_id, fichero)) > self.ttl
+        except FileNotFoundError:
+            return False
+
+    def _borrar(self, trabajo_id: str, fichero: str):
+        """Borra el resultado de un trabajo, su estado y sus bloqueos."""
+        resultado = self.ruta_resultado(trabajo_id, fichero)
+        estado = self._ruta_estado(trabajo_id)
+        for ruta in (resultado, estado, f"{resultado}.lock", f"{estado}.lock"):
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+
+    def estado(self, trabajo_id: str) -> Optional[Dict[str, Any]]:
+        """Estado de un trabajo, o None si no existe (o ya se ha borrado)."""
+        trabajo = self._activos.get(trabajo_id)
+        if trabajo is not None:
+            return trabajo.a_dict()
+        estado = self._leer_estado(trabajo_id)
+        if estado is None:
+            return None
+        if estado["status"] == TERMINADO and self._caducado(trabajo_id, estado["filename"]):
+            self._borrar(trabajo_id, estado["filename"])
+            return None
+        if estado["status"] in (EN_COLA, EN_CURSO) and not self._en_marcha(trabajo_id):
+            # Se vuelve a leer por si ha terminado justo antes de soltar el bloqueo
+            estado = self._leer_estado(trabajo_id)
+            if estado is not None and estado["status"] in (EN_COLA, EN_CURSO):
+                estado = {**estado, "status": FALLIDO, "error": "Interrupted: the worker running it has stopped"}
+        return estado
+
+    def resultado(self, trabajo_id: str) -> Optional[Dict[str, Any]]:
+        """Estado de un trabajo terminado cuyo resultado sigue en disco, marcándolo como usado."""
+        estado = self.estado(trabajo_id)
+        if estado is None or estado["status"] != TERMINADO:
+            return None
+        ruta = self.ruta_resultado(trabajo_id, estado["filename"])
+        try:
+            # El mtime indica el último uso para la expulsión por tamaño
+            os.utime(ruta)
+        except FileNotFoundError:
+            return None
+        return {**estado, "path": ruta}
+
+    def enviar(self, tipo: str, parametros: Dict[str, Any], version: object, fichero: str, media_type: str, generar: Generador) -> Dict[str, Any]:
+        """
+        Encarga una exportación y devuelve su estado. Si ya hay un trabajo igual
+        para esta versión del dataset (en cola, en curso o terminado) se devuelve ese.
+        """
+        clave = repr((tipo, sorted(parametros.items()), version))
+        trabajo_id = hashlib.sha1(clave.encode()).hexdigest()[:16]
+        self.limpiar()
+        with self._lock:
+            if trabajo_id in self._activos:
+                return self._activos[trabajo_id].a_dict()
+            previo = self.estado(trabajo_id)
+            if previo is not None and previo["status"] == TERMINADO and os.path.exists(self.ruta_resultado(trabajo_id, fichero)):
+                return previo
+
+            trabajo = Trabajo(self, trabajo_id, tipo, parametros, fichero, media_type)
+            propiedad = intentar_bloqueo(self._ruta_estado(trabajo_id))
+            if propiedad is None:
+                # Lo tiene en marcha otro worker: se comparte su trabajo
+                return self.estado(trabajo_id) or trabajo.a_dict()
+            trabajo._propiedad = propiedad
+            trabajo.guardar()
+            self._activos[trabajo_id] = trabajo
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="exportaciones")
+            self._executor.submit(self._ejecutar, trabajo, generar)
+        logger.info(f"Export job {trabajo_id} ({tipo}) queued")
+        return trabajo.a_dict()
+
+    def _ejecutar(self, trabajo: Trabajo, generar: Generador):
+        ruta = self.ruta_resultado(trabajo.id, trabajo.fichero)
+        tmp_path = f"{ruta}.{os.getpid()}.tmp"
+        inicio = time.perf_counter()
+        try:
+            with bloqueo(ruta):
+                if not os.path.exists(ruta):
+                    trabajo.estado = EN_CURSO
+                    trabajo.guardar()
+                    with open(tmp_path, "wb") as f:
+                        for chunk in generar(trabajo):
+                            if self._cerrando.is_set():
+                                raise TrabajoCancelado("Cancelled on shutdown")
+                            f.write(chunk)
+                    os.replace(tmp_path, ruta)
+                trabajo.estado = TERMINADO
+                trabajo.tamano = os.path.getsize(ruta)
+                trabajo.terminado = time.time()
+                trabajo.guardar()
+            logger.info(f"Export job {trabajo.id} ({trabajo.tipo}) finished in {time.perf_counter() - inicio:.1f}s, {trabajo.tamano} bytes")
+        except Exception as e:
+            if isinstance(e, TrabajoCancelado):
+                logger.warning(f"Export job {trabajo.id} ({trabajo.tipo}) cancelled on shutdown")
+            else:
+                logger.error(f"Export job {trabajo.id} ({trabajo.tipo}) failed: {e}", exc_info=True)
+            trabajo.estado = FALLIDO
+            trabajo.error = str(e)
+            trabajo.terminado = time.time()
+            trabajo.guardar()
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+        finally:
+            with self._lock:
+                self._activos.pop(trabajo.id, None)
+            trabajo.liberar()
+            self.limpiar()
+
+    def limpiar(self) -> int:
+        """
+        Borra los resultados caducados (más de ttl segundos sin usarse) y, si aun
+        así ocupan más de max_bytes, los menos usados. Devuelve cuántos ha borrado.
+        """
+        ahora = time.time()
+        # Cada fichero se consulta una sola vez: otro worker puede borrarlo entre
+        # el listado y el stat, y entonces simplemente se salta
+        resultados: List[Tuple[float, int, str]] = []
+        estados: List[Tuple[float, str]] = []
+        for entrada in os.scandir(self.directorio):
+            if entrada.name.endswith((".tmp", ".lock")):
+                continue
+            try:
+                stat = entrada.stat()
+            except FileNotFoundError:
+                continue
+            if entrada.name.endswith(SUFIJO_ESTADO):
+                estados.append((stat.st_mtime, entrada.name))
+            elif entrada.is_file():
+                resultados.append((stat.st_mtime, stat.st_size, entrada.name))
+        resultados.sort()
+        total = sum(size for _, size, _ in resultados)
+        borrados = 0
+        for mtime, size, nombre in resultados:
+            if ahora - mtime <= self.ttl and total <= self.max_bytes:
+                continue
+            trabajo_id = os.path.splitext(nombre)[0]
+            if trabajo_id in self._activos:
+                continue
+            self._borrar(trabajo_id, nombre)
+            total -= size
+            borrados += 1
+        # Los trabajos fallidos solo dejan su estado, que también caduca
+        for mtime, nombre in estados:
+            if ahora - mtime > self.ttl:
+                trabajo_id = nombre[:-len(SUFIJO_ESTADO)]
+                estado = self.estado(trabajo_id)
+                if estado is not None and estado["status"] == FALLIDO:
+                    self._borrar(trabajo_id, estado["filename"])
+        if borrados:
+            logger.info(f"Evicted {borrados} export results")
+        return borrados
+
+    def cerrar(self):
+        """
+        Cancela los trabajos en cola y pide a los que están en curso que paren
+        en el siguiente bloque que escriban, esperando a que lo hagan. Los
+        cancelados quedan como fallidos, y se vuelven a ejecutar si se piden otra
+        vez. Bloquea, así que desde el event loop se llama en un hilo.
+        """
+        self._cerrando.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        with self._lock:
+            for trabajo in self._activos.values():
+                trabajo.estado = FALLIDO
+                trabajo.error = "Cancelled on shutdown"
+                trabajo.terminado = time.time()
+                trabajo.guardar()
+                trabajo.liberar()
+            self._activos.clear()
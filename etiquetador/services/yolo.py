@@ -0,0 +1,143 @@
+'''Exportación del dataset en formato de entrenamiento YOLO'''
+from typing import Any, Dict, Iterator, List, Tuple
+
+from services.almacen import Almacen
+from services.imagenes import dimensiones
+from utils.logger import logger
+from utils.zip_streaming import Entrada
+
+CLASES = ["champi"]
+PARTICIONES = ("train", "val", "test")
+
+
+def repartir(
+    muestras: List[Tuple[str, Dict[str, Any]]],
+    val: float,
+    test: float,
+    seed: int,
+    estratificar: bool = False,
+) -> Dict[str, str]:
+    """
+    Asigna cada muestra a train/val/test de forma reproducible para una semilla.
+    Con estratificar, el reparto se hace por separado dentro de cada sala.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    grupos: Dict[str, List[str]] = {}
+    for image_id, data in sorted(muestras, key=lambda muestra: muestra[0]):
+        sala = str(data.get("sala") or "") if estratificar else ""
+        grupos.setdefault(sala, []).append(image_id)
+
+    particiones: Dict[str, str] = {}
+    for sala in sorted(grupos):
+        ids = np.array(grupos[sala])
+        ids = ids[rng.permutation(len(ids))]
+        n_test = int(round(len(ids) * test))
+        n_val = int(round(len(ids) * val))
+        for image_id in ids[:n_test]:
+            particiones[str(image_id)] = "test"
+        for image_id in ids[n_test:n_test + n_val]:
+            particiones[str(image_id)] = "val"
+        for image_id in ids[n_test + n_val:]:
+            particiones[str(image_id)] = "train"
+    return particiones
+
+
+def normalizar_cajas(
+    muestras: List[Tuple[str, Dict[str, Any]]],
+    tamanos: Dict[str, Tuple[int, int]],
+) -> Dict[str, bytes]:
+    """
+    Calcula las etiquetas YOLO de todas las muestras a la vez con NumPy, a partir
+    de los puntos en píxeles guardados en los metadatos. Se descartan las
+    anotaciones que no tienen dos puntos y las cajas de ancho o alto cero.
+    """
+    import numpy as np
+
+    ids: List[str] = []
+    puntos: List[Tuple[float, float, float, float]] = []
+    propietarios: List[int] = []
+    for image_id, data in muestras:
+        indice = len(ids)
+        ids.append(image_id)
+        for ann in data.get("annotations") or []:
+            pts = ann.get("points") or []
+            if len(pts) == 2:
+                puntos.append((pts[0]["x"], pts[0]["y"], pts[1]["x"], pts[1]["y"]))
+                propietarios.append(indice)
+
+    etiquetas = {image_id: b"" for image_id in ids}
+    if not puntos:
+        return etiquetas
+
+    cajas = np.asarray(puntos, dtype=np.float64)
+    duenos = np.asarray(propietarios, dtype=np.int64)
+    anchos = np.asarray([tamanos[image_id][0] for image_id in ids], dtype=np.float64)[duenos]
+    altos = np.asarray([tamanos[image_id][1] for image_id in ids], dtype=np.float64)[duenos]
+
+    xmin = np.minimum(cajas[:, 0], cajas[:, 2])
+    xmax = np.maximum(cajas[:, 0], cajas[:, 2])
+    ymin = np.minimum(cajas[:, 1], cajas[:, 3])
+    ymax = np.maximum(cajas[:, 1], cajas[:, 3])
+    yolo = np.column_stack((
+        (xmin + xmax) / (2 * anchos),
+        (ymin + ymax) / (2 * altos),
+        (xmax - xmin) / anchos,
+        (ymax - ymin) / altos,
+    ))
+
+    validas = (yolo[:, 2] != 0) & (yolo[:, 3] != 0)
+    descartadas = int((~validas).sum())
+    if descartadas:
+        logger.debug(f"Skipping {descartadas} zero width or height boxes in YOLO export")
+    yolo, duenos = yolo[validas], duenos[validas]
+
+    # Los propietarios están ordenados: cada muestra es un tramo contiguo
+    limites = np.searchsorted(duenos, np.arange(len(ids) + 1))
+    for indice, image_id in enumerate(ids):
+        filas = yolo[limites[indice]:limites[indice + 1]]
+        etiquetas[image_id] = "".join(
+            "0 %.6f %.6f %.6f %.6f\n" % tuple(fila) for fila in filas.tolist()
+        ).encode()
+    return etiquetas
+
+
+def data_yaml(particiones_usadas: List[str]) -> bytes:
+    lineas = ["path: ."]
+    for particion in PARTICIONES:
+        if particion in particiones_usadas:
+            lineas.append(f"{particion}: images/{particion}")
+    lineas.append(f"nc: {len(CLASES)}")
+    lineas.append(f"names: {CLASES!r}")
+    return ("\n".join(lineas) + "\n").encode()
+
+
+def entradas_yolo(
+    muestras: List[Tuple[str, Dict[str, Any]]],
+    almacen: Almacen,
+    val: float = 0.2,
+    test: float = 0.0,
+    seed: int = 42,
+    estratificar: bool = False,
+) -> Iterator[Entrada]:
+    """Entradas del ZIP con el dataset YOLO: data.yaml, images/<split>/ y labels/<split>/."""
+    tamanos: Dict[str, Tuple[int, int]] = {}
+    rutas: Dict[str, str] = {}
+    for image_id, _ in muestras:
+        try:
+            rutas[image_id] = almacen.localizar("images", f"{image_id}.webp")
+            tamanos[image_id] = dimensiones(rutas[image_id])
+        except OSError as e:
+            logger.warning(f"Skipping sample {image_id} in YOLO export: {e}")
+    muestras = [muestra for muestra in muestras if muestra[0] in tamanos]
+
+    particiones = repartir(muestras, val, test, seed, estratificar)
+    etiquetas = normalizar_cajas(muestras, tamanos)
+    logger.info(f"Exporting YOLO dataset with {len(muestras)} samples")
+
+    yield "data.yaml", data_yaml(sorted(set(particiones.values())))
+    for image_id, _ in muestras:
+        particion = particiones[image_id]
+        yield f"images/{particion}/{image_id}.webp", rutas[image_id]
+        yield f"labels/{particion}/{image_id}.txt", etiquetas[image_id]
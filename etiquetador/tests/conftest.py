@@ -0,0 +1,54 @@
+'''Configuración común de los tests
+
+Los módulos de la API usan rutas relativas (dataset, cache, logs) y crean
+directorios al importarse, así que los tests se ejecutan en un directorio
+temporal propio.
+'''
+import base64
+import io
+import os
+import sys
+import tempfile
+from typing import Any, Dict
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.chdir(tempfile.mkdtemp(prefix="etiquetador_tests_"))
+os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+os.environ.setdefault("DUPLICADOS", "ignorar")
+
+
+def imagen_b64(color=(200, 100, 50), ancho: int = 64, alto: int = 48) -> str:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (ancho, alto), color).save(buffer, "PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def muestra(**campos: Any) -> Dict[str, Any]:
+    """Cuerpo de una subida a /upload-image/ con una caja válida."""
+    payload = {
+        "annotatedImageFile": imagen_b64(),
+        "dataImageFile": "",
+        "annotations": [{"points": [{"x": 1, "y": 2}, {"x": 10, "y": 20}]}],
+        "sala": "1",
+        "muestra": "A",
+        "fecha": "2025-01-02",
+        "hora": "10:00",
+        "diaEntrada": "2024-12-20",
+    }
+    payload.update(campos)
+    return payload
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
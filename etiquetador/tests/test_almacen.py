@@ -0,0 +1,150 @@
+import json
+import os
+import sys
+import time
+
+import pytest
+
+from services import almacen as almacen_module
+from services.almacen import Almacen, guardar_blob, ruta_blob
+from services.catalogo import Catalogo
+
+
+def _almacen(tmp_path) -> Almacen:
+    almacen = Almacen(str(tmp_path / "dataset"), "plano", str(tmp_path / "dataset.version"))
+    os.makedirs(os.path.join(almacen.raiz, "images"), exist_ok=True)
+    return almacen
+
+
+def test_contenidos_iguales_comparten_blob(tmp_path):
+    almacen = _almacen(tmp_path)
+    a = almacen.ruta_nueva("images", "a.webp")
+    b = almacen.ruta_nueva("images", "b.webp")
+    sha = guardar_blob(b"imagen", a, almacen.blobs_dir)
+    assert guardar_blob(b"imagen", b, almacen.blobs_dir) == sha
+
+    blob = ruta_blob(almacen.blobs_dir, sha)
+    # El número de enlaces es el contador de referencias: el blob y dos muestras
+    assert os.stat(blob).st_nlink == 3
+    assert os.stat(a).st_ino == os.stat(b).st_ino == os.stat(blob).st_ino
+
+
+def test_liberar_blob_solo_borra_sin_referencias(tmp_path):
+    almacen = _almacen(tmp_path)
+    a = almacen.ruta_nueva("images", "a.webp")
+    b = almacen.ruta_nueva("images", "b.webp")
+    sha = guardar_blob(b"imagen", a, almacen.blobs_dir)
+    guardar_blob(b"imagen", b, almacen.blobs_dir)
+    blob = ruta_blob(almacen.blobs_dir, sha)
+
+    almacen.borrar("images", "a.webp")
+    almacen.liberar_blob(sha)
+    assert os.path.exists(blob)
+
+    almacen.borrar("images", "b.webp")
+    almacen.liberar_blob(sha)
+    assert not os.path.exists(blob)
+    # Liberar un blob que ya no existe no falla
+    almacen.liberar_blob(sha)
+
+
+def test_recoger_blobs_borra_solo_los_huerfanos(tmp_path):
+    almacen = _almacen(tmp_path)
+    usado = guardar_blob(b"usado", almacen.ruta_nueva("images", "a.webp"), almacen.blobs_dir)
+    huerfano = guardar_blob(b"huerfano", almacen.ruta_nueva("images", "b.webp"), almacen.blobs_dir)
+    almacen.borrar("images", "b.webp")
+
+    assert almacen.recoger_blobs() == 1
+    assert os.path.exists(ruta_blob(almacen.blobs_dir, usado))
+    assert not os.path.exists(ruta_blob(almacen.blobs_dir, huerfano))
+
+
+def _muestra(almacen: Almacen, image_id: str):
+    with open(almacen.ruta_nueva("data", f"{image_id}.json"), "w") as f:
+        json.dump({"fecha": "2025-01-01", "annotations": []}, f)
+    with open(almacen.ruta_nueva("images", f"{image_id}.webp"), "wb") as f:
+        f.write(b"webp")
+
+
+def _subcarpetas(almacen: Almacen):
+    return [ruta for carpeta in ("images", "labels", "data") for ruta in almacen.subcarpetas(carpeta)]
+
+
+@pytest.mark.parametrize("layout", ["plano", "fragmentado"])
+def test_rutas_y_listado_en_ambos_layouts(tmp_path, layout):
+    almacen = Almacen(str(tmp_path / "dataset"), layout, str(tmp_path / "dataset.version"))
+    otro = Almacen(almacen.raiz, "fragmentado" if layout == "plano" else "plano", almacen.version_path)
+    _muestra(almacen, "abcdef01")
+    _muestra(otro, "12345678")
+
+    esperada = "images/ab/cd/abcdef01.webp" if layout == "fragmentado" else "images/abcdef01.webp"
+    assert almacen.relativa("images", "abcdef01.webp") == esperada
+    assert almacen.url("images", "abcdef01.webp") == f"/dataset/{esperada}"
+    # Se encuentran y se listan los ficheros de los dos layouts
+    assert almacen.localizar("images", "12345678.webp") == otro.ruta("images", "12345678.webp")
+    assert almacen.ids("data", ".json") == {"abcdef01", "12345678"}
+    assert almacen.alternativa("images/ab/cd/abcdef01.webp") == "images/abcdef01.webp"
+    assert almacen.alternativa("images/abcdef01.webp") == "images/ab/cd/abcdef01.webp"
+
+
+@pytest.mark.parametrize("layout", ["plano", "fragmentado"])
+def test_el_catalogo_ve_los_cambios_hechos_fuera_de_la_api(tmp_path, layout):
+    almacen = Almacen(str(tmp_path / "dataset"), layout, str(tmp_path / "dataset.version"))
+    almacen.intervalo_fragmentos = 0
+    catalogo = Catalogo(almacen)
+    _muestra(almacen, "abcdef01")
+    _muestra(almacen, "abcdef02")
+    catalogo.cargar({})
+    assert len(catalogo.datos()[0]) == 2
+
+    # Los cambios en un mismo tick de mtime no cambiarían la marca
+    time.sleep(0.02)
+    os.remove(almacen.localizar("data", "abcdef01.json"))
+    catalogo.sincronizar()
+    assert [image_id for image_id, _ in catalogo.datos()[0]] == ["abcdef02"]
+
+    time.sleep(0.02)
+    _muestra(almacen, "ffff0001")
+    assert catalogo.sincronizar() == (["ffff0001"], [])
+
+
+def test_la_marca_de_las_subcarpetas_se_recalcula_cada_intervalo(tmp_path):
+    almacen = Almacen(str(tmp_path / "dataset"), "fragmentado", str(tmp_path / "dataset.version"))
+    almacen.intervalo_fragmentos = 3600
+    _muestra(almacen, "abcdef01")
+    marca = almacen.marca()
+
+    time.sleep(0.02)
+    os.remove(almacen.localizar("data", "abcdef01.json"))
+    assert almacen.marca() == marca
+    almacen.intervalo_fragmentos = 0
+    assert almacen.marca() != marca
+
+
+def test_migracion_entre_layouts(tmp_path, monkeypatch):
+    raiz = str(tmp_path / "dataset")
+    plano = Almacen(raiz, "plano", str(tmp_path / "dataset.version"))
+    ids = [f"{i:02x}cdef01" for i in range(5)]
+    for image_id in ids:
+        _muestra(plano, image_id)
+        with open(plano.ruta_nueva("labels", f"{image_id}.txt"), "w") as f:
+            f.write("0 0.5 0.5 0.1 0.1\n")
+
+    def migrar(layout: str):
+        monkeypatch.setattr(sys, "argv", ["almacen", "--dataset", raiz, "--layout", layout, "--workers", "2"])
+        almacen_module.main()
+
+    migrar("fragmentado")
+    fragmentado = Almacen(raiz, "fragmentado", plano.version_path)
+    for image_id in ids:
+        for carpeta, nombre in (("images", f"{image_id}.webp"), ("data", f"{image_id}.json"), ("labels", f"{image_id}.txt")):
+            assert os.path.exists(fragmentado.ruta(carpeta, nombre))
+            assert not os.path.exists(plano.ruta(carpeta, nombre))
+    assert len(_subcarpetas(fragmentado)) == 30
+
+    migrar("plano")
+    for image_id in ids:
+        assert os.path.exists(plano.ruta("images", f"{image_id}.webp"))
+    # No quedan subcarpetas vacías del layout fragmentado
+    assert _subcarpetas(plano) == []
+    assert plano.ids("labels", ".txt") == set(ids)
@@ -0,0 +1,190 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from bbdd.database import Base
+from services import champi as champi_service
+from tests.conftest import muestra
+
+MUESTRAS = {
+    "a": ("2025-01-01", "09:00", "1"),
+    "b": ("2025-01-01", "10:00", "2"),
+    "c": ("2025-01-02", "08:00", "1"),
+    "d": ("2025-01-02", "08:00", "1"),
+    "e": ("2025-01-03", "12:00", None),
+}
+
+
+def _en_bbdd(prueba):
+    """Ejecuta la prueba con una sesión de una base de datos SQLite en memoria con MUESTRAS."""
+    import entidades.modelos.champi  # noqa: F401
+
+    async def ejecutar():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                await champi_service.guardar(db, {
+                    image_id: {"fecha": fecha, "hora": hora, "sala": sala, "annotations": []}
+                    for image_id, (fecha, hora, sala) in MUESTRAS.items()
+                })
+                return await prueba(db)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(ejecutar())
+
+
+async def _recorrer(db, orden: str, limit: int = 2, **filtros):
+    ids, cursor = [], None
+    while True:
+        filas, cursor = await champi_service.paginar(db, limit=limit, cursor=cursor, orden=orden, **filtros)
+        ids.extend(image_id for image_id, _ in filas)
+        if cursor is None:
+            return ids
+
+
+def test_paginas_ordenadas_por_fecha_hora_e_id():
+    esperado = sorted(MUESTRAS, key=lambda image_id: (*MUESTRAS[image_id][:2], image_id))
+
+    async def prueba(db):
+        assert await _recorrer(db, "asc") == esperado
+        assert await _recorrer(db, "desc") == esperado[::-1]
+        assert await _recorrer(db, "asc", limit=10) == esperado
+        filas, cursor = await champi_service.paginar(db, orden="asc")
+        assert [image_id for image_id, _ in filas] == esperado and cursor is None
+
+    _en_bbdd(prueba)
+
+
+def test_filtros():
+    async def prueba(db):
+        assert await _recorrer(db, "asc", sala="1") == ["a", "c", "d"]
+        # Sin sala equivale a ""
+        assert await _recorrer(db, "asc", sala="") == ["e"]
+        assert await _recorrer(db, "asc", fecha_desde="2025-01-02") == ["c", "d", "e"]
+        # fecha_hasta incluye las fechas que empiezan por ella
+        assert await _recorrer(db, "asc", fecha_hasta="2025-01-02") == ["a", "b", "c", "d"]
+        assert await _recorrer(db, "asc", fecha_hasta="2025-01") == list(MUESTRAS)
+        assert await champi_service.salas(db) == ["", "1", "2"]
+
+    _en_bbdd(prueba)
+
+
+def test_cursor_de_una_muestra_borrada_sigue_por_la_siguiente():
+    async def prueba(db):
+        filas, cursor = await champi_service.paginar(db, limit=2, orden="asc")
+        assert [image_id for image_id, _ in filas] == ["a", "b"]
+
+        # La muestra del cursor desaparece antes de pedir la página siguiente
+        await champi_service.borrar(db, ["b"])
+        filas, _ = await champi_service.paginar(db, limit=2, cursor=cursor, orden="asc")
+        assert [image_id for image_id, _ in filas] == ["c", "d"]
+
+    _en_bbdd(prueba)
+
+
+def test_cursor_invalido():
+    async def prueba(db):
+        with pytest.raises(ValueError):
+            await champi_service.paginar(db, limit=2, cursor="no-es-un-cursor")
+
+    _en_bbdd(prueba)
+
+
+def test_obtener_devuelve_el_formato_de_los_json():
+    async def prueba(db):
+        await champi_service.guardar(db, {"f": {
+            "fecha": "2025-01-04", "temperatura": 18.5, "sala": "3",
+            "annotations": [{"points": [{"x": 1, "y": 2}, {"x": 10, "y": 20}]}],
+        }})
+        data = await champi_service.obtener(db, "f")
+        assert (data["fecha"], data["temperatura"], data["sala"]) == ("2025-01-04", 18.5, "3")
+        assert data["annotations"] == [{"points": [{"x": 1, "y": 2}, {"x": 10, "y": 20}]}]
+        assert await champi_service.obtener(db, "no-existe") is None
+
+    _en_bbdd(prueba)
+
+
+def test_listado_y_detalle_leen_de_la_bbdd(client):
+    from bbdd import database
+
+    image_id = client.post("/upload-image/", json=muestra(sala="bbdd", observaciones="original")).json()["id"]
+
+    async def cambiar():
+        async with database.async_session() as db:
+            data = await champi_service.obtener(db, image_id)
+            await champi_service.guardar(db, {image_id: {**data, "observaciones": "en la bbdd"}})
+
+    # En el event loop de la API, que es el dueño del pool de conexiones
+    client.portal.call(cambiar)
+    # El ETag sale del catálogo: se pide sin él para ver lo que hay en la bbdd
+    assert client.get(f"/images/{image_id}").json()["observaciones"] == "en la bbdd"
+    items = client.get("/images/", params={"sala": "bbdd"}).json()
+    assert [(item["id"], item["observaciones"]) for item in items] == [(image_id, "en la bbdd")]
+
+
+def test_si_falla_la_bbdd_la_subida_se_deshace(client, monkeypatch):
+    async def falla(db, muestras):
+        raise RuntimeError("bbdd caída")
+
+    total = len(client.get("/images/").json())
+    monkeypatch.setattr(champi_service, "guardar", falla)
+    respuesta = client.post("/upload-image/", json=muestra())
+    assert respuesta.status_code == 503
+
+    lote = client.post("/upload-images/batch/", json={"images": [muestra(), muestra()]}).json()
+    assert lote["failed"] == 2
+    assert all(not resultado["success"] for resultado in lote["results"])
+
+    monkeypatch.undo()
+    import routes.champi
+
+    assert len(client.get("/images/").json()) == total
+    assert routes.champi.almacen.ids("data", ".json") == routes.champi.almacen.ids("images", ".webp")
+    assert len(routes.champi.almacen.ids("data", ".json")) == total
+
+
+def test_el_excel_del_informe_lee_de_la_bbdd(client):
+    import io
+
+    from bbdd import database
+    from openpyxl import load_workbook
+
+    image_id = client.post("/upload-image/", json=muestra(observaciones="original")).json()["id"]
+
+    async def cambiar():
+        async with database.async_session() as db:
+            data = await champi_service.obtener(db, image_id)
+            await champi_service.guardar(db, {image_id: {**data, "observaciones": "en la bbdd"}})
+
+    client.portal.call(cambiar)
+    respuesta = client.get("/download/dataset/excel")
+    assert respuesta.status_code == 200
+    hoja = load_workbook(io.BytesIO(respuesta.content))["Resumen_Muestras"]
+    filas = {fila[0]: fila for fila in hoja.iter_rows(values_only=True)}
+    assert filas[f"{image_id}.json"][11] == "en la bbdd"
+
+
+def test_los_borrados_fuera_de_la_api_llegan_a_la_bbdd(client):
+    import time
+
+    import routes.champi
+    from bbdd import database
+
+    image_id = client.post("/upload-image/", json=muestra()).json()["id"]
+    # Un cambio en el mismo tick de mtime que la subida no cambiaría la marca
+    time.sleep(0.02)
+    routes.champi.almacen.borrar("data", f"{image_id}.json")
+
+    assert image_id not in [item["id"] for item in client.get("/images/").json()]
+    assert client.get(f"/images/{image_id}").status_code == 404
+
+    async def obtener():
+        async with database.async_session() as db:
+            return await champi_service.obtener(db, image_id)
+
+    assert client.portal.call(obtener) is None
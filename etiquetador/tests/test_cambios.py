@@ -0,0 +1,50 @@
+from services.cambios import ALTA, BAJA, RegistroCambios
+
+
+def test_secuencias_crecientes_sin_repetir_el_ultimo_cambio(tmp_path):
+    cambios = RegistroCambios(str(tmp_path / "cambios.jsonl"))
+    assert cambios.ultima == 0
+
+    cambios.registrar(ALTA, ["a", "b"])
+    assert cambios.ultima == 2
+    # Un alta de una muestra que ya estaba de alta no se anota otra vez
+    cambios.registrar(ALTA, ["a"])
+    assert cambios.ultima == 2
+    cambios.registrar(BAJA, ["a"])
+    assert cambios.ultima == 3
+
+    assert cambios.desde(0) == (["b"], ["a"], 3)
+    assert cambios.desde(2) == ([], ["a"], 3)
+    assert cambios.desde(3) == ([], [], 3)
+
+
+def test_otro_proceso_ve_los_cambios_del_fichero(tmp_path):
+    ruta = str(tmp_path / "cambios.jsonl")
+    uno, otro = RegistroCambios(ruta), RegistroCambios(ruta)
+    uno.registrar(ALTA, ["a"])
+    otro.registrar(ALTA, ["b"])
+    assert uno.desde(0) == (["a", "b"], [], 2)
+    assert RegistroCambios(ruta).ultima == 2
+
+
+def test_cursor_posterior_al_ultimo_cambio_devuelve_410(client):
+    from routes.download import cambios
+
+    respuesta = client.get("/download/dataset/delta/manifest", params={"since": cambios.ultima + 1000})
+    assert respuesta.status_code == 410
+
+
+def test_cursor_no_valido_devuelve_400(client):
+    assert client.get("/download/dataset/delta/manifest", params={"since": "ayer"}).status_code == 400
+
+
+def test_manifiesto_desde_el_ultimo_cursor(client):
+    from tests.conftest import muestra
+
+    manifiesto = client.get("/download/dataset/delta/manifest", params={"since": 0}).json()
+    image_id = client.post("/upload-image/", json=muestra()).json()["id"]
+
+    siguiente = client.get("/download/dataset/delta/manifest", params={"since": manifiesto["next_cursor"]}).json()
+    assert siguiente["added"] == [image_id]
+    assert siguiente["deleted"] == []
+    assert siguiente["next_cursor"] > manifiesto["next_cursor"]
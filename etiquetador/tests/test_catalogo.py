@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from services.almacen import Almacen
+from services.catalogo import Catalogo
+
+MUESTRAS = {
+    "a": ("2025-01-01", "09:00"),
+    "b": ("2025-01-01", "10:00"),
+    "c": ("2025-01-02", "08:00"),
+    "d": ("2025-01-02", "08:00"),
+    "e": ("2025-01-03", "12:00"),
+}
+
+
+def _escribir(almacen: Almacen, image_id: str, fecha: str, hora: str):
+    with open(almacen.ruta_nueva("data", f"{image_id}.json"), "w") as f:
+        json.dump({"fecha": fecha, "hora": hora, "sala": "1", "annotations": []}, f)
+    with open(almacen.ruta_nueva("images", f"{image_id}.webp"), "wb") as f:
+        f.write(b"RIFF")
+
+
+@pytest.fixture
+def catalogo(tmp_path):
+    almacen = Almacen(str(tmp_path / "dataset"), "plano", str(tmp_path / "dataset.version"))
+    for image_id, (fecha, hora) in MUESTRAS.items():
+        _escribir(almacen, image_id, fecha, hora)
+    catalogo = Catalogo(almacen)
+    catalogo.cargar({})
+    return catalogo
+
+
+def test_registrar_quita_la_muestra_de_las_omitidas(catalogo):
+    with open(catalogo.almacen.ruta_nueva("data", "f.json"), "w") as f:
+        f.write('{"fecha": ')
+    with open(catalogo.almacen.ruta_nueva("images", "f.webp"), "wb") as f:
+        f.write(b"RIFF")
+    catalogo.almacen.tocar()
+    catalogo.sincronizar()
+    assert catalogo.datos()[1] == ["f"]
+
+    catalogo.registrar("f", {"fecha": "2025-01-04", "hora": "", "annotations": []})
+    assert catalogo.datos()[1] == []
+
+
+def test_los_cambios_en_disco_quedan_pendientes_para_la_bbdd(catalogo):
+    assert catalogo.pendientes_bbdd() == ({}, [])
+
+    _escribir(catalogo.almacen, "f", "2025-01-04", "09:00")
+    catalogo.almacen.borrar("data", "a.json")
+    catalogo.almacen.tocar()
+    assert catalogo.sincronizar() == (["f"], ["a"])
+
+    altas, bajas = catalogo.pendientes_bbdd()
+    assert list(altas) == ["f"] and altas["f"]["fecha"] == "2025-01-04"
+    assert bajas == ["a"]
+    # Quien los saca los escribe: no se devuelven dos veces
+    assert catalogo.pendientes_bbdd() == ({}, [])
+
+
+def test_quitar_deshace_un_registro(catalogo):
+    catalogo.registrar("g", {"fecha": "2025-01-05", "hora": "", "annotations": []})
+    version = catalogo.version
+    catalogo.quitar("g")
+    assert catalogo.obtener("g") is None
+    assert catalogo.version == version + 1
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from services import coco
+from services.almacen import Almacen
+from services.coco import coco_streaming
+
+
+def _caja(x1, y1, x2, y2):
+    return {"points": [{"x": x1, "y": y1}, {"x": x2, "y": y2}]}
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    from PIL import Image
+
+    almacen = Almacen(str(tmp_path / "dataset"), "fragmentado", str(tmp_path / "dataset.version"))
+    Image.new("RGB", (200, 100)).save(almacen.ruta_nueva("images", "abcd01.webp"))
+    Image.new("RGB", (64, 48)).save(almacen.ruta_nueva("images", "abcd02.webp"))
+    return almacen
+
+
+MUESTRAS = [
+    ("abcd01", {"fecha": "2025-01-01", "annotations": [_caja(30, 60, 10, 20), _caja(5, 5, 5, 50), _caja(0, 0, 100, 50)]}),
+    ("sin_imagen", {"fecha": "2025-01-02", "annotations": [_caja(0, 0, 1, 1)]}),
+    ("abcd02", {"fecha": "2025-01-03"}),
+]
+
+
+@pytest.mark.parametrize("max_buffer", [coco.MAX_BUFFER_ANOTACIONES, 10])
+def test_formato_coco(almacen, monkeypatch, max_buffer):
+    # Con un buffer mínimo las anotaciones pasan por el temporal en disco
+    monkeypatch.setattr(coco, "MAX_BUFFER_ANOTACIONES", max_buffer)
+    resultado = json.loads(b"".join(coco_streaming(MUESTRAS, almacen)))
+
+    assert list(resultado) == ["info", "categories", "images", "annotations"]
+    assert resultado["categories"] == [{"id": 1, "name": "champi"}]
+    assert resultado["images"] == [
+        {"id": 1, "file_name": "images/ab/cd/abcd01.webp", "width": 200, "height": 100, "uuid": "abcd01", "date_captured": "2025-01-01"},
+        {"id": 2, "file_name": "images/ab/cd/abcd02.webp", "width": 64, "height": 48, "uuid": "abcd02", "date_captured": "2025-01-03"},
+    ]
+    # Las cajas van en [x, y, ancho, alto] y se descartan las de ancho o alto cero
+    assert resultado["annotations"] == [
+        {"id": 1, "image_id": 1, "category_id": 1, "bbox": [10, 20, 20, 40], "area": 800, "iscrowd": 0},
+        {"id": 2, "image_id": 1, "category_id": 1, "bbox": [0, 0, 100, 50], "area": 5000, "iscrowd": 0},
+    ]
+
+
+def test_sin_muestras(almacen):
+    resultado = json.loads(b"".join(coco_streaming([], almacen)))
+    assert (resultado["images"], resultado["annotations"]) == ([], [])
+
+
+def test_endpoint_coco(client):
+    from tests.conftest import muestra
+
+    image_id = client.post("/upload-image/", json=muestra()).json()["id"]
+    respuesta = client.get("/download/dataset/coco")
+    assert respuesta.status_code == 200
+    resultado = respuesta.json()
+    imagen = next(imagen for imagen in resultado["images"] if imagen["uuid"] == image_id)
+    assert (imagen["width"], imagen["height"]) == (64, 48)
+    assert [ann["bbox"] for ann in resultado["annotations"] if ann["image_id"] == imagen["id"]] == [[1, 2, 9, 18]]
@@ -0,0 +1,80 @@
+import base64
+import io
+import random
+
+from services.duplicados import DUPLICADOS_DISTANCIA, BKTree, dhash, distancia
+from tests.conftest import muestra
+
+
+def _textura(semilla: int, ancho: int = 96, alto: int = 72):
+    """Imagen con detalle suficiente para tener hash perceptual."""
+    from PIL import Image
+
+    aleatorio = random.Random(semilla)
+    pequena = Image.frombytes("L", (12, 9), bytes(aleatorio.randrange(256) for _ in range(12 * 9)))
+    return pequena.resize((ancho, alto), Image.Resampling.BILINEAR).convert("RGB")
+
+
+def _b64(image, formato: str = "PNG") -> str:
+    buffer = io.BytesIO()
+    image.save(buffer, formato)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_dhash_estable_ante_recompresion_y_reescalado():
+    from PIL import Image
+
+    original = _textura(1)
+    buffer = io.BytesIO()
+    original.save(buffer, "JPEG", quality=60)
+    recomprimida = Image.open(io.BytesIO(buffer.getvalue()))
+    reducida = original.resize((48, 36), Image.Resampling.LANCZOS)
+
+    valor = dhash(original)
+    assert valor is not None
+    assert distancia(valor, dhash(recomprimida)) <= DUPLICADOS_DISTANCIA
+    assert distancia(valor, dhash(reducida)) <= DUPLICADOS_DISTANCIA
+    assert distancia(valor, dhash(_textura(2))) > DUPLICADOS_DISTANCIA
+
+
+def test_las_imagenes_lisas_no_tienen_hash():
+    from PIL import Image
+
+    assert dhash(Image.new("RGB", (64, 48), (200, 100, 50))) is None
+    assert dhash(Image.new("RGB", (64, 48), (10, 10, 10))) is None
+
+
+def test_bktree_encuentra_lo_mismo_que_comparar_con_todo():
+    aleatorio = random.Random(7)
+    valores = {f"id{i}": aleatorio.getrandbits(64) for i in range(300)}
+    # Unos cuantos casi iguales a otros para que haya aciertos
+    for i in range(20):
+        valores[f"cerca{i}"] = valores[f"id{i}"] ^ (1 << aleatorio.randrange(64)) ^ (1 << aleatorio.randrange(64))
+    arbol = BKTree()
+    for image_id, valor in valores.items():
+        arbol.agregar(valor, image_id)
+    assert len(arbol) == len(valores)
+
+    for radio in (0, 2, 5, 20):
+        for consulta in list(valores.values())[:40]:
+            esperado = sorted((image_id, distancia(consulta, valor)) for image_id, valor in valores.items() if distancia(consulta, valor) <= radio)
+            encontrado = arbol.buscar(consulta, radio)
+            assert sorted(encontrado) == esperado
+            assert [d for _, d in encontrado] == sorted(d for _, d in encontrado)
+
+
+def test_rechazar_devuelve_409_y_no_guarda_la_muestra(client, monkeypatch):
+    import routes.champi
+
+    monkeypatch.setattr(routes.champi, "DUPLICADOS", "rechazar")
+    original = client.post("/upload-image/", json=muestra(annotatedImageFile=_b64(_textura(11))))
+    assert original.status_code == 200
+
+    total = len(client.get("/images/").json())
+    repetida = client.post("/upload-image/", json=muestra(annotatedImageFile=_b64(_textura(11), "JPEG")))
+    assert repetida.status_code == 409
+    assert original.json()["id"] in repetida.json()["detail"]
+    assert len(client.get("/images/").json()) == total
+
+    # Una imagen distinta se guarda sin problema
+    assert client.post("/upload-image/", json=muestra(annotatedImageFile=_b64(_textura(12)))).status_code == 200
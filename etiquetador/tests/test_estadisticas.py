@@ -0,0 +1,118 @@
+import pytest
+
+from services.estadisticas import Estadisticas
+from tests.conftest import muestra
+
+
+class _Catalogo:
+    """Lo mínimo del catálogo que usan las estadísticas"""
+
+    def __init__(self, muestras):
+        self.muestras = muestras
+        self.version = 0
+
+    def datos(self):
+        return self.muestras, 0.0
+
+
+def _caja(ancho, alto):
+    return {"points": [{"x": 10, "y": 10}, {"x": 10 + ancho, "y": 10 + alto}]}
+
+
+MUESTRAS = [
+    ("a", {"sala": "1", "muestra": "A", "fecha": "2025-01-02", "dia_entrada": "2024-12-30",
+           "temperatura": 20, "humedad": "90", "annotations": [_caja(10, 10), _caja(40, 20), _caja(0, 5)]}),
+    ("b", {"sala": "1", "muestra": "B", "fecha": "2025-01-03", "dia_entrada": "2024-12-30",
+           "temperatura": 22, "humedad": "no", "annotations": [_caja(100, 100)]}),
+    ("c", {"sala": 2, "muestra": "A", "fecha": "2025-01-02", "dia_entrada": "2024-12-22", "temperatura": None}),
+    ("d", {"muestra": "A", "fecha": "2025-01-02"}),
+]
+
+
+@pytest.fixture
+def estadisticas():
+    return Estadisticas(_Catalogo(list(MUESTRAS)))
+
+
+def _por_clave(resultado):
+    return {grupo["key"]: grupo for grupo in resultado["groups"]}
+
+
+def test_totales(estadisticas):
+    resultado = estadisticas.calcular()
+    # La caja sin ancho no cuenta
+    assert (resultado["group_by"], resultado["samples"], resultado["boxes"]) == (None, 4, 3)
+    [grupo] = resultado["groups"]
+    assert grupo["boxes_per_sample"] == 0.75
+    assert grupo["averages"]["temperatura"] == 21.0
+    assert grupo["averages"]["humedad"] == 90.0
+    assert grupo["averages"]["co2"] is None
+    assert grupo["box_size"]["width"] == {"p10": 16.0, "p50": 40.0, "p90": 88.0, "mean": 50.0}
+    assert grupo["box_size"]["histogram"] == {
+        "0-16": 1, "16-32": 1, "32-64": 0, "64-128": 1, "128-256": 0, "256-512": 0, "512-1024": 0, "1024+": 0,
+    }
+
+
+@pytest.mark.parametrize("agrupar, esperado", [
+    # (clave, muestras, cajas); los valores que faltan van al final con clave None
+    ("sala", [("1", 2, 3), ("2", 1, 0), (None, 1, 0)]),
+    ("muestra", [("A", 3, 2), ("B", 1, 1)]),
+    ("fecha", [("2025-01-02", 3, 2), ("2025-01-03", 1, 1)]),
+    # Orden numérico, no de texto
+    ("dia", [(3, 1, 2), (4, 1, 1), (11, 1, 0), (None, 1, 0)]),
+])
+def test_agrupaciones(estadisticas, agrupar, esperado):
+    resultado = estadisticas.calcular(agrupar)
+    assert resultado["group_by"] == agrupar
+    assert [(g["key"], g["samples"], g["boxes"]) for g in resultado["groups"]] == esperado
+    grupos = _por_clave(resultado)
+    if agrupar == "sala":
+        assert grupos["1"]["averages"]["temperatura"] == 21.0
+        assert grupos["2"]["box_size"]["width"] is None
+        assert grupos["2"]["boxes_per_sample"] == 0.0
+
+
+def test_agrupacion_desconocida(estadisticas):
+    with pytest.raises(ValueError):
+        estadisticas.calcular("hora")
+
+
+def test_recalcula_con_la_version(estadisticas):
+    primero = estadisticas.calcular("sala")
+    assert estadisticas.calcular("sala") is primero
+
+    estadisticas.catalogo.muestras.append(("e", {"sala": "3", "annotations": [_caja(5, 5)]}))
+    assert estadisticas.calcular("sala") is primero
+    estadisticas.catalogo.version += 1
+    resultado = estadisticas.calcular("sala")
+    assert resultado["samples"] == 5
+    assert _por_clave(resultado)["3"]["boxes"] == 1
+
+
+def test_etag_y_304(client):
+    respuesta = client.get("/stats", params={"agrupar": "sala"})
+    assert respuesta.status_code == 200
+    etag = respuesta.headers["etag"]
+    assert respuesta.headers["cache-control"] == "no-cache"
+    assert "last-modified" in respuesta.headers
+
+    no_modificada = client.get("/stats", params={"agrupar": "sala"}, headers={"If-None-Match": etag})
+    assert no_modificada.status_code == 304
+    assert no_modificada.headers["etag"] == etag
+    assert no_modificada.content == b""
+
+    # Cada agrupación tiene su propia representación
+    otra = client.get("/stats", params={"agrupar": "dia"}, headers={"If-None-Match": etag})
+    assert otra.status_code == 200
+    assert otra.headers["etag"] != etag
+
+    # Un cambio en el dataset invalida el ETag
+    assert client.post("/upload-image/", json=muestra(sala="estadisticas")).status_code == 200
+    cambiada = client.get("/stats", params={"agrupar": "sala"}, headers={"If-None-Match": etag})
+    assert cambiada.status_code == 200
+    assert cambiada.headers["etag"] != etag
+    assert "estadisticas" in _por_clave(cambiada.json())
+
+
+def test_agrupacion_invalida(client):
+    assert client.get("/stats", params={"agrupar": "hora"}).status_code == 422
@@ -0,0 +1,37 @@
+from tests.conftest import muestra
+
+
+def test_listado_con_etag_y_304(client):
+    assert client.post("/upload-image/", json=muestra()).status_code == 200
+
+    respuesta = client.get("/images/", params={"limit": 10})
+    assert respuesta.status_code == 200
+    etag = respuesta.headers["etag"]
+
+    no_modificada = client.get("/images/", params={"limit": 10}, headers={"If-None-Match": etag})
+    assert no_modificada.status_code == 304
+    assert no_modificada.headers["etag"] == etag
+
+    # Otros parámetros son otra representación
+    otra = client.get("/images/", params={"limit": 5}, headers={"If-None-Match": etag})
+    assert otra.status_code == 200
+
+
+def test_el_etag_cambia_con_una_subida(client):
+    etag = client.get("/images/").headers["etag"]
+    assert client.post("/upload-image/", json=muestra(fecha="2025-02-01")).status_code == 200
+    respuesta = client.get("/images/", headers={"If-None-Match": etag})
+    assert respuesta.status_code == 200
+    assert respuesta.headers["etag"] != etag
+
+
+def test_cursor_invalido_devuelve_400(client):
+    respuesta = client.get("/images/", params={"limit": 2, "cursor": "no-es-un-cursor"})
+    assert respuesta.status_code == 400
+
+
+def test_detalle_con_etag_y_304(client):
+    image_id = client.post("/upload-image/", json=muestra()).json()["id"]
+    respuesta = client.get(f"/images/{image_id}")
+    assert respuesta.status_code == 200
+    assert client.get(f"/images/{image_id}", headers={"If-None-Match": respuesta.headers["etag"]}).status_code == 304
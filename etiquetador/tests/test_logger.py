@@ -0,0 +1,72 @@
+import logging
+
+import pytest
+
+from utils import logger as logger_module
+from utils.logger import RepeatLimiter
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """Reloj monótono controlado por el test"""
+    ahora = [1000.0]
+    monkeypatch.setattr(logger_module.time, "monotonic", lambda: ahora[0])
+    return ahora
+
+
+def _registro(msg, *args, nivel=logging.WARNING):
+    return logging.LogRecord("champitech", nivel, __file__, 1, msg, args, None)
+
+
+def test_mismo_patron_comparte_cupo(reloj):
+    limitador = RepeatLimiter(max_count=2, window=60)
+    mensajes = [
+        "Skipping annotation 3 of 123e4567-e89b-12d3-a456-426614174000",
+        "Skipping annotation 17 of 00000000-0000-0000-0000-00000000abcd",
+        "Skipping annotation 4 of 9f86d081884c7d65",
+    ]
+    assert [limitador.filter(_registro(m)) for m in mensajes] == [True, True, False]
+    # Los argumentos se enmascaran igual que el texto
+    assert not limitador.filter(_registro("Skipping annotation %d of %s", 5, "deadbeefcafe"))
+    # Otro patrón tiene su propio cupo
+    assert limitador.filter(_registro("Image %s not found", "abc"))
+
+
+def test_solo_warning(reloj):
+    limitador = RepeatLimiter(max_count=1, window=60)
+    for nivel in (logging.DEBUG, logging.INFO, logging.ERROR, logging.CRITICAL):
+        assert all(limitador.filter(_registro("Fallo %d", i, nivel=nivel)) for i in range(5))
+    assert limitador.filter(_registro("Fallo 1"))
+    assert not limitador.filter(_registro("Fallo 2"))
+
+
+def test_resumen_al_acabar_la_ventana(reloj):
+    limitador = RepeatLimiter(max_count=1, window=60)
+    assert limitador.filter(_registro("Annotation %d skipped", 1))
+    assert not any(limitador.filter(_registro("Annotation %d skipped", i)) for i in range(2, 5))
+
+    reloj[0] += 60
+    registro = _registro("Annotation %d skipped", 9)
+    assert limitador.filter(registro)
+    assert registro.getMessage() == "Annotation 9 skipped (suppressed 3 similar messages in the last 60s)"
+
+    # La ventana nueva empieza sin suprimidos
+    reloj[0] += 60
+    registro = _registro("Annotation %d skipped", 10)
+    assert limitador.filter(registro)
+    assert registro.getMessage() == "Annotation 10 skipped"
+
+
+def test_olvida_patrones_caducados(reloj):
+    limitador = RepeatLimiter(max_count=1, window=60)
+    for i in range(100):
+        limitador.filter(_registro(f"Patron {chr(65 + i % 26)}{chr(97 + i // 26)}"))
+    assert len(limitador._seen) == 100
+    reloj[0] += 60
+    limitador.filter(_registro("Otro"))
+    assert list(limitador._seen) == ["Otro"]
+
+
+def test_desactivado(reloj):
+    limitador = RepeatLimiter(max_count=0, window=60)
+    assert all(limitador.filter(_registro("Fallo %d", i)) for i in range(10))
@@ -0,0 +1,43 @@
+import asyncio
+import json
+
+from services.logs_cliente import RegistroCliente
+
+DIA = "20250102"
+
+
+def _entrada(mensaje: str):
+    return {"type": "error", "message": mensaje, "timestamp": "2025-01-02T10:00:00"}
+
+
+def test_las_entradas_se_guardan_en_jsonl_al_volcar(tmp_path):
+    registro = RegistroCliente(str(tmp_path))
+    registro.escribir([_entrada("uno"), _entrada("dos")])
+    assert not list(tmp_path.iterdir())
+
+    registro.flush()
+    (fichero,) = tmp_path.glob("*.jsonl")
+    assert [json.loads(linea)["message"] for linea in fichero.read_text().splitlines()] == ["uno", "dos"]
+
+
+def test_escribir_async_vuelca_al_superar_max_bytes(tmp_path):
+    registro = RegistroCliente(str(tmp_path), max_bytes=100)
+    asyncio.run(registro.escribir_async([_entrada("x" * 200)]))
+    assert len(list(tmp_path.glob("*.jsonl"))) == 1
+
+
+def test_leer_incluye_el_json_antiguo_y_lo_pendiente(tmp_path):
+    (tmp_path / f"client_errors_{DIA}.json").write_text(json.dumps([_entrada("antiguo")]))
+    (tmp_path / f"client_errors_{DIA}.jsonl").write_text(
+        json.dumps(_entrada("volcado")) + "\n" + '{"type": "error", "mess\n'
+    )
+    registro = RegistroCliente(str(tmp_path))
+    registro._pendientes[DIA] = [json.dumps(_entrada("pendiente")) + "\n"]
+
+    # La línea cortada se descarta sin perder el resto
+    assert [log["message"] for log in registro.leer(DIA)] == ["antiguo", "volcado", "pendiente"]
+
+
+def test_json_antiguo_corrupto_se_ignora(tmp_path):
+    (tmp_path / f"client_errors_{DIA}.json").write_text("[{")
+    assert RegistroCliente(str(tmp_path)).leer(DIA) == []
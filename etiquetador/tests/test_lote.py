@@ -0,0 +1,51 @@
+import hashlib
+import os
+
+from services.almacen import ruta_blob
+from services.imagenes import codificar, obtener_perfil
+from tests.conftest import imagen_b64, muestra
+
+
+def _ficheros(almacen):
+    return {carpeta: almacen.ids(carpeta, extension) for carpeta, extension in (("images", ".webp"), ("data", ".json"), ("labels", ".txt"))}
+
+
+def test_resultado_por_elemento_con_un_fallo(client):
+    import routes.champi
+
+    almacen = routes.champi.almacen
+    antes = _ficheros(almacen)
+    imagenes = [
+        muestra(sala="lote"),
+        # La imagen anotada se guarda y la de datos falla: se deshace la muestra entera
+        muestra(sala="lote", annotatedImageFile=imagen_b64((1, 2, 3)), dataImageFile="no es base64 de una imagen"),
+        muestra(sala="lote", dataImageFile=imagen_b64((4, 5, 6))),
+    ]
+    respuesta = client.post("/upload-images/batch/", json={"images": imagenes})
+    assert respuesta.status_code == 200
+    cuerpo = respuesta.json()
+    assert (cuerpo["processed"], cuerpo["failed"]) == (3, 1)
+
+    resultados = sorted(cuerpo["results"], key=lambda resultado: resultado["index"])
+    assert [resultado["success"] for resultado in resultados] == [True, False, True]
+    assert "error" in resultados[1] and "id" not in resultados[1]
+    guardadas = {resultados[0]["id"], resultados[2]["id"]}
+    assert {item["id"] for item in client.get("/images/", params={"sala": "lote"}).json()} == guardadas
+
+    # Solo quedan los ficheros de las dos muestras guardadas
+    despues = _ficheros(almacen)
+    for carpeta in despues:
+        assert despues[carpeta] - antes[carpeta] == guardadas
+    assert almacen.ids("data", ".webp") >= {resultados[2]["id"]}
+    # El blob de la imagen anotada del elemento fallido ya no lo enlaza nadie y se ha borrado
+    from PIL import Image
+
+    webp = codificar(Image.new("RGB", (64, 48), (1, 2, 3)), obtener_perfil())
+    assert not os.path.exists(ruta_blob(almacen.blobs_dir, hashlib.sha256(webp).hexdigest()))
+    webp = codificar(Image.new("RGB", (64, 48), (4, 5, 6)), obtener_perfil())
+    assert os.path.exists(ruta_blob(almacen.blobs_dir, hashlib.sha256(webp).hexdigest()))
+
+
+def test_lote_vacio(client):
+    cuerpo = client.post("/upload-images/batch/", json={"images": []}).json()
+    assert cuerpo == {"processed": 0, "failed": 0, "results": []}
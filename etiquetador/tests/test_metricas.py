@@ -0,0 +1,67 @@
+import re
+
+from utils.metricas import Contador, Histograma, _registro
+
+
+def _valor(texto: str, muestra: str) -> float:
+    """Valor de la primera línea de la exposición que empieza por `muestra`"""
+    for linea in texto.splitlines():
+        if linea.startswith(muestra + " "):
+            return float(linea.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_formato_texto():
+    contador = Contador("prueba_total", "Contador de prueba", ("ruta",))
+    histograma = Histograma("prueba_segundos", "Histograma de prueba", ("ruta",), (0.1, 1.0))
+    try:
+        contador.inc('/a"b\\c')
+        contador.inc('/a"b\\c', cantidad=2)
+        histograma.observar(0.05, "/x")
+        histograma.observar(0.5, "/x")
+        histograma.observar(5.0, "/x")
+
+        assert list(contador.exportar()) == [
+            "# HELP prueba_total Contador de prueba",
+            "# TYPE prueba_total counter",
+            'prueba_total{ruta="/a\\"b\\\\c"} 3',
+        ]
+        assert list(histograma.exportar()) == [
+            "# HELP prueba_segundos Histograma de prueba",
+            "# TYPE prueba_segundos histogram",
+            'prueba_segundos_bucket{ruta="/x",le="0.1"} 1',
+            'prueba_segundos_bucket{ruta="/x",le="1"} 2',
+            'prueba_segundos_bucket{ruta="/x",le="+Inf"} 3',
+            'prueba_segundos_sum{ruta="/x"} 5.55',
+            'prueba_segundos_count{ruta="/x"} 3',
+        ]
+    finally:
+        _registro.remove(contador)
+        _registro.remove(histograma)
+
+
+def test_endpoint_metrics(client):
+    respuesta = client.get("/metrics")
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"].startswith("text/plain; version=0.0.4")
+    for nombre in ("etiquetador_requests_total", "etiquetador_request_duration_seconds", "etiquetador_span_duration_seconds"):
+        assert f"# TYPE {nombre} " in respuesta.text
+    # Cada muestra es "nombre{etiquetas} valor"
+    for linea in respuesta.text.splitlines():
+        assert linea.startswith("#") or re.fullmatch(r"[a-z_]+(\{.*\})? \S+", linea), linea
+
+
+def test_etiqueta_por_plantilla_de_ruta(client):
+    muestra = '{method="GET",route="/images/{image_id}",status="404"}'
+    antes = _valor(client.get("/metrics").text, "etiquetador_requests_total" + muestra)
+
+    for image_id in ("no_existe_1", "no_existe_2"):
+        assert client.get(f"/images/{image_id}").status_code == 404
+    client.get("/ruta/que/no/existe")
+
+    texto = client.get("/metrics").text
+    assert _valor(texto, "etiquetador_requests_total" + muestra) == antes + 2
+    assert "no_existe_1" not in texto
+    assert "/ruta/que/no/existe" not in texto
+    assert 'route="desconocida"' in texto
+    assert _valor(texto, 'etiquetador_request_duration_seconds_count{method="GET",route="/images/{image_id}"}') >= 2
@@ -0,0 +1,46 @@
+import base64
+import json
+
+from tests.conftest import imagen_b64, muestra
+
+
+def _metadatos(**campos):
+    datos = muestra(**campos)
+    del datos["annotatedImageFile"], datos["dataImageFile"]
+    return json.dumps(datos)
+
+
+def _imagen() -> bytes:
+    return base64.b64decode(imagen_b64())
+
+
+def test_subida_multipart(client):
+    respuesta = client.post(
+        "/upload-image/multipart/",
+        files={"annotatedImage": ("foto.png", _imagen(), "image/png"), "dataImage": ("datos.png", _imagen(), "image/png")},
+        data={"metadata": _metadatos(sala="multipart")},
+    )
+    assert respuesta.status_code == 200
+    cuerpo = respuesta.json()
+    assert cuerpo["valid_annotations"] == 1
+
+    detalle = client.get(f"/images/{cuerpo['id']}").json()
+    assert detalle["sala"] == "multipart"
+    assert detalle["annotations"] == [[1, 2, 9, 18]]
+
+
+def test_metadatos_invalidos_devuelven_422(client):
+    total = len(client.get("/images/").json())
+    for metadata in ("no es json", json.dumps({"sala": "1"}), _metadatos(humedad="mucha")):
+        respuesta = client.post(
+            "/upload-image/multipart/",
+            files={"annotatedImage": ("foto.png", _imagen(), "image/png")},
+            data={"metadata": metadata},
+        )
+        assert respuesta.status_code == 422
+    assert len(client.get("/images/").json()) == total
+
+
+def test_sin_metadatos_devuelve_422(client):
+    respuesta = client.post("/upload-image/multipart/", files={"annotatedImage": ("foto.png", _imagen(), "image/png")})
+    assert respuesta.status_code == 422
@@ -0,0 +1,73 @@
+import base64
+import io
+import json
+
+import pytest
+
+from services.imagenes import PERFILES, WEBP_PERFIL, _convertir_y_guardar, codificar, obtener_perfil
+from tests.conftest import muestra
+
+
+def _png_b64(ancho: int, alto: int) -> str:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (ancho, alto), (90, 140, 60)).save(buffer, "PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_seleccion_de_perfil():
+    assert obtener_perfil() == PERFILES[WEBP_PERFIL]
+    assert obtener_perfil("rapido") == PERFILES["rapido"]
+    with pytest.raises(ValueError):
+        obtener_perfil("no-existe")
+
+
+def test_perfil_desconocido_devuelve_400(client):
+    assert client.post("/upload-image/", params={"perfil": "no-existe"}, json=muestra()).status_code == 400
+
+
+def test_rapido_reduce_con_una_escala_por_eje(tmp_path):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (3001, 1001), (90, 140, 60)).save(buffer, "PNG")
+    guardada = _convertir_y_guardar(buffer, str(tmp_path / "imagen.webp"), str(tmp_path / "blobs"), perfil=PERFILES["rapido"])
+
+    assert (guardada.width, guardada.height) == (2048, 683)
+    assert guardada.escala_x == 2048 / 3001
+    assert guardada.escala_y == 683 / 1001
+    with Image.open(tmp_path / "imagen.webp") as image:
+        assert image.size == (2048, 683)
+
+
+def test_rapido_escala_las_anotaciones(client):
+    import routes.champi
+
+    payload = muestra(
+        annotatedImageFile=_png_b64(4096, 1024),
+        annotations=[{"points": [{"x": 400, "y": 100}, {"x": 4000, "y": 1000}]}],
+    )
+    respuesta = client.post("/upload-image/", params={"perfil": "rapido"}, json=payload)
+    assert respuesta.status_code == 200
+    image_id = respuesta.json()["id"]
+
+    with open(routes.champi.almacen.localizar("data", f"{image_id}.json")) as f:
+        puntos = json.load(f)["annotations"][0]["points"]
+    assert puntos == [{"x": 200, "y": 50}, {"x": 2000, "y": 500}]
+    # La etiqueta YOLO es relativa, así que no cambia al reducir la imagen
+    with open(routes.champi.almacen.localizar("labels", f"{image_id}.txt")) as f:
+        assert f.read().split() == ["0", "0.537109", "0.537109", "0.878906", "0.878906"]
+
+
+def test_un_webp_que_cumple_el_perfil_se_guarda_tal_cual(tmp_path):
+    from PIL import Image
+
+    webp = codificar(Image.new("RGB", (320, 240), (10, 200, 30)), PERFILES["equilibrado"])
+    guardada = _convertir_y_guardar(io.BytesIO(webp), str(tmp_path / "tal_cual.webp"), str(tmp_path / "blobs"), perfil=PERFILES["equilibrado"])
+    assert (guardada.width, guardada.height, guardada.escala_x, guardada.escala_y) == (320, 240, 1, 1)
+    assert (tmp_path / "tal_cual.webp").read_bytes() == webp
+
+    # Con el perfil sin pérdida el mismo WebP (lossy) se recodifica
+    _convertir_y_guardar(io.BytesIO(webp), str(tmp_path / "recodificada.webp"), str(tmp_path / "blobs"), perfil=PERFILES["sin_perdida"])
+    assert (tmp_path / "recodificada.webp").read_bytes() != webp
@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+
+import pytest
+
+from services.trabajos import FALLIDO, TERMINADO, GestorTrabajos
+
+
+def _esperar(gestor: GestorTrabajos, trabajo_id: str):
+    for _ in range(200):
+        estado = gestor.estado(trabajo_id)
+        if estado["status"] in (TERMINADO, FALLIDO):
+            return estado
+        time.sleep(0.01)
+    raise AssertionError(f"El trabajo {trabajo_id} no ha terminado")
+
+
+@pytest.fixture
+def gestor(tmp_path):
+    gestor = GestorTrabajos(str(tmp_path), workers=1, ttl=3600)
+    yield gestor
+    gestor.cerrar()
+
+
+def test_estado_y_progreso(gestor):
+    seguir = threading.Event()
+
+    def generar(trabajo):
+        seguir.wait()
+        for entrada in trabajo.contar(range(5)):
+            yield str(entrada).encode()
+
+    estado = gestor.enviar("prueba", {"seed": 1}, "v1", "prueba.txt", "text/plain", generar)
+    assert estado["status"] in ("queued", "running")
+    seguir.set()
+
+    final = _esperar(gestor, estado["id"])
+    assert (final["status"], final["processed"], final["total"], final["progress"]) == (TERMINADO, 5, 5, 1.0)
+    resultado = gestor.resultado(estado["id"])
+    with open(resultado["path"], "rb") as f:
+        assert f.read() == b"01234"
+
+
+def test_peticiones_iguales_comparten_trabajo(gestor):
+    llamadas = []
+
+    def generar(trabajo):
+        llamadas.append(trabajo.id)
+        yield b"x"
+
+    a = gestor.enviar("prueba", {"seed": 1}, "v1", "prueba.txt", "text/plain", generar)
+    _esperar(gestor, a["id"])
+    b = gestor.enviar("prueba", {"seed": 1}, "v1", "prueba.txt", "text/plain", generar)
+    assert b["id"] == a["id"] and b["status"] == TERMINADO
+    assert len(llamadas) == 1
+
+    # Otros parámetros u otra versión del dataset son otro trabajo
+    assert gestor.enviar("prueba", {"seed": 2}, "v1", "prueba.txt", "text/plain", generar)["id"] != a["id"]
+    assert gestor.enviar("prueba", {"seed": 1}, "v2", "prueba.txt", "text/plain", generar)["id"] != a["id"]
+
+
+def test_el_resultado_caduca_sin_usarse(gestor):
+    estado = gestor.enviar("prueba", {}, "v1", "prueba.txt", "text/plain", lambda trabajo: iter([b"x"]))
+    _esperar(gestor, estado["id"])
+
+    gestor.ttl = 0.05
+    time.sleep(0.1)
+    assert gestor.estado(estado["id"]) is None
+    assert gestor.resultado(estado["id"]) is None
+    assert os.listdir(gestor.directorio) == []
+
+
+def test_un_error_deja_el_trabajo_fallido(gestor):
+    def generar(trabajo):
+        raise RuntimeError("sin datos")
+        yield b""
+
+    estado = gestor.enviar("prueba", {}, "v1", "prueba.txt", "text/plain", generar)
+    final = _esperar(gestor, estado["id"])
+    assert final["status"] == FALLIDO
+    assert final["error"] == "sin datos"
+    assert gestor.resultado(estado["id"]) is None
+
+
+def test_cerrar_marca_los_trabajos_en_cola_y_se_pueden_repetir(tmp_path):
+    gestor = GestorTrabajos(str(tmp_path), workers=1, ttl=3600)
+    seguir = threading.Event()
+
+    def lento(trabajo):
+        seguir.wait()
+        yield b"lento"
+
+    gestor.enviar("lento", {}, "v1", "lento.txt", "text/plain", lento)
+    en_cola = gestor.enviar("rapido", {}, "v1", "rapido.txt", "text/plain", lambda trabajo: iter([b"x"]))
+    threading.Timer(0.1, seguir.set).start()
+    gestor.cerrar()
+
+    cancelado = gestor.estado(en_cola["id"])
+    assert cancelado["status"] == FALLIDO
+
+    otro = GestorTrabajos(str(tmp_path), workers=1, ttl=3600)
+    try:
+        repetido = otro.enviar("rapido", {}, "v1", "rapido.txt", "text/plain", lambda trabajo: iter([b"x"]))
+        assert repetido["id"] == en_cola["id"]
+        assert _esperar(otro, repetido["id"])["status"] == TERMINADO
+    finally:
+        otro.cerrar()
+
+
+def test_cerrar_interrumpe_el_trabajo_en_curso(tmp_path):
+    gestor = GestorTrabajos(str(tmp_path), workers=1, ttl=3600)
+    empezado = threading.Event()
+
+    def infinito(trabajo):
+        while True:
+            empezado.set()
+            yield b"x"
+
+    estado = gestor.enviar("infinito", {}, "v1", "infinito.txt", "text/plain", infinito)
+    assert empezado.wait(1)
+    gestor.cerrar()
+
+    final = gestor.estado(estado["id"])
+    assert (final["status"], final["error"]) == (FALLIDO, "Cancelled on shutdown")
+    assert [f for f in os.listdir(tmp_path) if f.endswith(".tmp")] == []
+
+
+def test_limpiar_salta_los_ficheros_que_desaparecen(gestor, monkeypatch):
+    estado = gestor.enviar("prueba", {}, "v1", "prueba.txt", "text/plain", lambda trabajo: iter([b"x"]))
+    _esperar(gestor, estado["id"])
+    while estado["id"] in gestor._activos:
+        time.sleep(0.01)
+
+    class Desaparecida:
+        name = "borrado_por_otro_worker.zip"
+
+        def stat(self):
+            raise FileNotFoundError(self.name)
+
+        def is_file(self):
+            return False
+
+    scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda ruta: [Desaparecida(), *scandir(ruta)])
+    gestor.ttl = 0
+    assert gestor.limpiar() == 1
+    assert gestor.resultado(estado["id"]) is None
@@ -0,0 +1,81 @@
+from collections import Counter
+
+import pytest
+
+from services.almacen import Almacen
+from services.yolo import entradas_yolo, normalizar_cajas, repartir
+
+
+def _muestras(n: int, salas=("1",)):
+    return [(f"id{i:03d}", {"sala": salas[i % len(salas)]}) for i in range(n)]
+
+
+def _caja(x1, y1, x2, y2):
+    return {"points": [{"x": x1, "y": y1}, {"x": x2, "y": y2}]}
+
+
+def test_repartir_es_reproducible_con_la_semilla():
+    muestras = _muestras(50)
+    reparto = repartir(muestras, 0.2, 0.1, seed=7)
+    assert reparto == repartir(list(reversed(muestras)), 0.2, 0.1, seed=7)
+    assert reparto != repartir(muestras, 0.2, 0.1, seed=8)
+    assert set(reparto) == {image_id for image_id, _ in muestras}
+    assert Counter(reparto.values()) == {"train": 35, "val": 10, "test": 5}
+
+
+def test_repartir_estratificado_por_sala():
+    # 30 muestras de la sala 1 y 10 de la sala 2
+    muestras = _muestras(40, salas=("1", "1", "1", "2"))
+    salas = dict((image_id, data["sala"]) for image_id, data in muestras)
+
+    reparto = repartir(muestras, 0.2, 0.0, seed=1, estratificar=True)
+    por_sala = Counter((salas[image_id], particion) for image_id, particion in reparto.items())
+    assert por_sala == {("1", "train"): 24, ("1", "val"): 6, ("2", "train"): 8, ("2", "val"): 2}
+
+
+def test_normalizar_cajas():
+    muestras = [
+        ("a", {"annotations": [_caja(10, 20, 30, 60), _caja(30, 60, 10, 20)]}),
+        ("b", {"annotations": [_caja(5, 5, 5, 50), {"points": [{"x": 1, "y": 1}]}]}),
+        ("c", {"annotations": [_caja(0, 0, 100, 50)]}),
+        ("d", {}),
+    ]
+    tamanos = {"a": (100, 100), "b": (100, 100), "c": (200, 100), "d": (10, 10)}
+    etiquetas = normalizar_cajas(muestras, tamanos)
+
+    # Los dos puntos en cualquier orden dan la misma caja
+    assert etiquetas["a"] == b"0 0.200000 0.400000 0.200000 0.400000\n" * 2
+    # Se descartan las cajas sin ancho y las anotaciones sin dos puntos
+    assert etiquetas["b"] == b""
+    assert etiquetas["c"] == b"0 0.250000 0.250000 0.500000 0.500000\n"
+    assert etiquetas["d"] == b""
+
+
+def test_entradas_yolo(tmp_path):
+    from PIL import Image
+
+    almacen = Almacen(str(tmp_path / "dataset"), "plano", str(tmp_path / "dataset.version"))
+    muestras = []
+    for image_id in ("a", "b", "c", "d"):
+        Image.new("RGB", (200, 100)).save(almacen.ruta_nueva("images", f"{image_id}.webp"))
+        muestras.append((image_id, {"sala": "1", "annotations": [_caja(0, 0, 100, 50)]}))
+    # Sin imagen: se omite
+    muestras.append(("sin_imagen", {"annotations": []}))
+
+    entradas = dict(entradas_yolo(muestras, almacen, val=0.25, test=0.25, seed=3))
+    assert entradas["data.yaml"] == (
+        b"path: .\ntrain: images/train\nval: images/val\ntest: images/test\nnc: 1\nnames: ['champi']\n"
+    )
+    imagenes = [nombre for nombre in entradas if nombre.startswith("images/")]
+    assert len(imagenes) == 4
+    assert Counter(nombre.split("/")[1] for nombre in imagenes) == {"train": 2, "val": 1, "test": 1}
+    for nombre in imagenes:
+        particion, fichero = nombre.split("/")[1:]
+        image_id = fichero[:-len(".webp")]
+        assert entradas[nombre] == almacen.ruta("images", fichero)
+        assert entradas[f"labels/{particion}/{image_id}.txt"] == b"0 0.250000 0.250000 0.500000 0.500000\n"
+
+
+@pytest.mark.parametrize("params, status", [({"val": 0.5, "test": 0.5}, 400), ({"val": 1.2}, 422)])
+def test_particiones_invalidas(client, params, status):
+    assert client.get("/download/dataset/yolo", params=params).status_code == status
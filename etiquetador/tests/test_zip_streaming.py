@@ -0,0 +1,33 @@
+import io
+import zipfile
+
+from utils.zip_streaming import zip_streaming
+
+
+def test_zip_valido_con_stored_para_imagenes_y_deflated_para_texto(tmp_path):
+    imagen = tmp_path / "a.webp"
+    imagen.write_bytes(bytes(range(256)) * 64)
+    texto = tmp_path / "a.txt"
+    texto.write_text("0 0.5 0.5 0.1 0.1\n" * 1000)
+
+    trozos = list(zip_streaming([
+        ("images/a.webp", str(imagen)),
+        ("labels/a.txt", str(texto)),
+        ("data.json", b'{"id": "a"}'),
+    ], chunk_size=1024))
+    assert len(trozos) > 1
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(trozos))) as zipf:
+        assert zipf.testzip() is None
+        assert zipf.namelist() == ["images/a.webp", "labels/a.txt", "data.json"]
+        assert zipf.getinfo("images/a.webp").compress_type == zipfile.ZIP_STORED
+        assert zipf.getinfo("labels/a.txt").compress_type == zipfile.ZIP_DEFLATED
+        assert zipf.getinfo("data.json").compress_type == zipfile.ZIP_DEFLATED
+        assert zipf.read("images/a.webp") == imagen.read_bytes()
+        assert zipf.read("labels/a.txt") == texto.read_bytes()
+        assert zipf.read("data.json") == b'{"id": "a"}'
+
+
+def test_zip_vacio(tmp_path):
+    with zipfile.ZipFile(io.BytesIO(b"".join(zip_streaming([])))) as zipf:
+        assert zipf.namelist() == []
@@ -0,0 +1,70 @@
+'''Coordinación entre procesos (varios workers de uvicorn) a través de ficheros compartidos'''
+import os
+from contextlib import contextmanager
+from typing import IO, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueos, solo se admite un proceso
+    fcntl = None
+
+
+@contextmanager
+def bloqueo(ruta: str) -> Iterator[None]:
+    """
+    Bloqueo exclusivo sobre `ruta`.lock, compartido por todos los procesos y
+    también entre hilos: cada llamada abre su propio descriptor, y flock
+    bloquea por descriptor.
+    """
+    ruta_lock = f"{ruta}.lock"
+    os.makedirs(os.path.dirname(ruta_lock) or ".", exist_ok=True)
+    with open(ruta_lock, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def intentar_bloqueo(ruta: str) -> Optional[IO]:
+    """
+    Como bloqueo() pero sin esperar: devuelve `ruta`.lock abierto y bloqueado,
+    o None si lo tiene otro. El bloqueo dura hasta que se cierra el fichero o
+    termina el proceso, así que puede pasar de un hilo a otro.
+    """
+    ruta_lock = f"{ruta}.lock"
+    os.makedirs(os.path.dirname(ruta_lock) or ".", exist_ok=True)
+    f = open(ruta_lock, "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+    return f
+
+
+def lineas_nuevas(ruta: str, posicion: int, inodo: int) -> Tuple[List[str], int, int]:
+    """
+    Líneas completas añadidas a un fichero append-only desde `posicion`, con la
+    nueva posición y el inodo del fichero. Si el fichero se ha sustituido (otro
+    inodo) se lee desde el principio: quien llama debe descartar lo que tenía.
+    Las líneas a medio escribir por otro proceso se dejan para la siguiente lectura.
+    """
+    try:
+        f = open(ruta, "rb")
+    except FileNotFoundError:
+        return [], 0, 0
+    with f:
+        stat = os.fstat(f.fileno())
+        if stat.st_ino != inodo or stat.st_size < posicion:
+            posicion = 0
+        if stat.st_size == posicion:
+            return [], posicion, stat.st_ino
+        f.seek(posicion)
+        datos = f.read()
+    completo = datos.rfind(b"\n") + 1
+    lineas = datos[:completo].decode("utf-8").splitlines()
+    return lineas, posicion + completo, stat.st_ino
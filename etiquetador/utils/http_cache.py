@@ -0,0 +1,60 @@
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.staticfiles import StaticFiles
+from starlette.types import Scope
+
+# Las imágenes del dataset se guardan con un UUID nuevo y nunca se reescriben
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+# Respuestas que cambian con el dataset: el navegador debe revalidar con el ETag
+CACHE_REVALIDAR = "no-cache"
+
+
+def calcular_etag(*partes: object) -> str:
+    """ETag fuerte a partir de los valores que determinan la representación."""
+    return '"' + hashlib.sha1(repr(partes).encode()).hexdigest() + '"'
+
+
+def cabeceras_cache(etag: str, mtime: float) -> Dict[str, str]:
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Cache-Control": CACHE_REVALIDAR,
+    }
+
+
+def no_modificado(request: Request, etag: str, mtime: float) -> Optional[Response]:
+    """
+    Devuelve una respuesta 304 si el cliente ya tiene la versión actual según
+    If-None-Match o, si no lo envía, según If-Modified-Since. Si no, None.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = [valor.strip().removeprefix("W/") for valor in if_none_match.split(",")]
+        coincide = "*" in etags or etag in etags
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is None:
+            return None
+        try:
+            coincide = int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return None
+
+    if coincide:
+        return Response(status_code=304, headers=cabeceras_cache(etag, mtime))
+    return None
+
+
+class StaticFilesCacheables(StaticFiles):
+    """StaticFiles que marca como inmutables las imágenes del dataset."""
+
+    def file_response(self, full_path, stat_result, scope: Scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if str(full_path).endswith(".webp"):
+            response.headers["Cache-Control"] = CACHE_INMUTABLE
+        else:
+            response.headers["Cache-Control"] = CACHE_REVALIDAR
+        return response
@@ -1,37 +1,123 @@
+import atexit
+import copy
+import json
 import logging
 import os
+import queue
+import re
+import threading
 import time
-from logging.handlers import RotatingFileHandler
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Dict, List, Optional
 
 # Create logs directory if it doesn't exist
 logs_dir = Path("logs")
 logs_dir.mkdir(exist_ok=True)
 
-# Configure the logger
-def setup_logger(name="champitech"):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    
-    # Log format
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# "text" (default) or "json" for one compact JSON object per line
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_CONSOLE_LEVEL = os.environ.get("LOG_CONSOLE_LEVEL", "INFO").upper()
+# Repeated warnings: at most LOG_REPEAT_MAX messages of the same shape every LOG_REPEAT_WINDOW seconds
+LOG_REPEAT_MAX = int(os.environ.get("LOG_REPEAT_MAX", 10))
+LOG_REPEAT_WINDOW = float(os.environ.get("LOG_REPEAT_WINDOW", 60))
+
+
+class JSONFormatter(logging.Formatter):
+    """Compact JSON-lines format, one object per record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        # Records coming through the queue carry the traceback already formatted in exc_text
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        elif record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+
+
+class RepeatLimiter(logging.Filter):
+    """
+    Drops warnings that repeat too often. Messages with the same shape once
+    uuids, hex strings and numbers are masked, such as "Skipping annotation 3: ...",
+    share a budget of max_count per window; the first one after the window ends
+    reports how many were dropped. Other levels are never dropped, and shapes
+    whose window has expired are forgotten so the table does not grow forever.
+    """
+
+    _variable = re.compile(
+        r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+        r"|\b[0-9a-fA-F]{8,}\b"
+        r"|\d+"
     )
-    
+
+    def __init__(self, max_count: int = LOG_REPEAT_MAX, window: float = LOG_REPEAT_WINDOW):
+        super().__init__()
+        self.max_count = max_count
+        self.window = window
+        # shape -> [window start, messages seen]
+        self._seen: Dict[str, List] = {}
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _sweep(self, now: float):
+        """Forgets the shapes whose window has expired. Requires self._lock."""
+        if now - self._last_sweep < self.window:
+            return
+        self._last_sweep = now
+        for key in [key for key, (start, _) in self._seen.items() if now - start >= self.window]:
+            del self._seen[key]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.WARNING or self.max_count <= 0:
+            return True
+        message = record.getMessage()
+        key = self._variable.sub("#", message)
+        now = time.monotonic()
+        with self._lock:
+            # Looked up before the sweep, which would forget the count to report
+            seen = self._seen.get(key)
+            self._sweep(now)
+            if seen is None or now - seen[0] >= self.window:
+                dropped = seen[1] - self.max_count if seen is not None else 0
+                self._seen[key] = [now, 1]
+                if dropped > 0:
+                    record.msg = f"{message} (suppressed {dropped} similar messages in the last {self.window:g}s)"
+                    record.args = None
+                return True
+            seen[1] += 1
+            return seen[1] <= self.max_count
+
+
+def _formatter() -> logging.Formatter:
+    if LOG_FORMAT == "json":
+        return JSONFormatter()
+    return logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+
+def _handlers() -> List[logging.Handler]:
+    formatter = _formatter()
+
     # Console handler
     console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
+    console_handler.setLevel(LOG_CONSOLE_LEVEL)
     console_handler.setFormatter(formatter)
-    
+
     # File handler with rotation (10MB max size, keep 10 backup files)
     file_handler = RotatingFileHandler(
-        logs_dir / "champitech.log", 
+        logs_dir / "champitech.log",
         maxBytes=10*1024*1024,  # 10MB
         backupCount=10
     )
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(formatter)
-    
+
     # Error file handler for errors only
     error_handler = RotatingFileHandler(
         logs_dir / "errors.log",
@@ -40,13 +126,73 @@ def setup_logger(name="champitech"):
     )
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(formatter)
-    
-    # Add handlers to logger
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
-    logger.addHandler(error_handler)
-    
+    return [console_handler, file_handler, error_handler]
+
+
+class _QueueHandler(QueueHandler):
+    """
+    QueueHandler.prepare() drops exc_info before the record is queued; format
+    the traceback into exc_text first so the listener's formatters (including
+    the JSON one) still get it.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+        record.message = message
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+_exception_formatter = logging.Formatter()
+listener: Optional[QueueListener] = None
+
+
+# Configure the logger
+def setup_logger(name="champitech"):
+    """
+    The logger only puts records on an in-memory queue; a QueueListener thread
+    does the console and file I/O, so a slow logs volume does not block the
+    event loop. Call cerrar() on shutdown to flush what is still queued.
+    """
+    global listener
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(RepeatLimiter())
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, *_handlers(), respect_handler_level=True)
+    listener.start()
     return logger
 
+
+def cerrar():
+    """
+    Stops the listener after writing every queued record. Later records are
+    written directly by the handlers, so nothing logged during shutdown is lost.
+    """
+    global listener
+    if listener is None:
+        return
+    listener.stop()
+    for handler in list(logger.handlers):
+        if isinstance(handler, QueueHandler):
+            logger.removeHandler(handler)
+            for log_filter in handler.filters:
+                logger.addFilter(log_filter)
+    for handler in listener.handlers:
+        logger.addHandler(handler)
+    listener = None
+
+
 # Create the default logger instance
-logger = setup_logger()
\ No newline at end of file
+logger = setup_logger()
+# Scripts (bbdd.importar, services.duplicados...) also flush on exit
+atexit.register(cerrar)
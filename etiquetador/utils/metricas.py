@@ -0,0 +1,151 @@
+'''Métricas en memoria del proceso, exportadas en el formato de texto de Prometheus'''
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+Etiquetas = Tuple[str, ...]
+
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BUCKETS_BYTES = tuple(float(2 ** n) for n in range(8, 31, 2))  # de 256B a 1GB
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatear(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) and not valor.is_integer() else str(int(valor))
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Etiquetas = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._lock = threading.Lock()
+        _registro.append(self)
+
+    def _etiquetas(self, valores: Etiquetas, extra: str = "") -> str:
+        pares = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(self.etiquetas, valores)]
+        if extra:
+            pares.append(extra)
+        return "{" + ",".join(pares) + "}" if pares else ""
+
+    def _muestras(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def exportar(self) -> Iterator[str]:
+        yield f"# HELP {self.nombre} {self.ayuda}"
+        yield f"# TYPE {self.nombre} {self.tipo}"
+        with self._lock:
+            yield from list(self._muestras())
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Etiquetas = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores: Dict[Etiquetas, float] = {}
+
+    def inc(self, *valores: str, cantidad: float = 1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def _muestras(self) -> Iterator[str]:
+        for valores, total in self._valores.items():
+            yield f"{self.nombre}{self._etiquetas(valores)} {_formatear(total)}"
+
+
+class Indicador(_Metrica):
+    tipo = "gauge"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Etiquetas = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores: Dict[Etiquetas, float] = {}
+
+    def inc(self, *valores: str, cantidad: float = 1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def dec(self, *valores: str, cantidad: float = 1):
+        self.inc(*valores, cantidad=-cantidad)
+
+    def _muestras(self) -> Iterator[str]:
+        for valores, total in self._valores.items():
+            yield f"{self.nombre}{self._etiquetas(valores)} {_formatear(total)}"
+
+
+class Histograma(_Metrica):
+    """
+    Histograma acumulado al estilo de Prometheus. Cada observación solo hace una
+    búsqueda binaria en los límites e incrementa un contador.
+    """
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Etiquetas = (), buckets: Tuple[float, ...] = BUCKETS_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = buckets
+        # Por etiquetas: [contadores por bucket (el último es +Inf), suma]
+        self._series: Dict[Etiquetas, Tuple[List[int], List[float]]] = {}
+
+    def observar(self, valor: float, *valores: str):
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = ([0] * (len(self.buckets) + 1), [0.0])
+            serie[0][bisect_left(self.buckets, valor)] += 1
+            serie[1][0] += valor
+
+    def _muestras(self) -> Iterator[str]:
+        for valores, (contadores, suma) in self._series.items():
+            acumulado = 0
+            for limite, contador in zip(self.buckets + (float("inf"),), contadores):
+                acumulado += contador
+                le = 'le="%s"' % _formatear(limite)
+                yield f"{self.nombre}_bucket{self._etiquetas(valores, le)} {acumulado}"
+            yield f"{self.nombre}_sum{self._etiquetas(valores)} {suma[0]!r}"
+            yield f"{self.nombre}_count{self._etiquetas(valores)} {acumulado}"
+
+
+_registro: List[_Metrica] = []
+
+PETICIONES = Contador("etiquetador_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status"))
+EN_CURSO = Indicador("etiquetador_requests_in_progress", "Peticiones HTTP en curso")
+LATENCIA = Histograma("etiquetador_request_duration_seconds", "Latencia de las peticiones HTTP", ("method", "route"))
+TAMANO_PETICION = Histograma(
+    "etiquetador_request_size_bytes", "Tamaño del cuerpo de las peticiones", ("method", "route"), BUCKETS_BYTES
+)
+TAMANO_RESPUESTA = Histograma(
+    "etiquetador_response_size_bytes", "Tamaño del cuerpo de las respuestas", ("method", "route"), BUCKETS_BYTES
+)
+SPANS = Histograma("etiquetador_span_duration_seconds", "Duración de las fases internas con nombre", ("span",))
+
+
+def observar_span(nombre: str, segundos: float):
+    """Registra la duración de una fase medida en otro sitio (p. ej. en el pool de imágenes)."""
+    SPANS.observar(segundos, nombre)
+
+
+@contextmanager
+def span(nombre: str) -> Iterator[None]:
+    """Mide la duración del bloque y la registra como la fase `nombre`."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPANS.observar(time.perf_counter() - inicio, nombre)
+
+
+def exportar() -> str:
+    """Todas las métricas en el formato de exposición de texto de Prometheus."""
+    lineas: List[str] = []
+    for metrica in _registro:
+        lineas.extend(metrica.exportar())
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,95 @@
+import io
+import os
+import zipfile
+from typing import Iterable, Iterator, Tuple, Union
+
+# Formatos que ya van comprimidos: deflate solo gasta CPU sin reducir tamaño
+EXTENSIONES_COMPRIMIDAS = (".webp", ".jpg", ".jpeg", ".png", ".zip", ".xlsx")
+
+CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Una entrada es (nombre en el ZIP, origen). El origen puede ser la ruta de un
+# fichero o directorio o los bytes del contenido.
+Origen = Union[str, bytes]
+Entrada = Tuple[str, Origen]
+
+
+class _Salida(io.RawIOBase):
+    """
+    Destino no posicionable para ZipFile: acumula lo escrito hasta que el
+    generador lo recoge. Al no admitir seek, zipfile usa descriptores de datos
+    y nunca vuelve atrás sobre lo ya enviado.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def write(self, b):
+        self._buffer += b
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def vaciar(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _compresion(nombre: str) -> int:
+    if nombre.lower().endswith(EXTENSIONES_COMPRIMIDAS):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def zip_streaming(entradas: Iterable[Entrada], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Genera un ZIP por trozos a medida que se leen las entradas, con memoria
+    acotada a un chunk por fichero. Es un generador síncrono: StreamingResponse
+    lo itera en el threadpool, así que la lectura y compresión no bloquean el
+    event loop.
+    """
+    salida = _Salida()
+    with zipfile.ZipFile(salida, "w") as zipf:
+        for arcname, origen in entradas:
+            if isinstance(origen, str):
+                zinfo = zipfile.ZipInfo.from_file(origen, arcname)
+                if zinfo.is_dir():
+                    zipf.writestr(zinfo, b"")
+                else:
+                    zinfo.compress_type = _compresion(arcname)
+                    with open(origen, "rb") as src, zipf.open(zinfo, "w") as dst:
+                        while chunk := src.read(chunk_size):
+                            dst.write(chunk)
+                            if pendiente := salida.vaciar():
+                                yield pendiente
+            else:
+                zipf.writestr(arcname, origen, compress_type=_compresion(arcname))
+            if pendiente := salida.vaciar():
+                yield pendiente
+    yield salida.vaciar()
+
+
+def entradas_directorio(directorio: str, prefijo: str = "") -> Iterator[Entrada]:
+    """Recorre un directorio y devuelve sus ficheros (y directorios vacíos) como entradas."""
+    for root, dirs, files in os.walk(directorio):
+        if "__pycache__" in root:
+            continue
+        if not files and not dirs:
+            arc_root = os.path.relpath(root, directorio)
+            if arc_root != ".":
+                yield os.path.join(prefijo, arc_root), root
+        for file in files:
+            if file.endswith(".pyc"):
+                continue
+            file_path = os.path.join(root, file)
+            yield os.path.join(prefijo, os.path.relpath(file_path, directorio)), file_path
@@ -3,34 +3,44 @@ import { Link } from 'react-router-dom';
 import { API_URL_BASE } from '@/lib/utils'
 import { fetcher } from '@/lib/fetcher';
 import useSWR from "swr"
+import useSWRInfinite from "swr/infinite"
+
+const PAGE_SIZE = 24;
 
 export function HistoryList() {
 
-    const { data, error, isLoading } = useSWR(`${API_URL_BASE}/images`, fetcher)
     const [selectedSala, setSelectedSala] = useState(null);
+    const { data: salas } = useSWR(`${API_URL_BASE}/images/salas/`, fetcher)
 
+    // Paginación por cursor: cada página pide la siguiente a partir de nextCursor
+    const getKey = (pageIndex, previousPage) => {
+        if (previousPage && !previousPage.nextCursor) return null;
+        const params = new URLSearchParams({ limit: PAGE_SIZE, vista: "resumen" });
+        if (selectedSala) params.set("sala", selectedSala);
+        if (previousPage) params.set("cursor", previousPage.nextCursor);
+        return `${API_URL_BASE}/images/?${params}`;
+    };
+    const { data, error, isLoading, size, setSize, isValidating } = useSWRInfinite(getKey, fetcher, {
+        revalidateAll: false,
+    })
 
     const salasArray = useMemo(() => {
-        if (!data) return [];
-        const salasUnicas = [...new Set(data.map(record => record.sala))];
+        if (!salas) return [];
+        const salasUnicas = [...salas];
         salasUnicas.sort((a, b) => a - b);
         return salasUnicas.map(sala => ({
             value: sala.toString(),
             label: `Sala ${sala}`
         }));
-    }, [data]);
+    }, [salas]);
 
     if (error) return <div>Se ha producido un error cargando los registros</div>
     if (isLoading) return <div>Cargando registros...</div>
-    if (!data || data.length === 0) return <div>No se han encontrado registros</div>
-
-    const dataSorted = data.sort((a, b) => new Date(b.fecha || 0) - new Date(a.fecha || 0));
-
-    const filteredData = selectedSala
-        ? dataSorted.filter(record => record.sala.toString() === selectedSala)
-        : dataSorted;
 
+    const filteredData = data ? data.flatMap(page => page.items) : [];
+    const hasMore = data && data[data.length - 1]?.nextCursor;
 
+    if (filteredData.length === 0 && !selectedSala) return <div>No se han encontrado registros</div>
 
     return (
         <>
@@ -42,7 +52,7 @@ export function HistoryList() {
                 <span
                     key={"all-salas"}
                     className="block bg-gray-100 hover:bg-gray-200 text-gray-800 font-semibold text-center rounded-lg shadow p-4 transition-colors"
-                    onClick={() => setSelectedSala(selectedSala ? null : "all")}
+                    onClick={() => setSelectedSala(null)}
                 >
                     Todas las salas
                 </span>
@@ -65,6 +75,14 @@ export function HistoryList() {
                         to={`/champitech/historial/${record.id}`}
                         className="block bg-gray-50 rounded-lg shadow hover:shadow-md transition-shadow overflow-hidden"
                     >
+                        {record.thumbnails?.thumb && (
+                            <img
+                                src={`${API_URL_BASE}${record.thumbnails.thumb}`}
+                                alt={`Sala ${record.sala}, Muestra ${record.muestra}`}
+                                className="w-full h-40 object-cover"
+                                loading="lazy"
+                            />
+                        )}
                         <div className="p-4">
                             <div className="flex justify-between items-start mb-2">
                                 <h3 className="font-semibold">Sala {record.sala}, Muestra {record.muestra}</h3>
@@ -92,6 +110,17 @@ export function HistoryList() {
                     </Link>
                 ))}
             </div>
+            {hasMore && (
+                <div className="flex justify-center mt-6">
+                    <button
+                        className="text-sm bg-blue-500 py-3 px-5 text-white rounded-lg disabled:opacity-50"
+                        disabled={isValidating}
+                        onClick={() => setSize(size + 1)}
+                    >
+                        {isValidating ? "Cargando..." : "Cargar más"}
+                    </button>
+                </div>
+            )}
         </>
     )
 }
\ No newline at end of file